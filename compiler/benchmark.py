@@ -0,0 +1,263 @@
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from compiler import Compiler
+from lexer import Lexer
+from optimizer import Optimizer
+from parser import Parser
+from program_output import ProgramOutput
+from semantic import SemanticAnalyzer
+from symbol_table import SymbolTable
+
+
+# searches that end with a break, and a switch that breaks out of every case, on every iteration
+BREAKS_PROGRAM = """
+int i;
+int k;
+int hits = 0;
+for (i = 0; i < 20000; i = i + 1) {
+    k = 0;
+    while (true) {
+        k = k + 1;
+        if (k > i % 5) {
+            break;
+        }
+    }
+    switch (i % 3) {
+        case 0: hits = hits + k; break;
+        case 1: hits = hits + 2; break;
+        default: break;
+    }
+}
+print(to_string(hits));
+"""
+
+# a print on every iteration, which is mostly the writing of the output
+PRINTS_PROGRAM = """
+int i;
+for (i = 0; i < 200000; i = i + 1) {
+    print(to_string(i));
+    print(" ");
+    if (i % 10 == 9) {
+        print("\\n");
+    }
+}
+"""
+
+# arrays, a switch and bool logic on every iteration
+LOOP_PROGRAM = """
+int a[10];
+int i;
+int k;
+bool odd = false;
+int count = 0;
+for (i = 0; i < 300000; i = i + 1) {
+    k = i % 10;
+    a[k] = a[k] + i % 7;
+    odd = !odd;
+    if (odd && a[k] > 3 || k == 0) {
+        count = count + 1;
+    }
+    switch (k % 3) {
+        case 0: count = count + a[k] % 2; break;
+        case 1: count = count - 1; break;
+        default: count = count + 2;
+    }
+}
+print(to_string(count));
+"""
+
+# the programs run by the options instead of a file
+PROGRAMS = {
+    "--breaks": BREAKS_PROGRAM,
+    "--prints": PRINTS_PROGRAM,
+    "--loop": LOOP_PROGRAM,
+}
+
+
+def large_program(blocks: int) -> str:
+    """A program of 6 top-level statements for every block, each block with its own variables."""
+    parts = []
+    for k in range(blocks):
+        parts.append(f"""int a{k}[4];
+int i{k};
+bool b{k} = false;
+for (i{k} = 0; i{k} < 4; i{k} = i{k} + 1) {{
+    a{k}[i{k}] = i{k} * {k};
+    b{k} = b{k} || a{k}[i{k}] > 7 && !(i{k} == 2);
+}}
+switch (a{k}[3] % 3) {{
+    case 0: print("0"); break;
+    default: print(to_string(a{k}[1]));
+}}
+print(to_string(b{k}));
+""")
+    return "".join(parts)
+
+
+# the blocks of the program of --memory, 20k statements
+MEMORY_BLOCKS = 3400
+
+# the programs of --depth by the depth: long chains of an operator and deep nestings, which are deep trees
+# unless the chain is made one node
+DEPTH_PROGRAMS = {
+    "a + a + ...": lambda depth: "int a = 1;\nint s = " + " + ".join(["a"] * depth) + ";\nprint(to_string(s));\n",
+    "a - a - ...": lambda depth: "int a = 1;\nint s = " + " - ".join(["a"] * depth) + ";\nprint(to_string(s));\n",
+    "a < 2 && ...": lambda depth: "int a = 1;\nbool b = " + " && ".join(["a < 2"] * depth) +
+                                  ";\nprint(to_string(b));\n",
+    "((...a...))": lambda depth: "int a = 1;\nint s = " + "(" * depth + "a" + ")" * depth + ";\nprint(to_string(s));\n",
+    "nested if {}": lambda depth: "int a = 1;\nint s = 0;\n" + "if (a > 0) {\n" * depth + "s = s + 1;\n" +
+                                  "}\n" * depth + "print(to_string(s));\n",
+}
+
+DEPTHS = (10 ** 4, 10 ** 5)
+
+
+def time_engine(program_name: str, engine: str, repeat: int) -> float:
+    """The best time of running the program with the engine, in seconds. The program is compiled once,
+    the time of building the engine (and of compiling the tree into closures) is counted."""
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        c = Compiler(program_name, engine=engine)
+        c.do_lexical_analysis()
+        c.do_syntax_analysis()
+        c.do_semantic_analysis()
+        c.do_optimization()
+
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            c.run_program()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+
+    return best
+
+
+def time_depth(program_name: str, repeat: int) -> dict:
+    """The times of parsing and checking the program, and the best times of running it with every engine, in
+    seconds. The tree is not printed: its lines are indented by their depth, so printing a deep tree takes
+    longer than anything else."""
+    times = {}
+    identifiers, keywords, operators, constants = SymbolTable(), SymbolTable(), SymbolTable(), SymbolTable()
+
+    start = time.perf_counter()
+    tokens = Lexer(program_name, identifiers, keywords, operators, constants).split_program_into_tokens()
+    parser = Parser(tokens, operators, identifiers, keywords, constants)
+    parser.create_syntax_tree()
+    times["parse"] = time.perf_counter() - start
+
+    tables = (parser.get_parser_nodes(), operators, identifiers, keywords, constants, parser.get_syntax_tree())
+    start = time.perf_counter()
+    SemanticAnalyzer(*tables).check_for_semantic_errors()
+    Optimizer(*tables).optimize()
+    times["check"] = time.perf_counter() - start
+
+    for engine, engine_class in Compiler.ENGINES.items():
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            engine_class(*tables, output=ProgramOutput.in_memory()).run_program()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        times[engine] = best
+
+    return times
+
+
+def compare_depths(repeat: int):
+    for name, program in DEPTH_PROGRAMS.items():
+        for depth in DEPTHS:
+            fd, program_name = tempfile.mkstemp(suffix=".cpm")
+            try:
+                with os.fdopen(fd, "w") as f:
+                    f.write(program(depth))
+                times = time_depth(program_name, repeat)
+            finally:
+                os.remove(program_name)
+
+            phases = ", ".join(f"{phase} {elapsed:.3f}s" for phase, elapsed in times.items())
+            print(f"{name:>14} ({depth:.0e}): {phases}")
+
+
+def parse(program_name: str) -> tuple:
+    """The parser after parsing the program, which keeps the tokens and the tree alive, and the tables of the
+    analysis after it."""
+    identifiers, keywords, operators, constants = SymbolTable(), SymbolTable(), SymbolTable(), SymbolTable()
+    tokens = Lexer(program_name, identifiers, keywords, operators, constants).split_program_into_tokens()
+    parser = Parser(tokens, operators, identifiers, keywords, constants)
+    parser.create_syntax_tree()
+    return parser, (parser.get_parser_nodes(), operators, identifiers, keywords, constants, parser.get_syntax_tree())
+
+
+def measure_memory():
+    """The memory held after parsing a large program and the peak while parsing it, then the times of parsing
+    and checking it, measured again without tracemalloc, which slows the allocations down."""
+    fd, program_name = tempfile.mkstemp(suffix=".cpm")
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(large_program(MEMORY_BLOCKS))
+        size = os.path.getsize(program_name)
+
+        tracemalloc.start()
+        parser, tables = parse(program_name)
+        held, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        del parser, tables
+
+        start = time.perf_counter()
+        _, tables = parse(program_name)
+        parse_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        SemanticAnalyzer(*tables).check_for_semantic_errors()
+        check_time = time.perf_counter() - start
+    finally:
+        os.remove(program_name)
+
+    print(f"{MEMORY_BLOCKS * 6} statements, {size / 2 ** 20:.1f} MB")
+    print(f"held after parsing: {held / 2 ** 20:.1f} MB, peak while parsing: {peak / 2 ** 20:.1f} MB")
+    print(f"parse {parse_time:.2f}s, semantic {check_time:.2f}s")
+
+
+def compare_engines(program_name: str, repeat: int):
+    times = {engine: time_engine(program_name, engine, repeat) for engine in Compiler.ENGINES}
+    base = times["tree"]
+    for engine, elapsed in times.items():
+        print(f"{engine:>10}: {elapsed:.4f}s ({base / elapsed:.2f}x)")
+
+
+def main():
+    if len(sys.argv) < 2:
+        print(f"usage: {sys.argv[0]} program|{'|'.join(PROGRAMS)}|--depth|--memory [repeat]")
+        exit(1)
+
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+
+    if sys.argv[1] == "--depth":
+        compare_depths(repeat)
+        return
+    if sys.argv[1] == "--memory":
+        measure_memory()
+        return
+
+    if sys.argv[1] not in PROGRAMS:
+        compare_engines(sys.argv[1], repeat)
+        return
+
+    fd, program_name = tempfile.mkstemp(suffix=".cpm")
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(PROGRAMS[sys.argv[1]])
+        compare_engines(program_name, repeat)
+    finally:
+        os.remove(program_name)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,310 @@
+import marshal
+from array import array
+
+from flat_array import FlatArray
+from interpreter import Interpreter
+from program_input import ProgramInput
+from program_output import ProgramOutput
+
+
+class Opcode:
+    """The operations of the virtual machine. An instruction is four ints: the opcode and the operands a, b, c.
+    The operands are numbers of registers, or of instructions for the jumps, or of jump tables."""
+
+    (MOVE,
+     ADD, SUB, MUL, DIV, MOD,
+     LT, LE, GT, GE, EQ, NE,
+     NEG, NOT,
+     JUMP, JUMP_IF_FALSE, JUMP_IF_TRUE,
+     # jump to c unless r[a] op r[b]: a comparison and the conditional jump of a loop or an if
+     JUMP_UNLESS_LT, JUMP_UNLESS_LE, JUMP_UNLESS_GT, JUMP_UNLESS_GE, JUMP_UNLESS_EQ, JUMP_UNLESS_NE,
+     INDEX, INDEX_IN_BOUNDS, ELEMENT, STORE_INDEX, STORE_INDEX_IN_BOUNDS, SET_CHAR, NEW_ARRAY,
+     CHECK_INDEX, CHECK_ELEMENT, STORE_FLAT, NEW_FLAT_ARRAY,
+     JOIN_CHARS, STRING_ELEMENT,
+     TO_STRING, ATOI, ATOF, ATOB, SCAN, SCAN_WORD, SCAN_TOKEN, PRINT,
+     SWITCH,
+     UNKNOWN,
+     COUNT) = range(47)
+
+    # what the operands are: r a register, j an instruction, t a jump table, - not used
+    OPERANDS = {
+        MOVE: "rr-",
+        ADD: "rrr", SUB: "rrr", MUL: "rrr", DIV: "rrr", MOD: "rrr",
+        LT: "rrr", LE: "rrr", GT: "rrr", GE: "rrr", EQ: "rrr", NE: "rrr",
+        NEG: "rr-", NOT: "rr-",
+        JUMP: "j--", JUMP_IF_FALSE: "rj-", JUMP_IF_TRUE: "rj-",
+        JUMP_UNLESS_LT: "rrj", JUMP_UNLESS_LE: "rrj", JUMP_UNLESS_GT: "rrj",
+        JUMP_UNLESS_GE: "rrj", JUMP_UNLESS_EQ: "rrj", JUMP_UNLESS_NE: "rrj",
+        # r[a] = r[b][r[c]], the checked ones fail with "array index out of range"
+        INDEX: "rrr", INDEX_IN_BOUNDS: "rrr",
+        # an element of the array that is assigned to, fails with "index out of range"
+        ELEMENT: "rrr",
+        # r[a][r[b]] = r[c]
+        STORE_INDEX: "rrr", STORE_INDEX_IN_BOUNDS: "rrr",
+        # the character r[b] of the string r[a] is replaced with r[c], r[a] is made a list of its characters
+        SET_CHAR: "rrr",
+        # r[a] is a new array with the sizes r[b] and the elements r[c]
+        NEW_ARRAY: "rrr",
+        # r[a] = r[b] taken as an index of a list of the size r[c], the index into a flat buffer. CHECK_INDEX
+        # fails with "array index out of range", CHECK_ELEMENT with "index out of range"
+        CHECK_INDEX: "rrr", CHECK_ELEMENT: "rrr",
+        # r[a][r[b]] = r[c] for the flat buffer r[a], which is replaced if it cannot keep the value
+        STORE_FLAT: "rrr",
+        # r[a] is a new flat buffer with the element type and the sizes r[b] and the elements r[c]
+        NEW_FLAT_ARRAY: "rrr",
+        # r[a], a string written by characters, is made a string again if it is a list of them
+        JOIN_CHARS: "r--",
+        # r[a] = r[b][r[c]] for an array of strings written by characters, the element is made a string again in
+        # the array. Fails with "array index out of range"
+        STRING_ELEMENT: "rrr",
+        TO_STRING: "rr-", ATOI: "rr-", ATOF: "rr-", ATOB: "rr-",
+        # r[a] is the next line, the next word, the bytes of the next word
+        SCAN: "r--", SCAN_WORD: "r--", SCAN_TOKEN: "r--",
+        PRINT: "r--",
+        # jump by the value of r[a] through the table b
+        SWITCH: "rt-",
+        UNKNOWN: "---",
+    }
+
+    NAMES = {value: name for name, value in vars().items() if isinstance(value, int) and name != "COUNT"}
+
+
+class Bytecode:
+    """A compiled program: the instructions, the positions in the program they come from, the constants and
+    the jump tables of the switches. It does not refer to the syntax tree, and it can be stored as bytes.
+
+    The registers are the constants, then the variables, then the temporary values. The constants are in the
+    registers from the start, so the instructions take them as operands.
+    """
+
+    # changed when the encoding changes, so stored programs of another version are not loaded
+    VERSION = 4
+
+    def __init__(self, code: array, lines: array, columns: array, constants: list, num_registers: int,
+                 switch_tables: list, register_names: list):
+        self.code = code
+        # the position of every instruction in the program, for the runtime errors
+        self.lines = lines
+        self.columns = columns
+        self.constants = constants
+        self.num_registers = num_registers
+        # (the number of the instruction by the value, the instruction for the other values) of every switch
+        self.switch_tables = switch_tables
+        # the names of the variables and the temporary values, for the disassembler
+        self.register_names = register_names
+
+    def dumps(self) -> bytes:
+        return marshal.dumps((
+            Bytecode.VERSION,
+            self.code.tobytes(), self.lines.tobytes(), self.columns.tobytes(),
+            tuple(self.constants), self.num_registers,
+            tuple(self.switch_tables), tuple(self.register_names),
+        ))
+
+    @staticmethod
+    def loads(data: bytes) -> "Bytecode":
+        version, code, lines, columns, constants, num_registers, switch_tables, register_names = marshal.loads(data)
+        if version != Bytecode.VERSION:
+            raise ValueError(f"bytecode version {version} is not supported")
+
+        def ints(raw: bytes) -> array:
+            ret = array('i')
+            ret.frombytes(raw)
+            return ret
+
+        return Bytecode(ints(code), ints(lines), ints(columns), list(constants), num_registers,
+                        list(switch_tables), list(register_names))
+
+    def _register_name(self, register: int) -> str:
+        if register < len(self.constants):
+            return repr(self.constants[register])
+        return f"r{register}({self.register_names[register - len(self.constants)]})"
+
+    def disassemble(self) -> str:
+        lines = []
+        for i in range(len(self.code) // 4):
+            op, *operands = self.code[4 * i:4 * i + 4]
+
+            shown = []
+            for kind, operand in zip(Opcode.OPERANDS[op], operands):
+                if kind == 'r':
+                    shown.append(self._register_name(operand))
+                elif kind == 'j':
+                    shown.append(f"-> {operand}")
+                elif kind == 't':
+                    cases, default = self.switch_tables[operand]
+                    targets = ", ".join(f"{case!r}: {target}" for case, target in cases.items())
+                    shown.append(f"{{{targets}}} else {default}")
+
+            lines.append(f"{i:5}  {self.lines[i]:4}:{self.columns[i]:<4} "
+                         f"{Opcode.NAMES[op]:<22}{', '.join(shown)}")
+        return "\n".join(lines)
+
+    @staticmethod
+    def _new_array(sizes: tuple, default_value):
+        if len(sizes) == 1:
+            return [default_value] * sizes[0]
+        return [Bytecode._new_array(sizes[1:], default_value) for _ in range(sizes[0])]
+
+    def _error(self, message: str, i: int):
+        return Interpreter.RuntimeError(message, self.lines[i], self.columns[i])
+
+    def run(self, output: ProgramOutput, input_: ProgramInput):
+        code = self.code
+        instructions = [tuple(code[i:i + 4]) for i in range(0, len(code), 4)]
+        switch_tables = self.switch_tables
+        regs = list(self.constants) + [None] * (self.num_registers - len(self.constants))
+        end = len(instructions)
+        write = output.write
+        read_line, read_word, read_token = input_.read_line, input_.read_word, input_.read_token
+
+        (MOVE, ADD, SUB, MUL, DIV, MOD, LT, LE, GT, GE, EQ, NE, NEG, NOT, JUMP, JUMP_IF_FALSE, JUMP_IF_TRUE,
+         JUMP_UNLESS_LT, JUMP_UNLESS_LE, JUMP_UNLESS_GT, JUMP_UNLESS_GE, JUMP_UNLESS_EQ, JUMP_UNLESS_NE,
+         INDEX, INDEX_IN_BOUNDS, ELEMENT, STORE_INDEX, STORE_INDEX_IN_BOUNDS, SET_CHAR, NEW_ARRAY,
+         CHECK_INDEX, CHECK_ELEMENT, STORE_FLAT, NEW_FLAT_ARRAY, JOIN_CHARS, STRING_ELEMENT,
+         TO_STRING, ATOI, ATOF, ATOB, SCAN, SCAN_WORD, SCAN_TOKEN, PRINT, SWITCH, UNKNOWN) = range(Opcode.COUNT)
+
+        # the most frequent instructions are tested first
+        pc = 0
+        while pc < end:
+            op, a, b, c = instructions[pc]
+            pc += 1
+
+            if op == MOVE:
+                regs[a] = regs[b]
+            elif op == ADD:
+                regs[a] = regs[b] + regs[c]
+            elif op == JUMP_UNLESS_LT:
+                if not regs[a] < regs[b]:
+                    pc = c
+            elif op == INDEX_IN_BOUNDS:
+                regs[a] = regs[b][regs[c]]
+            elif op == JUMP:
+                pc = a
+            elif op == SUB:
+                regs[a] = regs[b] - regs[c]
+            elif op == MUL:
+                regs[a] = regs[b] * regs[c]
+            elif op == JUMP_IF_FALSE:
+                if not regs[a]:
+                    pc = b
+            elif op == STORE_INDEX_IN_BOUNDS:
+                regs[a][regs[b]] = regs[c]
+            elif op == CHECK_INDEX:
+                idx = regs[b]
+                if idx < 0:
+                    idx += regs[c]
+                if not 0 <= idx < regs[c]:
+                    raise self._error("array index out of range", pc - 1)
+                regs[a] = idx
+            elif op == STORE_FLAT:
+                regs[a] = FlatArray.store(regs[a], regs[b], regs[c])
+            elif op == INDEX:
+                try:
+                    regs[a] = regs[b][regs[c]]
+                except IndexError:
+                    raise self._error("array index out of range", pc - 1)
+            elif op == STORE_INDEX:
+                try:
+                    regs[a][regs[b]] = regs[c]
+                except IndexError:
+                    raise self._error("index out of range", pc - 1)
+            elif op == JUMP_UNLESS_LE:
+                if not regs[a] <= regs[b]:
+                    pc = c
+            elif op == JUMP_UNLESS_GT:
+                if not regs[a] > regs[b]:
+                    pc = c
+            elif op == JUMP_UNLESS_GE:
+                if not regs[a] >= regs[b]:
+                    pc = c
+            elif op == JUMP_UNLESS_EQ:
+                if not regs[a] == regs[b]:
+                    pc = c
+            elif op == JUMP_UNLESS_NE:
+                if not regs[a] != regs[b]:
+                    pc = c
+            elif op == MOD:
+                regs[a] = regs[b] % regs[c]
+            elif op == DIV:
+                regs[a] = regs[b] / regs[c]
+            elif op == LT:
+                regs[a] = regs[b] < regs[c]
+            elif op == LE:
+                regs[a] = regs[b] <= regs[c]
+            elif op == GT:
+                regs[a] = regs[b] > regs[c]
+            elif op == GE:
+                regs[a] = regs[b] >= regs[c]
+            elif op == EQ:
+                regs[a] = regs[b] == regs[c]
+            elif op == NE:
+                regs[a] = regs[b] != regs[c]
+            elif op == JUMP_IF_TRUE:
+                if regs[a]:
+                    pc = b
+            elif op == NOT:
+                regs[a] = not regs[b]
+            elif op == NEG:
+                regs[a] = -regs[b]
+            elif op == CHECK_ELEMENT:
+                idx = regs[b]
+                if idx < 0:
+                    idx += regs[c]
+                if not 0 <= idx < regs[c]:
+                    raise self._error("index out of range", pc - 1)
+                regs[a] = idx
+            elif op == ELEMENT:
+                try:
+                    regs[a] = regs[b][regs[c]]
+                except IndexError:
+                    raise self._error("index out of range", pc - 1)
+            elif op == SET_CHAR:
+                regs[a] = Interpreter._set_char(regs[a], regs[b], regs[c])
+            elif op == JOIN_CHARS:
+                if regs[a].__class__ is list:
+                    regs[a] = "".join(regs[a])
+            elif op == STRING_ELEMENT:
+                strings = regs[b]
+                try:
+                    value = strings[regs[c]]
+                except IndexError:
+                    raise self._error("array index out of range", pc - 1)
+                if value.__class__ is list:
+                    value = strings[regs[c]] = "".join(value)
+                regs[a] = value
+            elif op == PRINT:
+                write(regs[a])
+            elif op == SWITCH:
+                cases, default = switch_tables[b]
+                pc = cases.get(regs[a], default)
+            elif op == TO_STRING:
+                regs[a] = Interpreter._to_string(regs[b])
+            elif op == SCAN:
+                regs[a] = read_line()
+            elif op == SCAN_WORD:
+                regs[a] = read_word()
+            elif op == SCAN_TOKEN:
+                regs[a] = read_token()
+            elif op == ATOI:
+                try:
+                    regs[a] = int(regs[b])
+                except ValueError:
+                    raise self._error("input is not convertible to int", pc - 1)
+            elif op == ATOF:
+                try:
+                    regs[a] = float(regs[b])
+                except ValueError:
+                    raise self._error("input is not convertible to double", pc - 1)
+            elif op == ATOB:
+                try:
+                    regs[a] = bool(regs[b])
+                except ValueError:
+                    raise self._error("input is not convertible to bool", pc - 1)
+            elif op == NEW_ARRAY:
+                regs[a] = Bytecode._new_array(regs[b], regs[c])
+            elif op == NEW_FLAT_ARRAY:
+                elem_type, sizes = regs[b]
+                regs[a] = FlatArray.new(elem_type, sizes, regs[c])
+            else:
+                raise self._error("unknown node", pc - 1)
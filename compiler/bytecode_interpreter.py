@@ -0,0 +1,576 @@
+from array import array
+from typing import Optional
+
+from interpreter import Interpreter
+from bytecode import Opcode, Bytecode
+from parser import Parser
+from node_kind import NodeKind
+from program_output import ProgramOutput
+from symbol_table import SymbolTable
+
+
+class BytecodeInterpreter(Interpreter):
+    """Compiles the tree into the instructions of a register machine, see Bytecode, and runs them.
+
+    Every variable and every constant has a register, the values of the expressions are in temporary registers
+    that are reused when a statement is done. The loops, the ifs, the breaks and the switches are jumps.
+
+    The compiler calls itself for the inner nodes, so a program deeper than the recursion limit is run by
+    the methods of Interpreter, which do not use recursion.
+    """
+
+    class _TooDeep(Exception):
+        pass
+
+    _MAX_DEPTH = Interpreter._MAX_RECURSIVE_HEIGHT
+
+    # The compiler does not know the number of the constants and the variables until the end, so the registers
+    # are numbered in three ranges while it runs: constants from 0, variables from _VARIABLES, temporaries from
+    # _TEMPS, and the instructions are renumbered in _registers_placed
+    _VARIABLES = 1 << 20
+    _TEMPS = 1 << 21
+
+    _BINARY_OPCODES = {
+        NodeKind.OP_ADD: Opcode.ADD,
+        NodeKind.OP_SUB: Opcode.SUB,
+        NodeKind.OP_MUL: Opcode.MUL,
+        NodeKind.OP_DIV: Opcode.DIV,
+        NodeKind.OP_MOD: Opcode.MOD,
+        NodeKind.OP_LT: Opcode.LT,
+        NodeKind.OP_LE: Opcode.LE,
+        NodeKind.OP_GT: Opcode.GT,
+        NodeKind.OP_GE: Opcode.GE,
+        NodeKind.OP_EQ: Opcode.EQ,
+        NodeKind.OP_NE: Opcode.NE,
+    }
+
+    _JUMPS_UNLESS = {
+        NodeKind.OP_LT: Opcode.JUMP_UNLESS_LT,
+        NodeKind.OP_LE: Opcode.JUMP_UNLESS_LE,
+        NodeKind.OP_GT: Opcode.JUMP_UNLESS_GT,
+        NodeKind.OP_GE: Opcode.JUMP_UNLESS_GE,
+        NodeKind.OP_EQ: Opcode.JUMP_UNLESS_EQ,
+        NodeKind.OP_NE: Opcode.JUMP_UNLESS_NE,
+    }
+
+    _UNARY_OPCODES = {
+        NodeKind.OP_NOT: Opcode.NOT,
+        NodeKind.KW_TO_STRING: Opcode.TO_STRING,
+        NodeKind.KW_ATOI: Opcode.ATOI,
+        NodeKind.KW_ATOF: Opcode.ATOF,
+        NodeKind.KW_ATOB: Opcode.ATOB,
+    }
+
+    def __init__(self, parser_nodes: SymbolTable, operators: SymbolTable, identifiers: SymbolTable,
+                 keywords: SymbolTable, consts: SymbolTable, syntax_tree, flat_arrays: bool = False,
+                 output: Optional[ProgramOutput] = None, output_path: Optional[str] = None):
+        super().__init__(parser_nodes, operators, identifiers, keywords, consts, syntax_tree, flat_arrays, output)
+
+        # if not None, the bytecode is written there before it runs
+        self._output_path = output_path
+
+        # the method that compiles a statement, by the kind of the node
+        self._statement_compilers = [self._compile_unknown] * NodeKind.COUNT
+        for kind, compiler in (
+            (NodeKind.PROGRAM, self._compile_compound_statement),
+            (NodeKind.COMPOUND_STATEMENT, self._compile_compound_statement),
+            (NodeKind.KW_PRINT, self._compile_print),
+            (NodeKind.DECLARE, self._compile_declare),
+            (NodeKind.OP_ASSIGN, self._compile_assignment),
+            (NodeKind.KW_IF, self._compile_if),
+            (NodeKind.KW_WHILE, self._compile_while),
+            (NodeKind.KW_FOR, self._compile_for),
+            (NodeKind.KW_SWITCH, self._compile_switch),
+            (NodeKind.KW_CASE, self._compile_case_or_default),
+            (NodeKind.KW_DEFAULT, self._compile_case_or_default),
+            (NodeKind.KW_BREAK, self._compile_break),
+        ):
+            self._statement_compilers[kind] = compiler
+
+        # the method that compiles an expression, by the kind of the node. It returns the register with the value
+        self._expression_compilers = [self._compile_unknown_expression] * NodeKind.COUNT
+        for kind, compiler in (
+            (NodeKind.INDEXATION, self._compile_indexation),
+            (NodeKind.INDEXATION_IN_BOUNDS, self._compile_indexation),
+            (NodeKind.CONST_STRING, self._compile_constant),
+            (NodeKind.CONST_INT, self._compile_constant),
+            (NodeKind.CONST_DOUBLE, self._compile_constant),
+            (NodeKind.KW_TRUE, self._compile_constant),
+            (NodeKind.KW_FALSE, self._compile_constant),
+            (NodeKind.IDENTIFIER, self._compile_identifier),
+            (NodeKind.KW_TO_STRING, self._compile_unary),
+            (NodeKind.KW_ATOI, self._compile_unary),
+            (NodeKind.KW_ATOF, self._compile_unary),
+            (NodeKind.KW_ATOB, self._compile_unary),
+            (NodeKind.KW_SCAN, self._compile_scan),
+            (NodeKind.KW_SCAN_INT, self._compile_scan),
+            (NodeKind.KW_SCAN_DOUBLE, self._compile_scan),
+            (NodeKind.KW_SCAN_WORD, self._compile_scan),
+            (NodeKind.OP_ADD, self._compile_add),
+            (NodeKind.OP_SUB, self._compile_sub),
+            (NodeKind.OP_MUL, self._compile_chain),
+            (NodeKind.OP_DIV, self._compile_chain),
+            (NodeKind.OP_MOD, self._compile_chain),
+            (NodeKind.OP_AND, self._compile_short_circuit),
+            (NodeKind.OP_OR, self._compile_short_circuit),
+            (NodeKind.OP_NOT, self._compile_unary),
+            (NodeKind.OP_GT, self._compile_chain),
+            (NodeKind.OP_LT, self._compile_chain),
+            (NodeKind.OP_GE, self._compile_chain),
+            (NodeKind.OP_LE, self._compile_chain),
+            (NodeKind.OP_EQ, self._compile_chain),
+            (NodeKind.OP_NE, self._compile_chain),
+        ):
+            self._expression_compilers[kind] = compiler
+
+        self._reset()
+
+    def _reset(self):
+        self._code = array('i')
+        self._lines = array('i')
+        self._columns = array('i')
+        self._constants = []
+        # the register of a constant, by its type and value, so 1, 1.0 and true are different
+        self._constant_registers = {}
+        # the number of the register of a variable, counted from the first variable, by the index in the idents
+        # table. The variables are placed after the constants when the program is compiled
+        self._variable_numbers = {}
+        # the number of the temporary registers in use and the most ever used, counted from the first one
+        self._temps = 0
+        self._max_temps = 0
+        self._switch_tables = []
+        # the instructions to patch with the end of the loops and switches a break leaves, for every one the
+        # compiler is in
+        self._breaks = []
+
+    def _emit(self, op: int, node: Parser.Node, a: int = 0, b: int = 0, c: int = 0) -> int:
+        self._code.extend((op, a, b, c))
+        self._lines.append(node.line or 0)
+        self._columns.append(node.index or 0)
+        return len(self._lines) - 1
+
+    def _here(self) -> int:
+        return len(self._lines)
+
+    def _patch_jump(self, instruction: int, target: int):
+        operands = Opcode.OPERANDS[self._code[4 * instruction]]
+        self._code[4 * instruction + 1 + operands.index('j')] = target
+
+    def _constant(self, value) -> int:
+        key = (type(value), value)
+        register = self._constant_registers.get(key)
+        if register is None:
+            register = len(self._constants)
+            self._constants.append(value)
+            self._constant_registers[key] = register
+        return register
+
+    def _variable(self, index_in_table: int) -> int:
+        number = self._variable_numbers.get(index_in_table)
+        if number is None:
+            number = len(self._variable_numbers)
+            self._variable_numbers[index_in_table] = number
+        return BytecodeInterpreter._VARIABLES + number
+
+    def _temp(self) -> int:
+        self._temps += 1
+        self._max_temps = max(self._max_temps, self._temps)
+        return BytecodeInterpreter._TEMPS + self._temps - 1
+
+    def _compile_statement(self, node: Parser.Node, depth: int):
+        if depth > BytecodeInterpreter._MAX_DEPTH:
+            raise BytecodeInterpreter._TooDeep()
+
+        # the temporary values of a statement are not needed after it
+        temps = self._temps
+        self._statement_compilers[node.kind](node, depth + 1)
+        self._temps = temps
+
+    def _compile_expression(self, node: Parser.Node, depth: int, dst: Optional[int] = None) -> int:
+        """Emits the instructions that compute the value, returns the register it is in. That is dst if it is
+        not None. Only the last instruction writes dst, so dst can be an operand of the expression."""
+        if depth > BytecodeInterpreter._MAX_DEPTH:
+            raise BytecodeInterpreter._TooDeep()
+
+        register = self._expression_compilers[node.kind](node, depth + 1, dst)
+        if dst is not None and register != dst:
+            self._emit(Opcode.MOVE, node, dst, register)
+            return dst
+        return register
+
+    def _compile_unknown(self, node: Parser.Node, depth: int):
+        # the tree-walker fails when it gets to the node, not before the program runs
+        self._emit(Opcode.UNKNOWN, node)
+
+    def _compile_unknown_expression(self, node: Parser.Node, depth: int, dst: Optional[int]) -> int:
+        self._emit(Opcode.UNKNOWN, node)
+        return self._constant(None)
+
+    def _compile_jump_unless(self, cond_node: Parser.Node, depth: int) -> int:
+        """Emits the jump taken if the condition is false, returns it to be patched with the target."""
+        jump = BytecodeInterpreter._JUMPS_UNLESS.get(cond_node.kind)
+        if jump is not None:
+            left = self._compile_expression(cond_node.children[0], depth)
+            right = self._compile_expression(cond_node.children[1], depth)
+            return self._emit(jump, cond_node, left, right)
+
+        cond = self._compile_expression(cond_node, depth)
+        return self._emit(Opcode.JUMP_IF_FALSE, cond_node, cond)
+
+    # statements
+
+    def _compile_compound_statement(self, node: Parser.Node, depth: int):
+        for child in node.children:
+            self._compile_statement(child, depth)
+
+    def _compile_print(self, node: Parser.Node, depth: int):
+        self._emit(Opcode.PRINT, node, self._compile_expression(node.children[0], depth))
+
+    def _compile_declare(self, node: Parser.Node, depth: int):
+        for child in node.children:
+            if child.kind == NodeKind.OP_ASSIGN:
+                self._compile_assignment(child, depth)
+                continue
+
+            var_type = child.value().type
+            var = self._variable(child.index_in_table)
+            if not isinstance(var_type, list):
+                self._emit(Opcode.MOVE, child, var, self._constant(self._get_default_value(var_type)))
+            elif child.index_in_table in self._layouts:
+                layout = self._constant((var_type[0], tuple(var_type[1:])))
+                default_value = self._constant(self._get_default_value(var_type[0]))
+                self._emit(Opcode.NEW_FLAT_ARRAY, child, var, layout, default_value)
+            else:
+                sizes = self._constant(tuple(var_type[1:]))
+                self._emit(Opcode.NEW_ARRAY, child, var, sizes, self._constant(self._get_default_value(var_type[0])))
+
+    def _compile_assignment(self, node: Parser.Node, depth: int):
+        left_node, value_node = node.children
+
+        if left_node.kind == NodeKind.IDENTIFIER:
+            self._compile_expression(value_node, depth, self._variable(left_node.index_in_table))
+            return
+
+        # the value is computed first, then the indexes from left to right, as in the tree-walker
+        value = self._compile_expression(value_node, depth)
+        var = self._idents_tbl[left_node.children[0].index_in_table]
+        container = self._variable(left_node.children[0].index_in_table)
+        index_nodes = left_node.children[1:]
+
+        layout = self._layouts.get(left_node.children[0].index_in_table)
+        if layout is not None:
+            check = Opcode.CHECK_ELEMENT if left_node.kind == NodeKind.INDEXATION else None
+            offset = self._compile_offset(left_node, depth, check, [left_node] * len(index_nodes))
+            # the buffer of bools keeps every value assigned
+            store = Opcode.STORE_INDEX_IN_BOUNDS if layout[0] == "bool" else Opcode.STORE_FLAT
+            self._emit(store, left_node, container, offset, value)
+            return
+
+        if left_node.kind == NodeKind.INDEXATION_IN_BOUNDS:
+            # the element exists, so it is set without the checks
+            element, store = Opcode.INDEX_IN_BOUNDS, Opcode.STORE_INDEX_IN_BOUNDS
+        else:
+            element, store = Opcode.ELEMENT, Opcode.STORE_INDEX
+
+        elem_type = var.type[0] if isinstance(var.type, list) else var.type
+        if left_node.kind == NodeKind.INDEXATION_IN_BOUNDS or \
+                elem_type != "string" or len(index_nodes) == len(var.type) - 1:
+            # an element of an array
+            for index_node in index_nodes[:-1]:
+                idx = self._compile_expression(index_node, depth)
+                inner = self._temp()
+                self._emit(element, left_node, inner, container, idx)
+                container = inner
+            idx = self._compile_expression(index_nodes[-1], depth)
+            self._emit(store, left_node, container, idx, value)
+            return
+
+        # a character of a string, which is made a list of its characters and changed in place
+        if len(index_nodes) == 1:
+            idx = self._compile_expression(index_nodes[0], depth)
+            self._emit(Opcode.SET_CHAR, left_node, container, idx, value)
+            return
+
+        for index_node in index_nodes[:-2]:
+            idx = self._compile_expression(index_node, depth)
+            inner = self._temp()
+            self._emit(Opcode.ELEMENT, left_node, inner, container, idx)
+            container = inner
+        idx = self._compile_expression(index_nodes[-2], depth)
+        char_idx = self._compile_expression(index_nodes[-1], depth)
+        string = self._temp()
+        self._emit(Opcode.ELEMENT, left_node, string, container, idx)
+        self._emit(Opcode.SET_CHAR, left_node, string, char_idx, value)
+        self._emit(Opcode.STORE_INDEX_IN_BOUNDS, left_node, container, idx, string)
+
+    def _compile_if(self, node: Parser.Node, depth: int):
+        jump_to_else = self._compile_jump_unless(node.children[0], depth)
+        self._compile_statement(node.children[1], depth)
+
+        if len(node.children) < 3 or node.children[2] is None:
+            self._patch_jump(jump_to_else, self._here())
+            return
+
+        jump_to_end = self._emit(Opcode.JUMP, node)
+        self._patch_jump(jump_to_else, self._here())
+        self._compile_statement(node.children[2], depth)
+        self._patch_jump(jump_to_end, self._here())
+
+    def _compile_loop(self, node: Parser.Node, depth: int, cond_node: Optional[Parser.Node],
+                      body_node: Parser.Node, incr_node: Optional[Parser.Node]):
+        start = self._here()
+        exits = [] if cond_node is None else [self._compile_jump_unless(cond_node, depth)]
+
+        self._breaks.append(exits)
+        self._compile_statement(body_node, depth)
+        self._breaks.pop()
+
+        if incr_node is not None:
+            self._compile_statement(incr_node, depth)
+        self._emit(Opcode.JUMP, node, start)
+
+        for jump in exits:
+            self._patch_jump(jump, self._here())
+
+    def _compile_while(self, node: Parser.Node, depth: int):
+        self._compile_loop(node, depth, node.children[0], node.children[1], None)
+
+    def _compile_for(self, node: Parser.Node, depth: int):
+        init_node, cond_node, incr_node, body_node = node.children
+        if init_node is not None:
+            self._compile_statement(init_node, depth)
+        self._compile_loop(node, depth, cond_node, body_node, incr_node)
+
+    def _compile_switch(self, node: Parser.Node, depth: int):
+        value = self._compile_expression(node.children[0], depth)
+        cases, default = self._jump_table(node)
+
+        table = len(self._switch_tables)
+        self._switch_tables.append(None)
+        self._emit(Opcode.SWITCH, node, value, table)
+
+        # a case jumps into the statements of its parent and runs them from the case to the end of the parent.
+        # The statements of every parent with a label are compiled from its first label, and the switch ends
+        # after them
+        labels = {}
+        for parent, idx in cases.values() if default is None else (*cases.values(), default):
+            labels.setdefault(id(parent), (parent, set()))[1].add(idx)
+
+        exits = []
+        self._breaks.append(exits)
+        targets = {}
+        for parent, indexes in labels.values():
+            for idx in range(min(indexes), len(parent.children)):
+                if idx in indexes:
+                    targets[(id(parent), idx)] = self._here()
+                self._compile_statement(parent.children[idx], depth)
+            exits.append(self._emit(Opcode.JUMP, node))
+        self._breaks.pop()
+
+        end = self._here()
+        for jump in exits:
+            self._patch_jump(jump, end)
+
+        self._switch_tables[table] = (
+            {case: targets[(id(parent), idx)] for case, (parent, idx) in cases.items()},
+            end if default is None else targets[(id(default[0]), default[1])],
+        )
+
+    def _compile_case_or_default(self, node: Parser.Node, depth: int):
+        pass
+
+    def _compile_break(self, node: Parser.Node, depth: int):
+        self._breaks[-1].append(self._emit(Opcode.JUMP, node))
+
+    # expressions
+
+    def _compile_constant(self, node: Parser.Node, depth: int, dst: Optional[int]) -> int:
+        return self._constant(self._interpret_node(node))
+
+    def _compile_identifier(self, node: Parser.Node, depth: int, dst: Optional[int]) -> int:
+        variable = self._variable(node.index_in_table)
+        if node.index_in_table in self._char_strings:
+            # a string written by characters is a list, which is made a string again when it is read whole
+            self._emit(Opcode.JOIN_CHARS, node, variable)
+        return variable
+
+    def _compile_offset(self, node: Parser.Node, depth: int, check: Optional[int], error_nodes: list) -> int:
+        """Emits the instructions that compute the offset of the element in the flat buffer, returns the register
+        with it. check is the instruction that checks an index after it is computed, None if the indexation is
+        in the bounds, and the error of an index is reported at its node in error_nodes."""
+        sizes, strides = self._layouts[node.children[0].index_in_table][1:]
+
+        offset = None
+        for i, index_node in enumerate(node.children[1:]):
+            term = self._compile_expression(index_node, depth)
+            if check is not None:
+                checked = self._temp()
+                self._emit(check, error_nodes[i], checked, term, self._constant(sizes[i]))
+                term = checked
+            if strides[i] != 1:
+                product = self._temp()
+                self._emit(Opcode.MUL, node, product, term, self._constant(strides[i]))
+                term = product
+
+            if offset is None:
+                offset = term
+            else:
+                total = self._temp()
+                self._emit(Opcode.ADD, node, total, offset, term)
+                offset = total
+        return offset
+
+    def _compile_flat_element(self, node: Parser.Node, depth: int, dst: Optional[int]) -> int:
+        temps = self._temps
+        check = Opcode.CHECK_INDEX if node.kind == NodeKind.INDEXATION else None
+        offset = self._compile_offset(node, depth, check, node.children[1:])
+        self._temps = temps
+
+        buffer = self._variable(node.children[0].index_in_table)
+        if self._layouts[node.children[0].index_in_table][0] != "bool":
+            target = self._temp() if dst is None else dst
+            self._emit(Opcode.INDEX_IN_BOUNDS, node, target, buffer, offset)
+            return target
+
+        # the buffer has the bools as numbers
+        element = self._temp()
+        self._emit(Opcode.INDEX_IN_BOUNDS, node, element, buffer, offset)
+        target = element if dst is None else dst
+        self._emit(Opcode.NE, node, target, element, self._constant(0))
+        return target
+
+    def _compile_indexation(self, node: Parser.Node, depth: int, dst: Optional[int]) -> int:
+        layout = self._layouts.get(node.children[0].index_in_table)
+        if layout is not None and (len(node.children) > 2 or layout[0] == "bool"):
+            # the buffer of a one-dimensional array is indexed like a list
+            return self._compile_flat_element(node, depth, dst)
+
+        op = Opcode.INDEX_IN_BOUNDS if node.kind == NodeKind.INDEXATION_IN_BOUNDS else Opcode.INDEX
+        last_op = op
+        if node.children[0].index_in_table in self._char_strings and self._is_string_element(node):
+            # a string written by characters is a list, which is made a string again when it is read whole
+            last_op = Opcode.STRING_ELEMENT
+        temps = self._temps
+        container = self._variable(node.children[0].index_in_table)
+
+        index_nodes = node.children[1:]
+        for i, index_node in enumerate(index_nodes):
+            idx = self._compile_expression(index_node, depth)
+            if i == len(index_nodes) - 1:
+                self._temps = temps
+            target = dst if i == len(index_nodes) - 1 and dst is not None else self._temp()
+            # the error is reported at the index
+            self._emit(last_op if i == len(index_nodes) - 1 else op, index_node, target, container, idx)
+            container = target
+        return container
+
+    def _compile_unary(self, node: Parser.Node, depth: int, dst: Optional[int]) -> int:
+        temps = self._temps
+        operand = self._compile_expression(node.children[0], depth)
+        self._temps = temps
+        target = self._temp() if dst is None else dst
+        self._emit(BytecodeInterpreter._UNARY_OPCODES[node.kind], node, target, operand)
+        return target
+
+    def _compile_scan(self, node: Parser.Node, depth: int, dst: Optional[int]) -> int:
+        target = self._temp() if dst is None else dst
+        if node.kind == NodeKind.KW_SCAN:
+            self._emit(Opcode.SCAN, node, target)
+        elif node.kind == NodeKind.KW_SCAN_WORD:
+            self._emit(Opcode.SCAN_WORD, node, target)
+        else:
+            # the word is converted from its bytes, without a string made of it
+            self._emit(Opcode.SCAN_TOKEN, node, target)
+            self._emit(Opcode.ATOI if node.kind == NodeKind.KW_SCAN_INT else Opcode.ATOF, node, target, target)
+        return target
+
+    def _compile_add(self, node: Parser.Node, depth: int, dst: Optional[int]) -> int:
+        if len(node.children) == 1:
+            # a sign
+            return self._compile_expression(node.children[0], depth)
+        return self._compile_chain(node, depth, dst)
+
+    def _compile_sub(self, node: Parser.Node, depth: int, dst: Optional[int]) -> int:
+        if len(node.children) > 1:
+            return self._compile_chain(node, depth, dst)
+
+        temps = self._temps
+        operand = self._compile_expression(node.children[0], depth)
+        self._temps = temps
+        target = self._temp() if dst is None else dst
+        self._emit(Opcode.NEG, node, target, operand)
+        return target
+
+    def _compile_chain(self, node: Parser.Node, depth: int, dst: Optional[int]) -> int:
+        op = BytecodeInterpreter._BINARY_OPCODES[node.kind]
+        temps = self._temps
+
+        children = node.children
+        ret = self._compile_expression(children[0], depth)
+        for i in range(1, len(children)):
+            right = self._compile_expression(children[i], depth)
+            # the operands are read before the result is written, so it can take the register of one of them
+            self._temps = temps
+            target = dst if i == len(children) - 1 and dst is not None else self._temp()
+            self._emit(op, node, target, ret, right)
+            ret = target
+        return ret
+
+    def _compile_short_circuit(self, node: Parser.Node, depth: int, dst: Optional[int]) -> int:
+        # the value is built in a new register, dst may be read by the operands
+        jump = Opcode.JUMP_IF_FALSE if node.kind == NodeKind.OP_AND else Opcode.JUMP_IF_TRUE
+        target = self._temp()
+        temps = self._temps
+
+        exits = []
+        for i, child in enumerate(node.children):
+            self._compile_expression(child, depth, target)
+            self._temps = temps
+            if i < len(node.children) - 1:
+                exits.append(self._emit(jump, node, target))
+        for exit_jump in exits:
+            self._patch_jump(exit_jump, self._here())
+        return target
+
+    def _registers_placed(self):
+        """Renumbers the registers of the instructions, now that the number of the constants and the variables
+        is known."""
+        variables = len(self._constants)
+        temps = variables + len(self._variable_numbers)
+        code = self._code
+
+        for i in range(0, len(code), 4):
+            for operand, kind in enumerate(Opcode.OPERANDS[code[i]], i + 1):
+                if kind != 'r':
+                    continue
+                register = code[operand]
+                if register >= BytecodeInterpreter._TEMPS:
+                    code[operand] = register - BytecodeInterpreter._TEMPS + temps
+                elif register >= BytecodeInterpreter._VARIABLES:
+                    code[operand] = register - BytecodeInterpreter._VARIABLES + variables
+
+    def compile(self) -> Bytecode:
+        self._reset()
+        self._char_strings = self._written_by_characters()
+        self._compile_statement(self._syntax_tree, 0)
+        self._registers_placed()
+
+        names = [None] * len(self._variable_numbers)
+        for index_in_table, number in self._variable_numbers.items():
+            names[number] = self._idents_tbl[index_in_table].name
+        names.extend(f"t{i}" for i in range(self._max_temps))
+
+        return Bytecode(self._code, self._lines, self._columns, self._constants,
+                        len(self._constants) + len(names), self._switch_tables, names)
+
+    def _run(self):
+        try:
+            bytecode = self.compile()
+        except BytecodeInterpreter._TooDeep:
+            super()._run()
+            return
+
+        if self._output_path is not None:
+            with open(self._output_path, "wb") as f:
+                f.write(bytecode.dumps())
+        bytecode.run(self._output, self._input)
@@ -0,0 +1,691 @@
+from typing import Optional
+
+from flat_array import FlatArray
+from interpreter import Interpreter
+from parser import Parser
+from node_kind import NodeKind
+from program_output import ProgramOutput
+from symbol_table import SymbolTable
+
+
+def _nothing():
+    pass
+
+
+def _break() -> bool:
+    return True
+
+
+def _true() -> bool:
+    return True
+
+
+class ClosureInterpreter(Interpreter):
+    """Compiles the tree once into closures, one for every node, and runs the program by calling the closure
+    of the root.
+
+    The closure of a node has the closures of its children, the variables and the values of the constants
+    bound to it, so running a node does not look at the tree. The closure of an expression returns its value,
+    the closure of a statement returns True if a break leaves it.
+    """
+
+    # the closures call each other, so the nodes deeper than this are run by the methods of Interpreter, which
+    # do not use recursion
+    _MAX_DEPTH = Interpreter._MAX_RECURSIVE_HEIGHT
+
+    def __init__(self, parser_nodes: SymbolTable, operators: SymbolTable, identifiers: SymbolTable,
+                 keywords: SymbolTable, consts: SymbolTable, syntax_tree, flat_arrays: bool = False,
+                 output: Optional[ProgramOutput] = None):
+        super().__init__(parser_nodes, operators, identifiers, keywords, consts, syntax_tree, flat_arrays, output)
+
+        # the method that compiles a statement, by the kind of the node
+        self._statement_compilers = [self._compile_unknown] * NodeKind.COUNT
+        for kind, compiler in (
+            (NodeKind.PROGRAM, self._compile_compound_statement),
+            (NodeKind.COMPOUND_STATEMENT, self._compile_compound_statement),
+            (NodeKind.KW_PRINT, self._compile_print),
+            (NodeKind.DECLARE, self._compile_declare),
+            (NodeKind.OP_ASSIGN, self._compile_assignment),
+            (NodeKind.KW_IF, self._compile_if),
+            (NodeKind.KW_WHILE, self._compile_while),
+            (NodeKind.KW_FOR, self._compile_for),
+            (NodeKind.KW_SWITCH, self._compile_switch),
+            (NodeKind.KW_CASE, self._compile_case_or_default),
+            (NodeKind.KW_DEFAULT, self._compile_case_or_default),
+            (NodeKind.KW_BREAK, self._compile_break),
+        ):
+            self._statement_compilers[kind] = compiler
+
+        # the method that compiles an expression, by the kind of the node
+        self._expression_compilers = [self._compile_unknown] * NodeKind.COUNT
+        for kind, compiler in (
+            (NodeKind.INDEXATION, self._compile_indexation),
+            (NodeKind.INDEXATION_IN_BOUNDS, self._compile_indexation_in_bounds),
+            (NodeKind.CONST_STRING, self._compile_constant),
+            (NodeKind.CONST_INT, self._compile_constant),
+            (NodeKind.CONST_DOUBLE, self._compile_constant),
+            (NodeKind.KW_TRUE, self._compile_constant),
+            (NodeKind.KW_FALSE, self._compile_constant),
+            (NodeKind.IDENTIFIER, self._compile_identifier),
+            (NodeKind.KW_TO_STRING, self._compile_to_string),
+            (NodeKind.KW_ATOI, self._compile_conversion),
+            (NodeKind.KW_ATOF, self._compile_conversion),
+            (NodeKind.KW_ATOB, self._compile_conversion),
+            (NodeKind.KW_SCAN, self._compile_scan),
+            (NodeKind.KW_SCAN_INT, self._compile_scan),
+            (NodeKind.KW_SCAN_DOUBLE, self._compile_scan),
+            (NodeKind.KW_SCAN_WORD, self._compile_scan),
+            (NodeKind.OP_ADD, self._compile_add),
+            (NodeKind.OP_SUB, self._compile_sub),
+            (NodeKind.OP_MUL, self._compile_mul),
+            (NodeKind.OP_DIV, self._compile_div),
+            (NodeKind.OP_MOD, self._compile_mod),
+            (NodeKind.OP_AND, self._compile_and),
+            (NodeKind.OP_OR, self._compile_or),
+            (NodeKind.OP_NOT, self._compile_not),
+            (NodeKind.OP_GT, self._compile_gt),
+            (NodeKind.OP_LT, self._compile_lt),
+            (NodeKind.OP_GE, self._compile_ge),
+            (NodeKind.OP_LE, self._compile_le),
+            (NodeKind.OP_EQ, self._compile_eq),
+            (NodeKind.OP_NE, self._compile_ne),
+        ):
+            self._expression_compilers[kind] = compiler
+
+    def _compile_statement(self, node: Parser.Node, depth: int):
+        if depth > ClosureInterpreter._MAX_DEPTH:
+            execute = self._execute
+            return lambda: execute(node)
+        return self._statement_compilers[node.kind](node, depth + 1)
+
+    def _compile_expression(self, node: Parser.Node, depth: int):
+        if depth > ClosureInterpreter._MAX_DEPTH:
+            evaluate = self._evaluate_with_stacks
+            return lambda: evaluate(node)
+        return self._expression_compilers[node.kind](node, depth + 1)
+
+    def _compile_operands(self, node: Parser.Node, depth: int) -> tuple:
+        return tuple(self._compile_expression(child, depth) for child in node.children)
+
+    def _compile_unknown(self, node: Parser.Node, depth: int):
+        # the tree-walker fails when it gets to the node, not before the program runs
+        def run():
+            raise Interpreter.RuntimeError("unknown node", node.line, node.index)
+        return run
+
+    # statements
+
+    @staticmethod
+    def _breaks_out(statement: Parser.Node) -> bool:
+        """Whether a break in the statement leaves it for the loop or the switch around it. If not, the closures
+        running it do not look at what the inner closures return."""
+        stack = [statement]
+        while stack:
+            node = stack.pop()
+            if node is None:
+                continue
+            if node.kind == NodeKind.KW_BREAK:
+                return True
+            if node.kind not in Interpreter._BREAKABLE:
+                stack.extend(node.children)
+        return False
+
+    @staticmethod
+    def _sequence(statements: tuple, can_break: bool = True):
+        # the labels do nothing in a sequence
+        statements = tuple(statement for statement in statements if statement is not _nothing)
+        if not statements:
+            return _nothing
+        if len(statements) == 1:
+            return statements[0]
+
+        if not can_break:
+            def run():
+                for statement in statements:
+                    statement()
+            return run
+
+        def run():
+            for statement in statements:
+                if statement():
+                    return True
+        return run
+
+    def _compile_compound_statement(self, node: Parser.Node, depth: int):
+        return ClosureInterpreter._sequence(tuple(self._compile_statement(child, depth) for child in node.children),
+                                            ClosureInterpreter._breaks_out(node))
+
+    def _compile_print(self, node: Parser.Node, depth: int):
+        value = self._compile_expression(node.children[0], depth)
+
+        write = self._output.write
+
+        def run():
+            write(value())
+        return run
+
+    def _compile_declaration(self, var_node: Parser.Node):
+        frame, slot = self._frame, var_node.index_in_table
+        var_type = self._idents_tbl[slot].type
+
+        if not isinstance(var_type, list):
+            default_value = self._get_default_value(var_type)
+
+            def run():
+                frame[slot] = default_value
+            return run
+
+        # an array
+        new_array = self._new_array_of
+
+        def run():
+            frame[slot] = new_array(slot)
+        return run
+
+    def _compile_declare(self, node: Parser.Node, depth: int):
+        return ClosureInterpreter._sequence(tuple(
+            self._compile_assignment(child, depth) if child.kind == NodeKind.OP_ASSIGN
+            else self._compile_declaration(child)
+            for child in node.children
+        ), False)
+
+    def _compile_assignment(self, node: Parser.Node, depth: int):
+        left_node, value_node = node.children
+        value = self._compile_expression(value_node, depth)
+
+        if left_node.kind == NodeKind.IDENTIFIER:
+            frame, slot = self._frame, left_node.index_in_table
+
+            def run():
+                frame[slot] = value()
+            return run
+
+        frame, slot = self._frame, left_node.children[0].index_in_table
+        var_type = self._idents_tbl[slot].type
+        indexes = self._compile_operands(left_node, depth)[1:]
+
+        if slot in self._layouts:
+            return self._compile_flat_store(left_node, value, indexes)
+
+        if left_node.kind == NodeKind.INDEXATION_IN_BOUNDS:
+            # the element exists, so it is set without the checks
+            if len(indexes) == 1:
+                index, = indexes
+
+                def run():
+                    new_value = value()
+                    frame[slot][index()] = new_value
+                return run
+
+            if len(indexes) == 2:
+                index0, index1 = indexes
+
+                def run():
+                    new_value = value()
+                    frame[slot][index0()][index1()] = new_value
+                return run
+
+            def run():
+                new_value = value()
+                arr_to_assign = frame[slot]
+                for i in range(len(indexes) - 1):
+                    arr_to_assign = arr_to_assign[indexes[i]()]
+                arr_to_assign[indexes[-1]()] = new_value
+            return run
+
+        line, index = left_node.line, left_node.index
+        elem_type = var_type[0] if isinstance(var_type, list) else var_type
+        if elem_type != "string" or len(indexes) == len(var_type) - 1:
+            # an element of an array
+            if len(indexes) == 1:
+                index0, = indexes
+
+                def run():
+                    new_value = value()
+                    try:
+                        frame[slot][index0()] = new_value
+                    except IndexError:
+                        raise Interpreter.RuntimeError("index out of range", line, index)
+                return run
+
+            def run():
+                new_value = value()
+                try:
+                    arr_to_assign = frame[slot]
+                    for i in range(len(indexes) - 1):
+                        arr_to_assign = arr_to_assign[indexes[i]()]
+                    arr_to_assign[indexes[-1]()] = new_value
+                except IndexError:
+                    raise Interpreter.RuntimeError("index out of range", line, index)
+            return run
+
+        # a character of a string, which is changed in place
+        set_char = Interpreter._set_char
+        if len(indexes) == 1:
+            index0, = indexes
+
+            def run():
+                new_value = value()
+                idx = index0()
+                frame[slot] = set_char(frame[slot], idx, new_value)
+            return run
+
+        def run():
+            new_value = value()
+            try:
+                arr_to_assign = frame[slot]
+                for i in range(len(indexes) - 2):
+                    arr_to_assign = arr_to_assign[indexes[i]()]
+                idx = indexes[-2]()
+                idx2 = indexes[-1]()
+                arr_to_assign[idx] = set_char(arr_to_assign[idx], idx2, new_value)
+            except IndexError:
+                raise Interpreter.RuntimeError("index out of range", line, index)
+        return run
+
+    def _compile_flat_store(self, left_node: Parser.Node, value, indexes: tuple):
+        frame, slot = self._frame, left_node.children[0].index_in_table
+        elem_type = self._layouts[slot][0]
+        offset = self._compile_offset(left_node, indexes, [(left_node.line, left_node.index)] * len(indexes),
+                                      "index out of range")
+        store = FlatArray.store
+
+        if elem_type == "int":
+            # a double, or an int of more than 64 bits, does not go into the buffer
+            def run():
+                new_value = value()
+                idx = offset()
+                try:
+                    frame[slot][idx] = new_value
+                except (TypeError, OverflowError):
+                    frame[slot] = store(frame[slot], idx, new_value)
+            return run
+
+        if elem_type == "double":
+            # the buffer would make an int a float
+            def run():
+                new_value = value()
+                idx = offset()
+                if new_value.__class__ is float:
+                    frame[slot][idx] = new_value
+                else:
+                    frame[slot] = store(frame[slot], idx, new_value)
+            return run
+
+        def run():
+            new_value = value()
+            frame[slot][offset()] = new_value
+        return run
+
+    def _compile_if(self, node: Parser.Node, depth: int):
+        cond = self._compile_expression(node.children[0], depth)
+        stmt_if_yes = self._compile_statement(node.children[1], depth)
+
+        if len(node.children) < 3 or node.children[2] is None:
+            def run():
+                if cond():
+                    return stmt_if_yes()
+            return run
+
+        stmt_if_no = self._compile_statement(node.children[2], depth)
+
+        def run():
+            if cond():
+                return stmt_if_yes()
+            return stmt_if_no()
+        return run
+
+    def _compile_while(self, node: Parser.Node, depth: int):
+        cond = self._compile_expression(node.children[0], depth)
+        body = self._compile_statement(node.children[1], depth)
+
+        if not ClosureInterpreter._breaks_out(node.children[1]):
+            def run():
+                while cond():
+                    body()
+            return run
+
+        def run():
+            while cond():
+                if body():
+                    return
+        return run
+
+    def _compile_for(self, node: Parser.Node, depth: int):
+        init_node, cond_node, incr_node, body_node = node.children
+        init = _nothing if init_node is None else self._compile_assignment(init_node, depth)
+        cond = _true if cond_node is None else self._compile_expression(cond_node, depth)
+        incr = _nothing if incr_node is None else self._compile_assignment(incr_node, depth)
+        body = self._compile_statement(body_node, depth)
+
+        if not ClosureInterpreter._breaks_out(body_node):
+            def run():
+                init()
+                while cond():
+                    body()
+                    incr()
+            return run
+
+        def run():
+            init()
+            while cond():
+                if body():
+                    return
+                incr()
+        return run
+
+    def _compile_switch(self, node: Parser.Node, depth: int):
+        value = self._compile_expression(node.children[0], depth)
+        cases, default = self._jump_table(node)
+
+        # a case jumps into the statements of its parent, from the case to the end of the parent. The statements
+        # of a parent are compiled once, from its first label
+        firsts = {}
+        for parent, idx in cases.values() if default is None else (*cases.values(), default):
+            firsts[id(parent)] = min(idx, firsts.get(id(parent), idx))
+
+        compiled = {}
+
+        def entry(parent: Parser.Node, idx: int):
+            first = firsts[id(parent)]
+            statements = compiled.get(id(parent))
+            if statements is None:
+                statements = tuple(self._compile_statement(child, depth) for child in parent.children[first:])
+                compiled[id(parent)] = statements
+            return statements, idx - first
+
+        cases = {case: entry(parent, idx) for case, (parent, idx) in cases.items()}
+        default = None if default is None else entry(*default)
+
+        def run():
+            target = cases.get(value(), default)
+            if target is None:
+                return
+
+            statements, start = target
+            for i in range(start, len(statements)):
+                if statements[i]():
+                    return
+        return run
+
+    def _compile_case_or_default(self, node: Parser.Node, depth: int):
+        return _nothing
+
+    def _compile_break(self, node: Parser.Node, depth: int):
+        return _break
+
+    # expressions
+
+    def _compile_constant(self, node: Parser.Node, depth: int):
+        value = self._interpret_node(node)
+        return lambda: value
+
+    def _compile_identifier(self, node: Parser.Node, depth: int):
+        frame, slot = self._frame, node.index_in_table
+        if slot not in self._char_strings:
+            return lambda: frame[slot]
+
+        def run():
+            value = frame[slot]
+            if value.__class__ is list:
+                # a string written by characters, see Interpreter._set_char
+                value = frame[slot] = "".join(value)
+            return value
+        return run
+
+    def _compile_string_element(self, node: Parser.Node, indexes: tuple):
+        """A whole element of an array of strings written by characters."""
+        frame, slot = self._frame, node.children[0].index_in_table
+        index_nodes = node.children[1:]
+        if node.kind == NodeKind.INDEXATION:
+            element = Interpreter._index
+        else:
+            element = lambda container, idx, index_node: container[idx]
+
+        def run():
+            container = frame[slot]
+            for i in range(len(indexes) - 1):
+                container = element(container, indexes[i](), index_nodes[i])
+            idx = indexes[-1]()
+            value = element(container, idx, index_nodes[-1])
+            if value.__class__ is list:
+                # see Interpreter._set_char
+                value = container[idx] = "".join(value)
+            return value
+        return run
+
+    def _compile_offset(self, node: Parser.Node, indexes: tuple, positions: list, message: str):
+        """The closure computing the offset of the element in the flat buffer. Unless the indexation is in the
+        bounds, every index is checked after it is computed, like the index of a list, and the error is
+        reported at its position."""
+        sizes, strides = self._layouts[node.children[0].index_in_table][1:]
+
+        if node.kind == NodeKind.INDEXATION_IN_BOUNDS:
+            if len(indexes) == 1:
+                return indexes[0]
+
+            if len(indexes) == 2:
+                index0, index1 = indexes
+                stride0 = strides[0]
+                return lambda: index0() * stride0 + index1()
+
+            def run():
+                ret = 0
+                for i in range(len(indexes)):
+                    ret += indexes[i]() * strides[i]
+                return ret
+            return run
+
+        def run():
+            ret = 0
+            for i in range(len(indexes)):
+                idx = indexes[i]()
+                if idx < 0:
+                    idx += sizes[i]
+                if not 0 <= idx < sizes[i]:
+                    raise Interpreter.RuntimeError(message, *positions[i])
+                ret += idx * strides[i]
+            return ret
+        return run
+
+    def _compile_flat_element(self, node: Parser.Node, indexes: tuple):
+        frame, slot = self._frame, node.children[0].index_in_table
+        elem_type, _, strides = self._layouts[slot]
+        offset = self._compile_offset(node, indexes, [(child.line, child.index) for child in node.children[1:]],
+                                      "array index out of range")
+
+        if elem_type == "bool":
+            # the buffer has the bools as numbers
+            return lambda: frame[slot][offset()] != 0
+
+        if node.kind == NodeKind.INDEXATION_IN_BOUNDS and len(indexes) == 2:
+            index0, index1 = indexes
+            stride0 = strides[0]
+            return lambda: frame[slot][index0() * stride0 + index1()]
+
+        return lambda: frame[slot][offset()]
+
+    def _compile_indexation(self, node: Parser.Node, depth: int):
+        frame, slot = self._frame, node.children[0].index_in_table
+        indexes = self._compile_operands(node, depth)[1:]
+        index_nodes = node.children[1:]
+
+        if slot in self._layouts and (len(indexes) > 1 or self._layouts[slot][0] == "bool"):
+            # the buffer of a one-dimensional array is indexed like a list
+            return self._compile_flat_element(node, indexes)
+        if slot in self._char_strings and self._is_string_element(node):
+            return self._compile_string_element(node, indexes)
+
+        if len(indexes) == 1:
+            index, = indexes
+            line, pos = index_nodes[0].line, index_nodes[0].index
+
+            def run():
+                idx = index()
+                try:
+                    return frame[slot][idx]
+                except IndexError:
+                    raise Interpreter.RuntimeError("array index out of range", line, pos)
+            return run
+
+        checked_index = Interpreter._index
+
+        def run():
+            val = frame[slot]
+            for i in range(len(indexes)):
+                val = checked_index(val, indexes[i](), index_nodes[i])
+            return val
+        return run
+
+    def _compile_indexation_in_bounds(self, node: Parser.Node, depth: int):
+        frame, slot = self._frame, node.children[0].index_in_table
+        indexes = self._compile_operands(node, depth)[1:]
+
+        if slot in self._layouts and (len(indexes) > 1 or self._layouts[slot][0] == "bool"):
+            # the buffer of a one-dimensional array is indexed like a list
+            return self._compile_flat_element(node, indexes)
+        if slot in self._char_strings and self._is_string_element(node):
+            return self._compile_string_element(node, indexes)
+
+        if len(indexes) == 1:
+            index, = indexes
+            return lambda: frame[slot][index()]
+
+        if len(indexes) == 2:
+            index0, index1 = indexes
+            return lambda: frame[slot][index0()][index1()]
+
+        def run():
+            val = frame[slot]
+            for index in indexes:
+                val = val[index()]
+            return val
+        return run
+
+    def _compile_to_string(self, node: Parser.Node, depth: int):
+        operand = self._compile_expression(node.children[0], depth)
+        to_string = Interpreter._to_string
+        return lambda: to_string(operand())
+
+    def _compile_conversion(self, node: Parser.Node, depth: int):
+        operand = self._compile_expression(node.children[0], depth)
+        if node.kind == NodeKind.KW_ATOI:
+            convert = Interpreter._atoi
+        elif node.kind == NodeKind.KW_ATOF:
+            convert = Interpreter._atof
+        else:
+            convert = Interpreter._atob
+        return lambda: convert(node, operand())
+
+    def _compile_scan(self, node: Parser.Node, depth: int):
+        if node.kind == NodeKind.KW_SCAN:
+            return self._input.read_line
+        if node.kind == NodeKind.KW_SCAN_WORD:
+            return self._input.read_word
+
+        # the word is converted from its bytes, without a string made of it
+        convert = Interpreter._atoi if node.kind == NodeKind.KW_SCAN_INT else Interpreter._atof
+        read_token = self._input.read_token
+        return lambda: convert(node, read_token())
+
+    def _compile_add(self, node: Parser.Node, depth: int):
+        operands = self._compile_operands(node, depth)
+        if len(operands) == 1:
+            # a sign
+            return operands[0]
+        if len(operands) == 2:
+            left, right = operands
+            return lambda: left() + right()
+
+        add_all = Interpreter._add_all
+        return lambda: add_all([operand() for operand in operands])
+
+    def _compile_sub(self, node: Parser.Node, depth: int):
+        operands = self._compile_operands(node, depth)
+        if len(operands) == 1:
+            operand, = operands
+            return lambda: -operand()
+
+        left, right = operands
+        return lambda: left() - right()
+
+    def _compile_mul(self, node: Parser.Node, depth: int):
+        operands = self._compile_operands(node, depth)
+        if len(operands) == 2:
+            left, right = operands
+            return lambda: left() * right()
+
+        multiply_all = Interpreter._multiply_all
+        return lambda: multiply_all([operand() for operand in operands])
+
+    def _compile_div(self, node: Parser.Node, depth: int):
+        left, right = self._compile_operands(node, depth)
+        return lambda: left() / right()
+
+    def _compile_mod(self, node: Parser.Node, depth: int):
+        left, right = self._compile_operands(node, depth)
+        return lambda: left() % right()
+
+    def _compile_and(self, node: Parser.Node, depth: int):
+        operands = self._compile_operands(node, depth)
+        if len(operands) == 2:
+            left, right = operands
+            return lambda: left() and right()
+
+        def run():
+            for operand in operands:
+                value = operand()
+                if not value:
+                    return value
+            return value
+        return run
+
+    def _compile_or(self, node: Parser.Node, depth: int):
+        operands = self._compile_operands(node, depth)
+        if len(operands) == 2:
+            left, right = operands
+            return lambda: left() or right()
+
+        def run():
+            for operand in operands:
+                value = operand()
+                if value:
+                    return value
+            return value
+        return run
+
+    def _compile_not(self, node: Parser.Node, depth: int):
+        operand = self._compile_expression(node.children[0], depth)
+        return lambda: not operand()
+
+    def _compile_gt(self, node: Parser.Node, depth: int):
+        left, right = self._compile_operands(node, depth)
+        return lambda: left() > right()
+
+    def _compile_lt(self, node: Parser.Node, depth: int):
+        left, right = self._compile_operands(node, depth)
+        return lambda: left() < right()
+
+    def _compile_ge(self, node: Parser.Node, depth: int):
+        left, right = self._compile_operands(node, depth)
+        return lambda: left() >= right()
+
+    def _compile_le(self, node: Parser.Node, depth: int):
+        left, right = self._compile_operands(node, depth)
+        return lambda: left() <= right()
+
+    def _compile_eq(self, node: Parser.Node, depth: int):
+        left, right = self._compile_operands(node, depth)
+        return lambda: left() == right()
+
+    def _compile_ne(self, node: Parser.Node, depth: int):
+        left, right = self._compile_operands(node, depth)
+        return lambda: left() != right()
+
+    def compile(self):
+        """The closure that runs the whole program."""
+        self._char_strings = self._written_by_characters()
+        return self._compile_statement(self._syntax_tree, 0)
+
+    def _run(self):
+        self.compile()()
@@ -0,0 +1,408 @@
+import hashlib
+import os
+import struct
+import sys
+import tempfile
+import time
+from array import array
+from typing import List, Optional, Tuple
+
+from constant import Constant
+from node_kind import NodeKind
+from parser import Parser
+from symbol_table import SymbolTable
+from variable import Variable
+
+_compiler_version = None
+
+
+def compiler_version() -> bytes:
+    """A hash of the source of the compiler. Trees cached by another version of the compiler are not used."""
+    global _compiler_version
+
+    if _compiler_version is None:
+        directory = os.path.dirname(os.path.abspath(__file__))
+        digest = hashlib.sha256()
+
+        for name in sorted(os.listdir(directory)):
+            if name.endswith(".py"):
+                digest.update(name.encode())
+                with open(os.path.join(directory, name), "rb") as f:
+                    digest.update(f.read())
+
+        _compiler_version = digest.digest()
+
+    return _compiler_version
+
+
+class CompileCache:
+    """Checked syntax trees with their tables, stored in a directory, one file per program text.
+
+    The file of a program is named by a hash of the compiler version and the text, so a changed
+    program or compiler never finds an old file. Files are written to a temporary file and renamed,
+    so a reader sees a whole file or nothing. When the files take more than max_size bytes,
+    the least recently used ones are removed.
+
+    File format (little endian): the magic, the format version (u16), the key and the sha256 of the rest
+    (32 bytes each), then the operators, keywords, parser nodes, constants and identifiers tables, the static
+    types of the nodes, then the tree in preorder as six arrays: table (i8, -1 for no node), index in the table,
+    line, column, number of children and index of the type (i32, -1 for no type).
+    """
+
+    MAGIC = b"CPMC"
+    FORMAT_VERSION = 2
+    SUFFIX = ".cpmc"
+    DEFAULT_MAX_SIZE = 256 * 2 ** 20
+    # temporary files older than this were left by writers that died
+    STALE_TMP_AGE_NS = 3600 * 10 ** 9
+
+    # the order of the tables in a file and in the tree arrays
+    OPERATORS, KEYWORDS, IDENTIFIERS, CONSTANTS, PARSER_NODES = range(5)
+
+    class CorruptedFile(Exception):
+        pass
+
+    def __init__(self, directory: str, max_size: int = DEFAULT_MAX_SIZE):
+        self._directory = directory
+        self._max_size = max_size
+
+    @staticmethod
+    def key(program_text: bytes) -> str:
+        return hashlib.sha256(compiler_version() + program_text).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self._directory, key + CompileCache.SUFFIX)
+
+    def load(self, key: str) -> Optional[Tuple[Tuple[SymbolTable, SymbolTable, SymbolTable, SymbolTable],
+                                               SymbolTable, Parser.Node]]:
+        """Returns the operators, keywords, identifiers and constants tables, the parser nodes table
+        and the tree stored for the key, or None if there is no valid file."""
+        path = self._path(key)
+
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except OSError:
+            return None
+
+        try:
+            ret = _Reader(data).read_file(key)
+        except (CompileCache.CorruptedFile, struct.error, ValueError, IndexError, UnicodeDecodeError):
+            # a file of another format or a damaged one. the caller compiles the program and writes it again
+            return None
+
+        try:
+            # the file was used now
+            os.utime(path)
+        except OSError:
+            pass
+
+        return ret
+
+    def store(self, key: str, tables: Tuple[SymbolTable, SymbolTable, SymbolTable, SymbolTable],
+              parser_nodes: SymbolTable, tree: Parser.Node):
+        data = _Writer().write_file(key, tables, parser_nodes, tree)
+
+        os.makedirs(self._directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(prefix=key, suffix=".tmp", dir=self._directory)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            # mkstemp makes the file readable only by its owner
+            os.chmod(tmp_path, 0o644)
+            os.replace(tmp_path, self._path(key))
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+
+        self._evict()
+
+    def _evict(self):
+        files = []
+        total_size = 0
+
+        now = time.time_ns()
+
+        with os.scandir(self._directory) as entries:
+            for entry in entries:
+                try:
+                    st = entry.stat()
+                except FileNotFoundError:
+                    # removed by another process
+                    continue
+
+                if entry.name.endswith(CompileCache.SUFFIX):
+                    files.append((st.st_mtime_ns, st.st_size, entry.path))
+                    total_size += st.st_size
+                elif entry.name.endswith(".tmp") and now - st.st_mtime_ns > CompileCache.STALE_TMP_AGE_NS:
+                    try:
+                        os.remove(entry.path)
+                    except FileNotFoundError:
+                        pass
+
+        files.sort()
+        for _, size, path in files:
+            if total_size <= self._max_size:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total_size -= size
+
+
+class _Writer:
+    def __init__(self):
+        self._parts: List[bytes] = []
+
+    def _u32(self, value: int):
+        self._parts.append(struct.pack("<I", value))
+
+    def _i32(self, value: int):
+        self._parts.append(struct.pack("<i", value))
+
+    def _string(self, s: str):
+        data = s.encode("utf-8", "surrogatepass")
+        self._u32(len(data))
+        self._parts.append(data)
+
+    def _array(self, arr: array):
+        if sys.byteorder != "little":
+            arr.byteswap()
+        self._u32(len(arr))
+        self._parts.append(arr.tobytes())
+
+    def _strings(self, table: SymbolTable):
+        self._u32(len(table))
+        for s in table:
+            self._string(s)
+
+    def _constants(self, table: SymbolTable):
+        self._u32(len(table))
+        for const in table:
+            self._u32(const.type)
+            self._string(const.value)
+
+    def _type(self, tp: [str, list, None]):
+        if tp is None:
+            self._u32(0)
+        elif isinstance(tp, list):
+            # an array: the type of the elements, then the sizes
+            self._u32(len(tp))
+            self._string(tp[0])
+            for size in tp[1:]:
+                self._u32(size)
+        else:
+            self._u32(1)
+            self._string(tp)
+
+    def _identifiers(self, table: SymbolTable):
+        self._u32(len(table))
+        for var in table:
+            self._string(var.name)
+            self._type(var.type)
+            self._i32(var.nest_level)
+            self._i32(var.block_on_level)
+
+    def _tree(self, root: Parser.Node, table_ids: dict):
+        tables = array('b')
+        indices = array('i')
+        lines = array('i')
+        columns = array('i')
+        num_children = array('i')
+        type_ids = array('i')
+
+        # the distinct types, arrays are lists, so they are compared by their string
+        types = []
+        type_indices = {}
+
+        stack = [root]
+        while stack:
+            node = stack.pop()
+
+            if node is None:
+                tables.append(-1)
+                indices.append(0)
+                lines.append(0)
+                columns.append(0)
+                num_children.append(0)
+                type_ids.append(-1)
+                continue
+
+            tables.append(table_ids[id(node.table)])
+            indices.append(node.index_in_table)
+            lines.append(node.line)
+            columns.append(node.index)
+            num_children.append(len(node.children))
+            stack.extend(reversed(node.children))
+
+            if node.type is None:
+                type_ids.append(-1)
+            else:
+                type_key = str(node.type)
+                type_id = type_indices.get(type_key)
+                if type_id is None:
+                    type_id = type_indices[type_key] = len(types)
+                    types.append(node.type)
+                type_ids.append(type_id)
+
+        self._u32(len(types))
+        for tp in types:
+            self._type(tp)
+
+        for arr in (tables, indices, lines, columns, num_children, type_ids):
+            self._array(arr)
+
+    def write_file(self, key: str, tables: tuple, parser_nodes: SymbolTable, tree: Parser.Node) -> bytes:
+        operators, keywords, identifiers, constants = tables
+
+        self._strings(operators)
+        self._strings(keywords)
+        self._strings(parser_nodes)
+        self._constants(constants)
+        self._identifiers(identifiers)
+
+        table_ids = {
+            id(operators): CompileCache.OPERATORS,
+            id(keywords): CompileCache.KEYWORDS,
+            id(identifiers): CompileCache.IDENTIFIERS,
+            id(constants): CompileCache.CONSTANTS,
+            id(parser_nodes): CompileCache.PARSER_NODES,
+        }
+        self._tree(tree, table_ids)
+
+        payload = b"".join(self._parts)
+        header = CompileCache.MAGIC + struct.pack("<H", CompileCache.FORMAT_VERSION) + bytes.fromhex(key)
+        return header + hashlib.sha256(payload).digest() + payload
+
+
+class _Reader:
+    def __init__(self, data: bytes):
+        self._data = data
+        self._pos = 0
+
+    def _bytes(self, n: int) -> bytes:
+        if self._pos + n > len(self._data):
+            raise CompileCache.CorruptedFile()
+        ret = self._data[self._pos:self._pos + n]
+        self._pos += n
+        return ret
+
+    def _u32(self) -> int:
+        return struct.unpack("<I", self._bytes(4))[0]
+
+    def _i32(self) -> int:
+        return struct.unpack("<i", self._bytes(4))[0]
+
+    def _string(self) -> str:
+        return self._bytes(self._u32()).decode("utf-8", "surrogatepass")
+
+    def _array(self, typecode: str) -> array:
+        ret = array(typecode)
+        ret.frombytes(self._bytes(self._u32() * ret.itemsize))
+        if sys.byteorder != "little":
+            ret.byteswap()
+        return ret
+
+    def _strings(self, table: SymbolTable):
+        for _ in range(self._u32()):
+            table.append(self._string())
+
+    def _constants(self, table: SymbolTable):
+        for _ in range(self._u32()):
+            tp = self._u32()
+            if tp not in (Constant.INT, Constant.DOUBLE, Constant.STRING):
+                raise CompileCache.CorruptedFile()
+            table.append(Constant(self._string(), tp))
+
+    def _type(self) -> [str, list, None]:
+        tag = self._u32()
+        if tag == 0:
+            return None
+        if tag == 1:
+            return self._string()
+        return [self._string()] + [self._u32() for _ in range(tag - 1)]
+
+    def _identifiers(self, table: SymbolTable):
+        for _ in range(self._u32()):
+            name = self._string()
+            tp = self._type()
+            nest_level = self._i32()
+            block_on_level = self._i32()
+            table.append(Variable(name, tp, nest_level, block_on_level))
+
+    def _tree(self, tables: list) -> Parser.Node:
+        types = [self._type() for _ in range(self._u32())]
+
+        table_ids = self._array('b')
+        indices = self._array('i')
+        lines = self._array('i')
+        columns = self._array('i')
+        num_children = self._array('i')
+        type_ids = self._array('i')
+
+        n = len(table_ids)
+        if not n or any(len(arr) != n for arr in (indices, lines, columns, num_children, type_ids)):
+            raise CompileCache.CorruptedFile()
+
+        kinds = [[NodeKind.of(value) for value in table] for table in tables]
+        Node = Parser.Node
+
+        # the children of a node follow it in preorder, so going backwards they are built before it,
+        # and the first child is the last built
+        built = []
+        for i in range(n - 1, -1, -1):
+            table_id = table_ids[i]
+
+            if table_id < 0:
+                built.append(None)
+                continue
+
+            count = num_children[i]
+            if count:
+                if count > len(built):
+                    raise CompileCache.CorruptedFile()
+                children = tuple(built[:-count - 1:-1])
+                del built[-count:]
+            else:
+                children = ()
+
+            index_in_table = indices[i]
+            node = Node(tables[table_id], index_in_table, children, lines[i], columns[i],
+                        kinds[table_id][index_in_table])
+            type_id = type_ids[i]
+            if type_id >= 0:
+                node.type = types[type_id]
+            built.append(node)
+
+        if len(built) != 1:
+            raise CompileCache.CorruptedFile()
+        return built[0]
+
+    def read_file(self, key: str) -> tuple:
+        if self._bytes(len(CompileCache.MAGIC)) != CompileCache.MAGIC or \
+                struct.unpack("<H", self._bytes(2))[0] != CompileCache.FORMAT_VERSION or \
+                self._bytes(32) != bytes.fromhex(key):
+            raise CompileCache.CorruptedFile()
+
+        checksum = self._bytes(32)
+        if hashlib.sha256(memoryview(self._data)[self._pos:]).digest() != checksum:
+            raise CompileCache.CorruptedFile()
+
+        operators, keywords, identifiers, constants = SymbolTable(), SymbolTable(), SymbolTable(), SymbolTable()
+        parser_nodes = SymbolTable()
+
+        self._strings(operators)
+        self._strings(keywords)
+        self._strings(parser_nodes)
+        self._constants(constants)
+        self._identifiers(identifiers)
+
+        tree = self._tree([operators, keywords, identifiers, constants, parser_nodes])
+        if self._pos != len(self._data):
+            raise CompileCache.CorruptedFile()
+
+        return (operators, keywords, identifiers, constants), parser_nodes, tree
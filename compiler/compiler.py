@@ -1,7 +1,19 @@
+import os
+import time
+from typing import Optional
+
 from lexer import Lexer
-from parser import Parser
+from parser import Parser, print_tree
 from semantic import SemanticAnalyzer
+from optimizer import Optimizer
 from interpreter import Interpreter
+from closure_interpreter import ClosureInterpreter
+from transpiler import Transpiler
+from bytecode_interpreter import BytecodeInterpreter
+from incremental import IncrementalCompiler
+from compile_cache import CompileCache
+from program_output import ProgramOutput
+from symbol_table import SymbolTable
 
 
 def print_table(table):
@@ -12,17 +24,52 @@ def print_table(table):
 
 
 class Compiler:
-    def __init__(self, program_name: str):
-        self._program_name = program_name
+    # what runs the program: "tree" walks the syntax tree, "closures" compiles it into closures first,
+    # "python" translates it into a Python module, "bytecode" compiles it for a register machine
+    ENGINES = {
+        "tree": Interpreter,
+        "closures": ClosureInterpreter,
+        "python": Transpiler,
+        "bytecode": BytecodeInterpreter,
+    }
+
+    def __init__(self, program_name: str, lexer_engine: str = "regex", streaming: bool = False,
+                 cache_dir: Optional[str] = None, cache_size: int = CompileCache.DEFAULT_MAX_SIZE,
+                 engine: str = "tree", python_out: Optional[str] = None,
+                 bytecode_out: Optional[str] = None, flat_arrays: bool = False,
+                 output: Optional[ProgramOutput] = None):
+        if engine not in Compiler.ENGINES:
+            raise ValueError(f"unknown engine: {engine}")
 
-        self._identifiers_table = []
-        self._keywords_table = []
-        self._operators_table = []
-        self._constants_table = []
+        self._program_name = program_name
+        self._lexer_engine = lexer_engine
+        self._engine = engine
+        # if not None, the "python" engine writes the module of the program there
+        self._python_out = python_out
+        # if not None, the "bytecode" engine writes the compiled program there
+        self._bytecode_out = bytecode_out
+        # if True, the arrays of int, double and bool are kept in flat typed buffers instead of lists of lists
+        self._flat_arrays = flat_arrays
+        # where the program prints: a file, memory, or stdout if None
+        self._output = output
+        # if True, the lexer is run lazily by the parser and the tokens list is never built
+        self._streaming = streaming
+
+        self._identifiers_table = SymbolTable()
+        self._keywords_table = SymbolTable()
+        self._operators_table = SymbolTable()
+        self._constants_table = SymbolTable()
 
         self._tokens_list = []
 
-        self._parser = None
+        self._parser_nodes = None
+        self._syntax_tree = None
+
+        # if not None, checked trees are kept in cache_dir, and a program that was compiled before
+        # is loaded from there instead of going through the lexer, the parser and the semantic analyzer
+        self._cache = None if cache_dir is None else CompileCache(cache_dir, cache_size)
+        self._cache_key = None
+        self._from_cache = False
 
     def _print_lex_statistics(self):
         print("KEYWORDS")
@@ -51,43 +98,136 @@ class Compiler:
 
             print(f"[{tp}, {tok.index_in_table}], ({tok.line}, {tok.index})", end="\n")
 
+    def _load_from_cache(self) -> bool:
+        with open(self._program_name, "rb") as f:
+            self._cache_key = CompileCache.key(f.read())
+
+        cached = self._cache.load(self._cache_key)
+        if cached is None:
+            return False
+
+        tables, self._parser_nodes, self._syntax_tree = cached
+        self._operators_table, self._keywords_table, self._identifiers_table, self._constants_table = tables
+        return True
+
+    def _store_to_cache(self):
+        if self._syntax_tree is None:
+            return
+
+        tables = (self._operators_table, self._keywords_table, self._identifiers_table, self._constants_table)
+        try:
+            self._cache.store(self._cache_key, tables, self._parser_nodes, self._syntax_tree)
+        except OSError:
+            # the program runs without the cache
+            pass
+
     def do_lexical_analysis(self):
+        if self._cache is not None and self._load_from_cache():
+            self._from_cache = True
+            return
+
         lexer = Lexer(self._program_name,
                       self._identifiers_table,
                       self._keywords_table,
                       self._operators_table,
-                      self._constants_table)
-        self._tokens_list = lexer.split_program_into_tokens()
+                      self._constants_table,
+                      self._lexer_engine)
+        if self._streaming:
+            self._tokens_list = lexer.iter_program_tokens()
+        else:
+            self._tokens_list = lexer.split_program_into_tokens()
         # self._print_lex_statistics()
 
-    def _print_syntax_statistics(self, parser: Parser):
+    def _print_syntax_statistics(self):
         print("\nSYNTAX TREE")
-        parser.print_syntax_tree()
+        print_tree(self._syntax_tree)
 
     def do_syntax_analysis(self):
+        if self._from_cache:
+            self._print_syntax_statistics()
+            return
+
         parser = Parser(self._tokens_list,
                         self._operators_table,
                         self._identifiers_table,
                         self._keywords_table,
                         self._constants_table)
         parser.create_syntax_tree()
-        self._print_syntax_statistics(parser)
-        self._parser = parser
+        if self._streaming:
+            self._tokens_list = []
+        self._parser_nodes = parser.get_parser_nodes()
+        self._syntax_tree = parser.get_syntax_tree()
+        self._print_syntax_statistics()
 
     def do_semantic_analysis(self):
+        if self._from_cache:
+            # the tree was checked before it was stored
+            return
+
         analyzer = SemanticAnalyzer(
-            self._parser.get_parser_nodes(), self._operators_table, self._identifiers_table, self._keywords_table,
-            self._constants_table, self._parser.get_syntax_tree()
+            self._parser_nodes, self._operators_table, self._identifiers_table, self._keywords_table,
+            self._constants_table, self._syntax_tree
         )
         analyzer.check_for_semantic_errors()
 
+        if self._cache is not None:
+            self._store_to_cache()
+
+    def do_optimization(self):
+        optimizer = Optimizer(
+            self._parser_nodes, self._operators_table, self._identifiers_table, self._keywords_table,
+            self._constants_table, self._syntax_tree
+        )
+        optimizer.optimize()
+
     def run_program(self):
-        interpreter = Interpreter(
-            self._parser.get_parser_nodes(),
+        options = {"flat_arrays": self._flat_arrays, "output": self._output}
+        if self._engine == "python":
+            options.update(program_name=self._program_name, output_path=self._python_out)
+        elif self._engine == "bytecode":
+            options.update(output_path=self._bytecode_out)
+
+        interpreter = Compiler.ENGINES[self._engine](
+            self._parser_nodes,
             self._operators_table,
             self._identifiers_table,
             self._keywords_table,
             self._constants_table,
-            self._parser.get_syntax_tree()
+            self._syntax_tree,
+            **options
         )
         interpreter.run_program()
+
+    def watch(self, poll_interval: float = 0.5, show_tree: bool = False):
+        """Compile the program every time the file changes, until interrupted.
+        Only the changed part of the program is lexed, parsed and checked again."""
+        incremental = IncrementalCompiler(self._program_name, self._lexer_engine)
+        last_mtime = None
+
+        while True:
+            try:
+                mtime = os.stat(self._program_name).st_mtime_ns
+            except FileNotFoundError:
+                mtime = last_mtime
+
+            if mtime != last_mtime:
+                last_mtime = mtime
+                with open(self._program_name) as f:
+                    text = f.read()
+
+                start = time.perf_counter()
+                ok = incremental.recompile(text)
+                elapsed = time.perf_counter() - start
+
+                if show_tree and ok:
+                    print("\nSYNTAX TREE")
+                    print_tree(incremental.get_syntax_tree())
+
+                stats = incremental.stats
+                if stats is not None:
+                    print(f"compiled in {elapsed:.3f}s: "
+                          f"reused {stats['tokens'] - stats['relexed_tokens']} of {stats['tokens']} tokens, "
+                          f"{stats['statements'] - stats['reparsed_statements']} of {stats['statements']} statements, "
+                          f"{stats['rechecked_statements']} statements checked")
+
+            time.sleep(poll_interval)
@@ -1,9 +1,29 @@
 class Constant:
     INT, DOUBLE, STRING = range(3)
 
-    def __init__(self, value, tp: int):
+    def __init__(self, value: str, tp: int, runtime_value=None):
         self.value = value
         self.type = tp
+        # the value the program computes with, converted from the text once, when the constant is made
+        self.runtime_value = runtime_value
+        # False for a number the lexer takes that is not one, like ², or one with too many digits. Its
+        # runtime_value is None, and the code that uses it calls convert, which raises the ValueError there
+        self.convertible = True
+
+        if runtime_value is None:
+            try:
+                self.runtime_value = Constant.convert(value, tp)
+            except ValueError:
+                self.convertible = False
+
+    @staticmethod
+    def convert(value: str, tp: int):
+        """The value of the text of a constant of the type tp, with the escapes of a string decoded."""
+        if tp == Constant.INT:
+            return int(value)
+        if tp == Constant.DOUBLE:
+            return float(value)
+        return bytes(value, "utf-8").decode("unicode_escape")
 
     def __str__(self):
         if self.type in (Constant.INT, Constant.DOUBLE):
@@ -12,3 +32,6 @@ class Constant:
 
     def __eq__(self, other):
         return self.value == other.value and self.type == other.type
+
+    def __hash__(self):
+        return hash((self.value, self.type))
@@ -0,0 +1,54 @@
+from array import array
+from typing import Optional
+
+
+class FlatArray:
+    """Arrays of int, double and bool kept in one typed buffer, in row-major order, so an element is found
+    by one offset from the indexes and the strides of the dimensions.
+
+    The buffer holds the values as they are: a value of another Python type (a double in an int array, an int
+    in a double array) or an int that does not fit into 64 bits turns the buffer into a list of the same
+    elements, which keeps any value.
+    """
+
+    TYPECODES = {"int": "q", "double": "d", "bool": "b"}
+
+    # the type of the values a buffer holds without changing them, by the typecode
+    _TYPES = {"q": int, "d": float, "b": bool}
+
+    @staticmethod
+    def strides(sizes: list) -> tuple:
+        ret = [1] * len(sizes)
+        for i in range(len(sizes) - 2, -1, -1):
+            ret[i] = ret[i + 1] * sizes[i + 1]
+        return tuple(ret)
+
+    @staticmethod
+    def new(elem_type: str, sizes: list, default_value):
+        count = 1
+        for size in sizes:
+            count *= size
+        return array(FlatArray.TYPECODES[elem_type], (default_value,)) * count
+
+    @staticmethod
+    def store(buffer, offset: int, value):
+        """Sets the element and returns the buffer that has it: buffer, or a list made from it."""
+        if buffer.__class__ is not list and value.__class__ is not FlatArray._TYPES[buffer.typecode]:
+            buffer = list(buffer)
+
+        try:
+            buffer[offset] = value
+        except OverflowError:
+            buffer = list(buffer)
+            buffer[offset] = value
+        return buffer
+
+    @staticmethod
+    def in_range(idx: int, size: int) -> Optional[int]:
+        """The index as a list of the size would take it, counting the negative ones from the end, or None
+        if a list of the size does not have it."""
+        if idx < 0:
+            idx += size
+        if 0 <= idx < size:
+            return idx
+        return None
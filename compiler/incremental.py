@@ -0,0 +1,405 @@
+from bisect import bisect_left
+from typing import List, Optional, Tuple
+from lexer import Lexer
+from parser import Parser
+from semantic import SemanticAnalyzer
+from symbol_table import SymbolTable
+from token_store import LineStarts, TokenStore
+
+
+def common_prefix_length(a: str, b: str) -> int:
+    n = min(len(a), len(b))
+    step = 4096
+    i = 0
+
+    while i < n and a[i:i + step] == b[i:i + step]:
+        i += step
+
+    n = min(n, i + step)
+    while i < n and a[i] == b[i]:
+        i += 1
+
+    return i
+
+
+def common_suffix_length(a: str, b: str, limit: int) -> int:
+    # at most limit symbols, so that the suffix does not overlap the common prefix
+    len_a, len_b = len(a), len(b)
+    step = 4096
+    i = 0
+
+    while i + step <= limit and a[len_a - i - step:len_a - i] == b[len_b - i - step:len_b - i]:
+        i += step
+
+    while i < limit and a[len_a - i - 1] == b[len_b - i - 1]:
+        i += 1
+
+    return i
+
+
+class IncrementalCompiler:
+    """Compiles a program again after it is edited, reusing the work done for the unchanged parts.
+
+    Only the damaged region of the text is lexed again. Top-level statements are parsed again
+    from the first one that sees a changed token until the parser reaches the beginning of an old
+    statement in the same state as before. The old statements from there on are reused,
+    and only the parsed statements are checked by the semantic analyzer.
+
+    The changes that every statement makes in the idents table are kept, so the table can be
+    brought back to the state before any statement.
+    """
+
+    # drop everything and compile from scratch when the idents table has more unused variables
+    MAX_UNUSED_IDENTS = 1000
+
+    class Statement:
+        def __init__(self, node: Parser.Node, first_token: int, end_token: int, blocks_before: list,
+                     changes: list, error: Optional[SemanticAnalyzer.SemanticError]):
+            self.node = node
+            # the statement is the tokens [first_token, end_token), the parser also looks at end_token
+            self.first_token = first_token
+            self.end_token = end_token
+            self.blocks_before = blocks_before
+            # (index in the idents table, appended, state before, state after), state = (type, nest_level, block_on_level)
+            self.changes = changes
+            self.error = error
+
+    def __init__(self, program_name: str, lexer_engine: str = "regex"):
+        self._program_name = program_name
+        self._lexer_engine = lexer_engine
+        self._reset()
+
+    def _reset(self):
+        self._identifiers_table = SymbolTable()
+        self._keywords_table = SymbolTable()
+        self._operators_table = SymbolTable()
+        self._constants_table = SymbolTable()
+
+        self._lexer = Lexer(self._program_name,
+                            self._identifiers_table,
+                            self._keywords_table,
+                            self._operators_table,
+                            self._constants_table,
+                            self._lexer_engine)
+        self._lines = LineStarts()
+        self._tokens = TokenStore(
+            (self._operators_table, self._keywords_table, self._identifiers_table, self._constants_table), self._lines
+        )
+        self._parser = Parser(self._tokens,
+                              self._operators_table,
+                              self._identifiers_table,
+                              self._keywords_table,
+                              self._constants_table)
+        self._analyzer = SemanticAnalyzer(
+            self._parser.get_parser_nodes(), self._operators_table, self._identifiers_table, self._keywords_table,
+            self._constants_table, None
+        )
+
+        # the state after the last successful parsing
+        self._text = ""
+        self._statements: List[IncrementalCompiler.Statement] = []
+        self._blocks_after = [1]
+        self._syntax_tree = None
+        self._unused_idents = 0
+
+        self.stats = None
+
+    def get_syntax_tree(self):
+        return self._syntax_tree
+
+    def get_parser_nodes(self) -> SymbolTable:
+        return self._parser.get_parser_nodes()
+
+    def get_tables(self) -> Tuple[SymbolTable, SymbolTable, SymbolTable, SymbolTable]:
+        return self._operators_table, self._identifiers_table, self._keywords_table, self._constants_table
+
+    def _ident_state(self, index_in_table: int) -> tuple:
+        var = self._identifiers_table[index_in_table]
+        return var.type, var.nest_level, var.block_on_level
+
+    def _set_ident_state(self, index_in_table: int, state: tuple):
+        var = self._identifiers_table[index_in_table]
+        var.type, var.nest_level, var.block_on_level = state
+
+    def _undo(self, statements: list):
+        for stmt in reversed(statements):
+            for index_in_table, appended, before, _ in reversed(stmt.changes):
+                if appended:
+                    # the variable stays in the table, but no block will ever find it
+                    var = self._identifiers_table[index_in_table]
+                    var.nest_level, var.block_on_level = -1, -1
+                else:
+                    self._set_ident_state(index_in_table, before)
+
+    def _redo(self, statements: list):
+        for stmt in statements:
+            for index_in_table, _, _, after in stmt.changes:
+                self._set_ident_state(index_in_table, after)
+
+    @staticmethod
+    def _visible_state(state: tuple) -> tuple:
+        # what the next top-level statements can see of a variable: variables of the inner blocks
+        # cannot be found by them any more, only their type is still used (it is the type of the name)
+        tp, nest_level, block_on_level = state
+        if nest_level == 0:
+            return state
+        return tp, None
+
+    def _relex(self, text: str) -> Tuple[TokenStore, int, int, int, int]:
+        # returns the new tokens, the index of the first lexed token, the number of lexed tokens,
+        # the shift of the text after the change and the end of the change in the old text
+        old_text = self._text
+        old_tokens = self._tokens
+
+        prefix = common_prefix_length(old_text, text)
+        suffix = common_suffix_length(old_text, text, min(len(old_text), len(text)) - prefix)
+        shift = len(text) - len(old_text)
+        suffix_start = len(text) - suffix
+
+        # the last token that begins before the change may go on in the changed part
+        first = bisect_left(old_tokens.offsets, prefix) - 1
+        if first < 0:
+            first, start = 0, 0
+        else:
+            start = old_tokens.offsets[first]
+
+        fresh = []
+        end = len(old_tokens)
+
+        for tok in self._lexer.iter_tokens_from(text, start):
+            offset = tok[2]
+
+            if offset >= suffix_start:
+                # the rest of the text is the same: as soon as a token begins where an old one began,
+                # the old tokens from there on are still valid
+                old_index = bisect_left(old_tokens.offsets, offset - shift, first)
+                if old_index < len(old_tokens) and old_tokens.offsets[old_index] == offset - shift:
+                    end = old_index
+                    break
+
+            fresh.append(tok)
+
+        tokens = old_tokens.spliced(first, end, fresh, shift, self._lexer.get_line_starts())
+        return tokens, first, len(fresh), shift, len(old_text) - suffix
+
+    def _shift_positions(self, statements: list, old_lines: LineStarts, new_lines: LineStarts,
+                         damage_end: int, shift: int):
+        # line and column of the nodes after the damaged region (damage_end is an offset in the old text)
+        damage_line = old_lines.position(damage_end)[0]
+        line_shift = len(new_lines) - len(old_lines)
+
+        for stmt in statements:
+            stack = [stmt.node]
+
+            while stack:
+                node = stack.pop()
+                if node is None:
+                    continue
+
+                if node.line > damage_line:
+                    node.line += line_shift
+                elif node.line == damage_line:
+                    node.line, node.index = new_lines.position(old_lines.offset(node.line, node.index) + shift)
+
+                stack.extend(node.children)
+
+    def _names_used(self, tokens: TokenStore, start: int) -> set:
+        identifier_kind = TokenStore.IDENTIFIER
+        indices = {index_in_table for kind, index_in_table in zip(tokens.kinds[start:], tokens.table_indices[start:])
+                   if kind == identifier_kind}
+        return {self._identifiers_table[index_in_table].name for index_in_table in indices}
+
+    def _same_state(self, expected: dict, parsed: list, names: set) -> bool:
+        # can the old statements that follow be parsed in the current state as they were parsed before?
+        # only the variables with the names used in them matter
+        touched = set(expected)
+        state_before = {}
+
+        for stmt in parsed:
+            for index_in_table, appended, before, after in stmt.changes:
+                if appended:
+                    if after[1] == 0 and self._identifiers_table[index_in_table].name in names:
+                        # a new variable of the outer block, the old statements do not know it
+                        return False
+                else:
+                    touched.add(index_in_table)
+                    state_before.setdefault(index_in_table, before)
+
+        for index_in_table in touched:
+            if self._identifiers_table[index_in_table].name not in names:
+                continue
+
+            old_state = expected[index_in_table] if index_in_table in expected else state_before[index_in_table]
+            if self._visible_state(self._ident_state(index_in_table)) != self._visible_state(old_state):
+                return False
+
+        return True
+
+    @staticmethod
+    def _block_shifts(old_blocks: list, new_blocks: list) -> list:
+        # how much the numbers of the blocks on every level change if the parsing goes on from new_blocks
+        size = max(len(old_blocks), len(new_blocks))
+        old_blocks = old_blocks + [0] * (size - len(old_blocks))
+        new_blocks = new_blocks + [0] * (size - len(new_blocks))
+        return [new - old for old, new in zip(old_blocks, new_blocks)]
+
+    @staticmethod
+    def _shift_blocks(blocks: list, old_base: list, new_base: list) -> list:
+        shifts = IncrementalCompiler._block_shifts(old_base, new_base)
+        blocks = blocks + [0] * (len(shifts) - len(blocks))
+        return [num + shifts[level] if level < len(shifts) else num for level, num in enumerate(blocks)]
+
+    def _reuse(self, statements: list, blocks: list, token_shift: int):
+        # the old statements go on after the new ones: move them and number their blocks after the new blocks
+        old_base = statements[0].blocks_before
+        shifts = IncrementalCompiler._block_shifts(old_base, blocks)
+        # deeper blocks were not met before the statements, their numbers do not change
+        shifts += [0] * (max((after[1] for stmt in statements for _, _, _, after in stmt.changes), default=0) + 1
+                         - len(shifts))
+
+        for stmt in statements:
+            stmt.first_token += token_shift
+            stmt.end_token += token_shift
+            stmt.blocks_before = self._shift_blocks(stmt.blocks_before, old_base, blocks)
+
+            if any(shifts):
+                stmt.changes = [
+                    (index_in_table, appended, before,
+                     (after[0], after[1], after[2] + shifts[after[1]]) if after[1] > 0 else after)
+                    for index_in_table, appended, before, after in stmt.changes
+                ]
+
+        self._redo(statements)
+
+    def _rollback(self, parsed: list, old_statements: list):
+        self._undo(parsed)
+        self._unused_idents += sum(1 for stmt in parsed for change in stmt.changes if change[1])
+        self._redo(old_statements)
+
+    def _check_semantic(self, node: Parser.Node) -> Optional[SemanticAnalyzer.SemanticError]:
+        try:
+            self._analyzer.check_statement(node)
+        except SemanticAnalyzer.SemanticError as err:
+            return err
+        return None
+
+    def recompile(self, text: str) -> bool:
+        """Compile the new text of the program. Errors are printed like a full compilation prints them,
+        but the compiler keeps the last successfully parsed state. Returns True if there are no errors."""
+        self.stats = None
+        if self._unused_idents > IncrementalCompiler.MAX_UNUSED_IDENTS:
+            self._reset()
+
+        try:
+            tokens, first_changed, num_fresh, shift, damage_end = self._relex(text)
+        except Lexer.LexerError as err:
+            print(f"LEXER ERROR:\n\t{err.message} ({err.line}:{err.index})")
+            return False
+
+        old_statements = self._statements
+        token_shift = len(tokens) - len(self._tokens)
+
+        # the first statement that looks at a changed token
+        k = bisect_left([stmt.end_token for stmt in old_statements], first_changed)
+        old_first_tokens = [stmt.first_token for stmt in old_statements]
+
+        self._undo(old_statements[k:])
+        self._parser.reset_scopes()
+
+        token_index = old_statements[k].first_token if k < len(old_statements) else 0
+        blocks = list(old_statements[k].blocks_before) if k < len(old_statements) else [1]
+        parsed = []
+        reused_from = len(old_statements)
+
+        # states of the variables before the candidate statement in the old parsing, relative to the state before k
+        expected = {}
+        expected_up_to = k
+        names = None  # the names used after the first statement that may be reused
+
+        self._parser.set_tokens(tokens)
+
+        while tokens.has(token_index):
+            if token_index >= first_changed + num_fresh:
+                j = bisect_left(old_first_tokens, token_index - token_shift, k)
+
+                if j < len(old_statements) and old_first_tokens[j] == token_index - token_shift:
+                    for stmt in old_statements[expected_up_to:j]:
+                        for index_in_table, appended, _, after in stmt.changes:
+                            if not appended or after[1] == 0:
+                                expected[index_in_table] = after
+                    expected_up_to = j
+
+                    if names is None:
+                        names = self._names_used(tokens, token_index)
+
+                    if self._same_state(expected, parsed, names):
+                        reused_from = j
+                        break
+
+            journal = []
+            stmt = IncrementalCompiler.Statement(None, token_index, token_index, list(blocks), [], None)
+
+            try:
+                stmt.node, token_index = self._parser.parse_top_level_statement(token_index, blocks, journal)
+            except BaseException as err:
+                # go back to the last good state
+                stmt.changes = [(index_in_table, appended, (tp, nest_level, block_on_level), None)
+                                for index_in_table, appended, tp, nest_level, block_on_level in journal]
+                self._rollback(parsed + [stmt], old_statements[k:])
+
+                if not isinstance(err, Parser.ParserError):
+                    raise
+                print(f"PARSER ERROR:\n{err}")
+                return False
+
+            stmt.end_token = token_index
+            stmt.changes = [(index_in_table, appended, (tp, nest_level, block_on_level), self._ident_state(index_in_table))
+                            for index_in_table, appended, tp, nest_level, block_on_level in journal]
+            parsed.append(stmt)
+
+        reused = old_statements[reused_from:]
+        if reused:
+            blocks_after = self._shift_blocks(self._blocks_after, reused[0].blocks_before, blocks)
+            self._reuse(reused, blocks, token_shift)
+            self._shift_positions(reused, self._tokens.get_lines(), tokens.get_lines(), damage_end, shift)
+        else:
+            blocks_after = blocks
+
+        for stmt in old_statements[k:reused_from]:
+            self._unused_idents += sum(1 for change in stmt.changes if change[1])
+
+        rechecked = 0
+        for stmt in parsed:
+            stmt.error = self._check_semantic(stmt.node)
+            rechecked += 1
+        for stmt in reused:
+            if stmt.error is not None:
+                # the position in the message may have changed
+                stmt.error = self._check_semantic(stmt.node)
+                rechecked += 1
+
+        self._text = text
+        self._tokens = tokens
+        self._statements = old_statements[:k] + parsed + reused
+        self._blocks_after = blocks_after
+
+        if len(tokens) == 0:
+            self._syntax_tree = None
+        else:
+            self._syntax_tree = Parser.Node(self.get_parser_nodes(), self.get_parser_nodes().index("program"))
+            self._syntax_tree.children = tuple(stmt.node for stmt in self._statements)
+
+        self.stats = {
+            "tokens": len(tokens),
+            "relexed_tokens": num_fresh,
+            "statements": len(self._statements),
+            "reparsed_statements": len(parsed),
+            "rechecked_statements": rechecked,
+        }
+
+        for stmt in self._statements:
+            if stmt.error is not None:
+                print(f"SEMANTIC ERROR:\n{stmt.error}")
+                return False
+
+        return True
@@ -1,12 +1,17 @@
+import operator
+from typing import Optional
+
+from flat_array import FlatArray
+from program_input import ProgramInput
+from program_output import ProgramOutput
 from working_with_syntax_tree import WorkingWithSyntaxTree
 from parser import Parser
 from constant import Constant
+from node_kind import NodeKind
+from symbol_table import SymbolTable
 
 
 class Interpreter(WorkingWithSyntaxTree):
-    class Break(Exception):
-        pass
-
     class RuntimeError(Exception):
         def __init__(self, message: str, line: int, index: int):
             self.message = message
@@ -17,26 +22,187 @@ class Interpreter(WorkingWithSyntaxTree):
         def __str__(self) -> str:
             return f"{self.message} ({self.line}:{self.index})"
 
-    def __init__(self, parser_nodes: list, operators: list, identifiers: list, keywords: list,
-                 consts: list, syntax_tree):
+    _BINARY_OPERATIONS = {
+        NodeKind.OP_DIV: operator.truediv,
+        NodeKind.OP_MOD: operator.mod,
+        NodeKind.OP_GT: operator.gt,
+        NodeKind.OP_LT: operator.lt,
+        NodeKind.OP_GE: operator.ge,
+        NodeKind.OP_LE: operator.le,
+        NodeKind.OP_EQ: operator.eq,
+        NodeKind.OP_NE: operator.ne,
+    }
+
+    # the statements a break leaves
+    _BREAKABLE = (NodeKind.KW_WHILE, NodeKind.KW_FOR, NodeKind.KW_SWITCH)
+
+    # expressions up to this height are evaluated by recursive calls, which is faster than the stacks
+    _MAX_RECURSIVE_HEIGHT = 200
+
+    def __init__(self, parser_nodes: SymbolTable, operators: SymbolTable, identifiers: SymbolTable,
+                 keywords: SymbolTable, consts: SymbolTable, syntax_tree, flat_arrays: bool = False,
+                 output: Optional[ProgramOutput] = None):
         super().__init__(parser_nodes, operators, identifiers, keywords, consts, syntax_tree)
 
-    def _compute_string_constant(self, str_const_node: Parser.Node) -> str:
-        str_to_print = str_const_node.value().value
-        return bytes(str_to_print, "utf-8").decode("unicode_escape")
+        # where the program prints, stdout if None
+        self._output = ProgramOutput() if output is None else output
+        # what the program reads, from stdin. The output is flushed before the program waits for the input
+        self._input = ProgramInput(self._output)
+
+        # the values of the variables, by the index in the idents table. The Variables of the table only
+        # describe the variables
+        self._frame = [None] * len(identifiers)
+
+        # (the element type, the sizes, the strides) of the arrays kept in flat buffers, by the index in the
+        # idents table. The parser lets an array be used only with all its indexes, so with flat_arrays all the
+        # arrays of int, double and bool are flat. An element of an array of strings has one more index, of
+        # a character. The buffers take less memory and are made at once, but CPython indexes lists of lists
+        # faster, so they are not the default
+        self._layouts = {}
+        for index, var in enumerate(identifiers if flat_arrays else ()):
+            if isinstance(var.type, list) and var.type[0] in FlatArray.TYPECODES:
+                sizes = var.type[1:]
+                self._layouts[index] = (var.type[0], sizes, FlatArray.strides(sizes))
+
+        # the method that runs a statement, by the kind of the node. A statement with inner statements returns
+        # an iterator over the statements to run
+        self._statement_runners = [self._run_unknown] * NodeKind.COUNT
+        for kind, runner in (
+            (NodeKind.PROGRAM, self._run_compound_statement),
+            (NodeKind.COMPOUND_STATEMENT, self._run_compound_statement),
+            (NodeKind.KW_PRINT, self._run_print),
+            (NodeKind.DECLARE, self._run_declare),
+            (NodeKind.OP_ASSIGN, self._run_assignment),
+            (NodeKind.KW_IF, self._run_if),
+            (NodeKind.KW_WHILE, self._run_while),
+            (NodeKind.KW_FOR, self._run_for),
+            (NodeKind.KW_SWITCH, self._run_switch),
+            (NodeKind.KW_CASE, self._run_case_or_default),
+            (NodeKind.KW_DEFAULT, self._run_case_or_default),
+        ):
+            self._statement_runners[kind] = runner
+
+        # the method that computes the value of an expression node, by the kind of the node
+        self._runners = [self._run_unknown] * NodeKind.COUNT
+        for kind, runner in (
+            (NodeKind.INDEXATION, self._run_indexation),
+            (NodeKind.INDEXATION_IN_BOUNDS, self._run_indexation_in_bounds),
+            (NodeKind.CONST_STRING, self._run_constant),
+            (NodeKind.CONST_INT, self._run_constant),
+            (NodeKind.CONST_DOUBLE, self._run_constant),
+            (NodeKind.KW_TRUE, self._run_bool_literal),
+            (NodeKind.KW_FALSE, self._run_bool_literal),
+            (NodeKind.IDENTIFIER, self._run_identifier),
+            (NodeKind.KW_TO_STRING, self._run_to_string),
+            (NodeKind.KW_ATOI, self._run_atoi),
+            (NodeKind.KW_ATOF, self._run_atof),
+            (NodeKind.KW_ATOB, self._run_atob),
+            (NodeKind.KW_SCAN, self._run_scan),
+            (NodeKind.KW_SCAN_INT, self._run_scan_int),
+            (NodeKind.KW_SCAN_DOUBLE, self._run_scan_double),
+            (NodeKind.KW_SCAN_WORD, self._run_scan_word),
+            (NodeKind.OP_ADD, self._run_add),
+            (NodeKind.OP_SUB, self._run_sub),
+            (NodeKind.OP_MUL, self._run_mul),
+            (NodeKind.OP_DIV, self._run_div),
+            (NodeKind.OP_MOD, self._run_mod),
+            (NodeKind.OP_AND, self._run_and),
+            (NodeKind.OP_OR, self._run_or),
+            (NodeKind.OP_NOT, self._run_not),
+            (NodeKind.OP_GT, self._run_gt),
+            (NodeKind.OP_LT, self._run_lt),
+            (NodeKind.OP_GE, self._run_ge),
+            (NodeKind.OP_LE, self._run_le),
+            (NodeKind.OP_EQ, self._run_eq),
+            (NodeKind.OP_NE, self._run_ne),
+        ):
+            self._runners[kind] = runner
+
+        # whether an expression is higher than _MAX_RECURSIVE_HEIGHT, by the id of the node
+        self._is_deep = {}
+
+        # the entries of a switch, by the id of the node. The cases are constants, so the entries are found once
+        self._jump_tables = {}
+
+        # the method that starts the evaluation of an expression node, by the kind of the node. It pushes the value
+        # of the node, or the node waiting for its operands and the operands to evaluate before it
+        self._starts = [self._start_unknown] * NodeKind.COUNT
+        for kind, start in (
+            (NodeKind.CONST_STRING, self._start_constant),
+            (NodeKind.CONST_INT, self._start_constant),
+            (NodeKind.CONST_DOUBLE, self._start_constant),
+            (NodeKind.KW_TRUE, self._start_bool_literal),
+            (NodeKind.KW_FALSE, self._start_bool_literal),
+            (NodeKind.IDENTIFIER, self._start_identifier),
+            (NodeKind.KW_SCAN, self._start_scan),
+            (NodeKind.KW_SCAN_INT, self._start_scan),
+            (NodeKind.KW_SCAN_DOUBLE, self._start_scan),
+            (NodeKind.KW_SCAN_WORD, self._start_scan),
+            (NodeKind.INDEXATION, self._start_indexation),
+            (NodeKind.INDEXATION_IN_BOUNDS, self._start_indexation),
+            (NodeKind.OP_AND, self._start_short_circuit),
+            (NodeKind.OP_OR, self._start_short_circuit),
+        ):
+            self._starts[kind] = start
+        for kind in (NodeKind.OP_ADD, NodeKind.OP_SUB, NodeKind.OP_MUL, NodeKind.OP_DIV, NodeKind.OP_MOD,
+                     NodeKind.OP_NOT, NodeKind.OP_GT, NodeKind.OP_LT, NodeKind.OP_GE, NodeKind.OP_LE,
+                     NodeKind.OP_EQ, NodeKind.OP_NE,
+                     NodeKind.KW_TO_STRING, NodeKind.KW_ATOI, NodeKind.KW_ATOF, NodeKind.KW_ATOB):
+            self._starts[kind] = self._start_operation
+
+        # the method that continues the evaluation of a node when the values of its operands are computed
+        self._continuations = [None] * NodeKind.COUNT
+        for kind, continuation in (
+            (NodeKind.INDEXATION, self._continue_indexation),
+            (NodeKind.INDEXATION_IN_BOUNDS, self._continue_indexation),
+            (NodeKind.KW_TO_STRING, self._finish_to_string),
+            (NodeKind.KW_ATOI, self._finish_atoi),
+            (NodeKind.KW_ATOF, self._finish_atof),
+            (NodeKind.KW_ATOB, self._finish_atob),
+            (NodeKind.OP_ADD, self._finish_add),
+            (NodeKind.OP_SUB, self._finish_sub),
+            (NodeKind.OP_MUL, self._finish_mul),
+            (NodeKind.OP_AND, self._continue_and),
+            (NodeKind.OP_OR, self._continue_or),
+            (NodeKind.OP_NOT, self._finish_not),
+        ):
+            self._continuations[kind] = continuation
+        for kind in Interpreter._BINARY_OPERATIONS:
+            self._continuations[kind] = self._finish_binary_operation
 
     def _run_print(self, print_node: Parser.Node):
-        print(self._interpret_node(print_node.children[0]), end='')
+        self._output.write(self._evaluate(print_node.children[0]))
 
     def _run_assignment(self, assignment_node: Parser.Node):
         left_node = assignment_node.children[0]
         value_node = assignment_node.children[1]
-        value = self._interpret_node(value_node)
-
-        if not self._is_parser_node(left_node, "indexation"):
-            self._idents_tbl[left_node.index_in_table].value = value
+        value = self._evaluate(value_node)
+
+        if left_node.kind == NodeKind.IDENTIFIER:
+            self._frame[left_node.index_in_table] = value
+        elif left_node.children[0].index_in_table in self._layouts:
+            children = left_node.children
+            slot = children[0].index_in_table
+            sizes, strides = self._layouts[slot][1:]
+
+            offset = 0
+            for index_node, size, stride in zip(children[1:], sizes, strides):
+                idx = self._evaluate(index_node)
+                if left_node.kind == NodeKind.INDEXATION:
+                    idx = FlatArray.in_range(idx, size)
+                    if idx is None:
+                        raise Interpreter.RuntimeError("index out of range", left_node.line, left_node.index)
+                offset += idx * stride
+            self._frame[slot] = FlatArray.store(self._frame[slot], offset, value)
+        elif left_node.kind == NodeKind.INDEXATION_IN_BOUNDS:
+            # the element exists, so it is set without the checks
+            children = left_node.children
+            arr_to_assign = self._frame[children[0].index_in_table]
+            for i in range(1, len(children) - 1):
+                arr_to_assign = arr_to_assign[self._evaluate(children[i])]
+            arr_to_assign[self._evaluate(children[-1])] = value
         else:
-            arr_to_assign = self._idents_tbl[left_node.children[0].index_in_table].value
+            arr_to_assign = self._frame[left_node.children[0].index_in_table]
             initial_arr = arr_to_assign
             # print(initial_arr)
 
@@ -51,7 +217,7 @@ class Interpreter(WorkingWithSyntaxTree):
                     for i in range(len(index_nodes)):
                         # print(initial_arr)
 
-                        idx = self._interpret_node(index_nodes[i])
+                        idx = self._evaluate(index_nodes[i])
 
                         if i == len(index_nodes) - 1:
                             # print(initial_arr)
@@ -64,19 +230,18 @@ class Interpreter(WorkingWithSyntaxTree):
                     # this is a string
                     if len(index_nodes) - 1 > 0:
                         for i in range(len(index_nodes) - 1):
-                            idx = self._interpret_node(index_nodes[i])
+                            idx = self._evaluate(index_nodes[i])
 
                             if i == len(index_nodes) - 2:
-                                idx2 = self._interpret_node(index_nodes[i + 1])
-                                arr_to_assign[idx] = arr_to_assign[idx][:idx2] + value + arr_to_assign[idx][(idx2 + 1):]
+                                idx2 = self._evaluate(index_nodes[i + 1])
+                                arr_to_assign[idx] = Interpreter._set_char(arr_to_assign[idx], idx2, value)
                             else:
                                 arr_to_assign = arr_to_assign[idx]
                     else:
-                        idx = self._interpret_node(index_nodes[0])
+                        idx = self._evaluate(index_nodes[0])
 
-                        initial_value = self._idents_tbl[left_node.children[0].index_in_table].value
-                        self._idents_tbl[left_node.children[0].index_in_table].value = \
-                            initial_value[:idx] + value + initial_value[(idx + 1):]
+                        self._frame[left_node.children[0].index_in_table] = \
+                            Interpreter._set_char(self._frame[left_node.children[0].index_in_table], idx, value)
 
             except IndexError:
                 raise Interpreter.RuntimeError("index out of range", left_node.line, left_node.index)
@@ -103,40 +268,44 @@ class Interpreter(WorkingWithSyntaxTree):
         return ret
         # return [self._create_array(sizes[1:], default_value)] * sizes[0]
 
+    def _new_array_of(self, index: int):
+        """A new array for the variable with the index in the idents table."""
+        var_type = self._idents_tbl[index].type
+        default_value = self._get_default_value(var_type[0])
+
+        if index in self._layouts:
+            return FlatArray.new(var_type[0], var_type[1:], default_value)
+        return self._create_array(var_type[1:], default_value)
+
     def _run_declare(self, decl_node: Parser.Node):
         for curr_var_node in decl_node.children:
-            if self._is_operator(curr_var_node, '='):
+            if curr_var_node.kind == NodeKind.OP_ASSIGN:
                 self._run_assignment(curr_var_node)
             else:
                 var_type = curr_var_node.value().type
 
                 if not isinstance(var_type, list):
-                    self._idents_tbl[curr_var_node.index_in_table].value = self._get_default_value(var_type)
+                    self._frame[curr_var_node.index_in_table] = self._get_default_value(var_type)
                 else:
                     # this is an array
-                    default_value = self._get_default_value(var_type[0])
-                    self._idents_tbl[curr_var_node.index_in_table].value = \
-                        self._create_array(var_type[1:], default_value)
+                    self._frame[curr_var_node.index_in_table] = self._new_array_of(curr_var_node.index_in_table)
 
     def _run_if(self, if_node: Parser.Node):
         cond_node = if_node.children[0]
         stmt_if_yes = if_node.children[1]
         stmt_if_no = None if len(if_node.children) < 3 else if_node.children[2]
 
-        if self._interpret_node(cond_node):
-            self._interpret_node(stmt_if_yes)
+        if self._evaluate(cond_node):
+            return iter((stmt_if_yes,))
         elif stmt_if_no is not None:
-            self._interpret_node(stmt_if_no)
+            return iter((stmt_if_no,))
 
     def _run_while(self, while_node: Parser.Node):
         cond_node = while_node.children[0]
         body_node = while_node.children[1]
 
-        while self._interpret_node(cond_node):
-            try:
-                self._interpret_node(body_node)
-            except Interpreter.Break:
-                break
+        while self._evaluate(cond_node):
+            yield body_node
 
     def _run_for(self, for_node: Parser.Node):
         init_node = for_node.children[0]
@@ -145,183 +314,548 @@ class Interpreter(WorkingWithSyntaxTree):
         body_node = for_node.children[3]
 
         if init_node is not None:
-            self._interpret_node(init_node)
+            self._run_assignment(init_node)
 
-        while cond_node is None or self._interpret_node(cond_node):
-            try:
-                self._interpret_node(body_node)
-            except Interpreter.Break:
-                break
+        while cond_node is None or self._evaluate(cond_node):
+            yield body_node
 
             if incr_node is not None:
-                self._interpret_node(incr_node)
+                self._run_assignment(incr_node)
 
     def _find_all_cases_and_default(self, node: Parser.Node, ret: list):
         if node is None:
             return
 
-        children_len = len(node.children)
+        # the statements are searched in preorder, the blocks waiting for the end of their inner blocks are
+        # on a stack with the index of the statement to continue from
+        stack = []
+        children = node.children
+        i = 0
+
+        while True:
+            if i == len(children):
+                if not stack:
+                    return
+                node, i = stack.pop()
+                children = node.children
+                continue
+
+            stmt = children[i]
+            i += 1
+            if stmt is None:
+                continue
+
+            kind = stmt.kind
+            if kind == NodeKind.KW_CASE or kind == NodeKind.KW_DEFAULT:
+                ret.append((stmt, node, i - 1))
+            elif kind != NodeKind.KW_SWITCH and stmt.children:
+                stack.append((node, i))
+                node = stmt
+                children = stmt.children
+                i = 0
+
+    def _jump_table(self, switch_node: Parser.Node) -> tuple:
+        """The entries of the switch: a dict from the value of each case to the (parent, index) of the first
+        case with that value, and the (parent, index) of the default or None."""
+        labels = []
+        self._find_all_cases_and_default(switch_node.children[1], labels)
+
+        cases = {}
+        default = None
+        for label, parent, idx in labels:
+            if label.kind == NodeKind.KW_DEFAULT:
+                default = (parent, idx)
+            else:
+                cases.setdefault(self._evaluate(label.children[0]), (parent, idx))
 
-        for i in range(children_len):
-            stmt = node.children[i]
-            if self._is_keyword(stmt, ("case", "default")):
-                ret.append((stmt, node, i))
-            elif not self._is_keyword(stmt, "switch"):
-                self._find_all_cases_and_default(stmt, ret)
+        return cases, default
 
     def _run_switch(self, switch_node: Parser.Node):
-        check_var_node = switch_node.children[0]
-        statement_node = switch_node.children[1]
+        var_val = self._evaluate(switch_node.children[0])
 
-        var_val = self._interpret_node(check_var_node)
-        cases_and_default = []
-        self._find_all_cases_and_default(statement_node, cases_and_default)
+        table = self._jump_tables.get(id(switch_node))
+        if table is None:
+            table = self._jump_table(switch_node)
+            self._jump_tables[id(switch_node)] = table
 
-        if len(cases_and_default) == 0:
+        cases, default = table
+        entry = cases.get(var_val, default)
+        if entry is None:
             return
 
-        default_info = None
-        needed_node_info = None
+        parent, idx = entry
+        return iter(parent.children[idx:])
 
-        for node_info in cases_and_default:
-            if self._is_keyword(node_info[0], "default"):
-                default_info = node_info
-            else:
-                if var_val == self._interpret_node(node_info[0].children[0]):
-                    needed_node_info = node_info
-                    break
+    def _run_compound_statement(self, node: Parser.Node):
+        return iter(node.children)
 
-        if default_info is None and needed_node_info is None:
-            return
-        if needed_node_info is None and default_info is not None:
-            needed_node_info = default_info
+    def _run_case_or_default(self, node: Parser.Node):
+        return
 
-        parent, idx = needed_node_info[1], needed_node_info[2]
+    def _run_unknown(self, node: Parser.Node):
+        raise Interpreter.RuntimeError("unknown node", node.line, node.index)
 
-        for i in range(idx, len(parent.children)):
-            try:
-                self._interpret_node(parent.children[i])
-            except Interpreter.Break:
-                break
+    @staticmethod
+    def _to_string(value) -> str:
+        ret = str(value)
+        if ret == "True":
+            return "true"
+        if ret == "False":
+            return "false"
+        return ret
 
-    def _run_compound_statement(self, node: Parser.Node):
-        for stmt_node in node.children:
-            self._interpret_node(stmt_node)
+    @staticmethod
+    def _atoi(node: Parser.Node, value) -> int:
+        try:
+            return int(value)
+        except ValueError:
+            raise Interpreter.RuntimeError("input is not convertible to int", node.line, node.index)
+
+    @staticmethod
+    def _atof(node: Parser.Node, value) -> float:
+        try:
+            return float(value)
+        except ValueError:
+            raise Interpreter.RuntimeError("input is not convertible to double", node.line, node.index)
+
+    @staticmethod
+    def _atob(node: Parser.Node, value) -> bool:
+        try:
+            return bool(value)
+        except ValueError:
+            raise Interpreter.RuntimeError("input is not convertible to bool", node.line, node.index)
+
+    @staticmethod
+    def _set_char(chars, idx: int, value: str) -> list:
+        """Puts the value in place of the character idx, as chars[:idx] + value + chars[(idx + 1):] would, and
+        returns the characters. A string is made a list of its characters, which is then changed in place, so
+        a string written by characters is not copied for every one. It is made a string again when it is
+        read whole."""
+        if chars.__class__ is str:
+            chars = list(chars)
+
+        if idx == -1:
+            # chars[0:] is all the characters
+            chars[:] = chars[:-1] + list(value) + chars
+        else:
+            chars[idx:idx + 1] = value
+        return chars
+
+    def _written_by_characters(self) -> set:
+        """The indexes in the idents table of the strings and the arrays of strings a character of which is
+        assigned. Only they can be lists of characters, see _set_char."""
+        ret = set()
+
+        stack = [self._syntax_tree]
+        while stack:
+            node = stack.pop()
+            if node is None:
+                # a missing part of a for
+                continue
+
+            if node.kind == NodeKind.OP_ASSIGN and node.children[0].kind == NodeKind.INDEXATION:
+                left_node = node.children[0]
+                var_type = left_node.children[0].value().type
+                if var_type == "string" or isinstance(var_type, list) and var_type[0] == "string" and \
+                        len(left_node.children) > len(var_type):
+                    ret.add(left_node.children[0].index_in_table)
+            stack.extend(node.children)
+
+        return ret
+
+    def _is_string_element(self, indexation: Parser.Node) -> bool:
+        """Whether the indexation is a whole element of an array of strings, not a character."""
+        var_type = indexation.children[0].value().type
+        return isinstance(var_type, list) and var_type[0] == "string" and len(indexation.children) == len(var_type)
+
+    @staticmethod
+    def _index(value, idx: int, index_node: Parser.Node):
+        try:
+            return value[idx]
+        except IndexError:
+            raise Interpreter.RuntimeError("array index out of range", index_node.line, index_node.index)
+
+    @staticmethod
+    def _add_all(operands: list):
+        if isinstance(operands[0], str):
+            return "".join(operands)
+
+        ret = operands[0]
+        for i in range(1, len(operands)):
+            ret = ret + operands[i]
+        return ret
+
+    @staticmethod
+    def _multiply_all(operands: list):
+        ret = operands[0]
+        for i in range(1, len(operands)):
+            ret = ret * operands[i]
+        return ret
+
+    @staticmethod
+    def _element(buffer, offset: int, elem_type: str):
+        value = buffer[offset]
+        if elem_type == "bool":
+            # the buffer has the bools as numbers
+            return value != 0
+        return value
 
     def _run_indexation(self, node: Parser.Node):
-        val = self._idents_tbl[node.children[0].index_in_table].value
+        layout = self._layouts.get(node.children[0].index_in_table)
+        if layout is not None:
+            elem_type, sizes, strides = layout
+            offset = 0
+            for index_node, size, stride in zip(node.children[1:], sizes, strides):
+                idx = FlatArray.in_range(self._interpret_node(index_node), size)
+                if idx is None:
+                    raise Interpreter.RuntimeError("array index out of range", index_node.line, index_node.index)
+                offset += idx * stride
+            return Interpreter._element(self._frame[node.children[0].index_in_table], offset, elem_type)
+
+        val = self._frame[node.children[0].index_in_table]
 
         for index_node in node.children[1:]:
+            container = val
             idx = self._interpret_node(index_node)
-            try:
-                val = val[idx]
-            except IndexError:
-                raise Interpreter.RuntimeError("array index out of range", index_node.line, index_node.index)
+            val = Interpreter._index(container, idx, index_node)
+
+        if val.__class__ is list:
+            # an element of an array of strings written by characters, see _set_char
+            val = container[idx] = "".join(val)
+        return val
 
+    def _run_indexation_in_bounds(self, node: Parser.Node):
+        children = node.children
+        layout = self._layouts.get(children[0].index_in_table)
+        if layout is not None:
+            elem_type, _, strides = layout
+            offset = 0
+            for i in range(1, len(children)):
+                offset += self._interpret_node(children[i]) * strides[i - 1]
+            return Interpreter._element(self._frame[children[0].index_in_table], offset, elem_type)
+
+        val = self._frame[children[0].index_in_table]
+
+        for i in range(1, len(children)):
+            container = val
+            idx = self._interpret_node(children[i])
+            val = container[idx]
+
+        if val.__class__ is list:
+            # an element of an array of strings written by characters, see _set_char
+            val = container[idx] = "".join(val)
         return val
 
+    def _run_constant(self, node: Parser.Node):
+        # the value is converted from the text of the constant by the lexer
+        const = node.value()
+        if const.convertible:
+            return const.runtime_value
+        return Constant.convert(const.value, const.type)
+
+    def _run_bool_literal(self, node: Parser.Node) -> bool:
+        return node.kind == NodeKind.KW_TRUE
+
+    def _run_identifier(self, node: Parser.Node):
+        value = self._frame[node.index_in_table]
+        if value.__class__ is list:
+            # a string written by characters, see _set_char
+            value = self._frame[node.index_in_table] = "".join(value)
+        return value
+
+    def _run_to_string(self, node: Parser.Node) -> str:
+        return Interpreter._to_string(self._interpret_node(node.children[0]))
+
+    def _run_atoi(self, node: Parser.Node) -> int:
+        return Interpreter._atoi(node, self._interpret_node(node.children[0]))
+
+    def _run_atof(self, node: Parser.Node) -> float:
+        return Interpreter._atof(node, self._interpret_node(node.children[0]))
+
+    def _run_atob(self, node: Parser.Node) -> bool:
+        return Interpreter._atob(node, self._interpret_node(node.children[0]))
+
+    def _run_scan(self, node: Parser.Node) -> str:
+        return self._input.read_line()
+
+    def _run_scan_int(self, node: Parser.Node) -> int:
+        # the word is converted from its bytes, without a string made of it
+        return Interpreter._atoi(node, self._input.read_token())
+
+    def _run_scan_double(self, node: Parser.Node) -> float:
+        return Interpreter._atof(node, self._input.read_token())
+
+    def _run_scan_word(self, node: Parser.Node) -> str:
+        return self._input.read_word()
+
+    def _run_add(self, node: Parser.Node):
+        children = node.children
+        if len(children) == 2:
+            return self._interpret_node(children[0]) + self._interpret_node(children[1])
+        if len(children) == 1:
+            return self._interpret_node(children[0])
+        return Interpreter._add_all([self._interpret_node(child) for child in children])
+
+    def _run_sub(self, node: Parser.Node):
+        if len(node.children) < 2:
+            return -self._interpret_node(node.children[0])
+        return self._interpret_node(node.children[0]) - self._interpret_node(node.children[1])
+
+    def _run_mul(self, node: Parser.Node):
+        children = node.children
+        if len(children) == 2:
+            return self._interpret_node(children[0]) * self._interpret_node(children[1])
+        return Interpreter._multiply_all([self._interpret_node(child) for child in children])
+
+    def _run_div(self, node: Parser.Node):
+        return self._interpret_node(node.children[0]) / self._interpret_node(node.children[1])
+
+    def _run_mod(self, node: Parser.Node):
+        return self._interpret_node(node.children[0]) % self._interpret_node(node.children[1])
+
+    def _run_and(self, node: Parser.Node):
+        for child in node.children:
+            value = self._interpret_node(child)
+            if not value:
+                return value
+        return value
+
+    def _run_or(self, node: Parser.Node):
+        for child in node.children:
+            value = self._interpret_node(child)
+            if value:
+                return value
+        return value
+
+    def _run_not(self, node: Parser.Node) -> bool:
+        return not self._interpret_node(node.children[0])
+
+    def _run_gt(self, node: Parser.Node) -> bool:
+        return self._interpret_node(node.children[0]) > self._interpret_node(node.children[1])
+
+    def _run_lt(self, node: Parser.Node) -> bool:
+        return self._interpret_node(node.children[0]) < self._interpret_node(node.children[1])
+
+    def _run_ge(self, node: Parser.Node) -> bool:
+        return self._interpret_node(node.children[0]) >= self._interpret_node(node.children[1])
+
+    def _run_le(self, node: Parser.Node) -> bool:
+        return self._interpret_node(node.children[0]) <= self._interpret_node(node.children[1])
+
+    def _run_eq(self, node: Parser.Node) -> bool:
+        return self._interpret_node(node.children[0]) == self._interpret_node(node.children[1])
+
+    def _run_ne(self, node: Parser.Node) -> bool:
+        return self._interpret_node(node.children[0]) != self._interpret_node(node.children[1])
+
     def _interpret_node(self, node: Parser.Node):
-        if node.table is self._parser_nodes_tbl and node.value() == "program":
-            for stmt_node in node.children:
-                self._interpret_node(stmt_node)
-        elif node.table is self._parser_nodes_tbl and node.value() == "compound_statement":
-            self._run_compound_statement(node)
-        elif self._is_keyword(node, "print"):
-            self._run_print(node)
-        elif node.table is self._parser_nodes_tbl and node.value() == "declare":
-            self._run_declare(node)
-        elif self._is_parser_node(node, "indexation"):
-            return self._run_indexation(node)
-        elif self._is_operator(node, '='):
-            self._run_assignment(node)
-        elif self._is_string_constant(node):
-            return self._compute_string_constant(node)
-        elif self._is_constant_of_type(node, Constant.INT):
-            return int(node.value().value)
-        elif self._is_constant_of_type(node, Constant.DOUBLE):
-            return float(node.value().value)
-        elif self._is_keyword(node, ("true", "false")):
-            return node.value() == "true"
-        elif self._is_identifier(node):
-            return node.value().value
-        elif self._is_keyword(node, "to_string"):
-            ret = str(self._interpret_node(node.children[0]))
-            if ret == "True":
-                return "true"
-            if ret == "False":
-                return "false"
-            return ret
-        elif self._is_keyword(node, "atoi"):
-            try:
-                return int(self._interpret_node(node.children[0]))
-            except ValueError:
-                raise Interpreter.RuntimeError("input is not convertible to int", node.line, node.index)
-        elif self._is_keyword(node, "atof"):
-            try:
-                return float(self._interpret_node(node.children[0]))
-            except ValueError:
-                raise Interpreter.RuntimeError("input is not convertible to double", node.line, node.index)
-        elif self._is_keyword(node, "atob"):
-            try:
-                return bool(self._interpret_node(node.children[0]))
-            except ValueError:
-                raise Interpreter.RuntimeError("input is not convertible to bool", node.line, node.index)
-        elif self._is_keyword(node, "scan"):
-            return input()
-        elif self._is_operator(node, '+'):
-            if len(node.children) < 2:
-                return self._interpret_node(node.children[0])
+        return self._runners[node.kind](node)
+
+    # Expressions higher than _MAX_RECURSIVE_HEIGHT are evaluated with two stacks: the values computed, and
+    # the work: nodes to evaluate and (node, step) of the nodes waiting for the values of their operands. A node
+    # is started when it is taken from the work stack, and continued when the values of the operands it pushed
+    # before it are computed. An associative operator has all the operands of its chain, so a + b + c is not
+    # a deep tree.
+
+    def _start_constant(self, node: Parser.Node, work: list, values: list):
+        values.append(self._run_constant(node))
+
+    def _start_bool_literal(self, node: Parser.Node, work: list, values: list):
+        values.append(node.kind == NodeKind.KW_TRUE)
+
+    def _start_identifier(self, node: Parser.Node, work: list, values: list):
+        values.append(self._run_identifier(node))
+
+    def _start_scan(self, node: Parser.Node, work: list, values: list):
+        # the scans have no operands
+        values.append(self._runners[node.kind](node))
+
+    def _start_operation(self, node: Parser.Node, work: list, values: list):
+        # all the operands are evaluated, from left to right, then the node
+        work.append((node, 0))
+        work.extend(reversed(node.children))
+
+    def _start_short_circuit(self, node: Parser.Node, work: list, values: list):
+        work.append((node, 1))
+        work.append(node.children[0])
+
+    def _start_indexation(self, node: Parser.Node, work: list, values: list):
+        if node.children[0].index_in_table in self._layouts:
+            # the offset in the flat buffer, computed so far
+            values.append(0)
+        else:
+            values.append(self._frame[node.children[0].index_in_table])
+        work.append((node, 1))
+        work.append(node.children[1])
+
+    def _start_unknown(self, node: Parser.Node, work: list, values: list):
+        raise Interpreter.RuntimeError("unknown node", node.line, node.index)
+
+    def _continue_indexation(self, node: Parser.Node, step: int, work: list, values: list):
+        # the value indexed so far, or the offset, is under the value of the index number step
+        idx = values.pop()
+        layout = self._layouts.get(node.children[0].index_in_table)
+
+        if layout is None:
+            container = values[-1]
+            values[-1] = Interpreter._index(container, idx, node.children[step])
+            if step + 1 == len(node.children) and values[-1].__class__ is list:
+                # an element of an array of strings written by characters, see _set_char
+                values[-1] = container[idx] = "".join(values[-1])
+        else:
+            elem_type, sizes, strides = layout
+            if node.kind == NodeKind.INDEXATION:
+                idx = FlatArray.in_range(idx, sizes[step - 1])
+                if idx is None:
+                    index_node = node.children[step]
+                    raise Interpreter.RuntimeError("array index out of range", index_node.line, index_node.index)
+            values[-1] += idx * strides[step - 1]
+
+            if step + 1 == len(node.children):
+                buffer = self._frame[node.children[0].index_in_table]
+                values[-1] = Interpreter._element(buffer, values[-1], elem_type)
+
+        if step + 1 < len(node.children):
+            work.append((node, step + 1))
+            work.append(node.children[step + 1])
+
+    def _continue_and(self, node: Parser.Node, step: int, work: list, values: list):
+        # the value of the operand number step - 1 is on the top. the next one is evaluated only if it is true
+        if values[-1] and step < len(node.children):
+            values.pop()
+            work.append((node, step + 1))
+            work.append(node.children[step])
+
+    def _continue_or(self, node: Parser.Node, step: int, work: list, values: list):
+        if not values[-1] and step < len(node.children):
+            values.pop()
+            work.append((node, step + 1))
+            work.append(node.children[step])
+
+    def _finish_to_string(self, node: Parser.Node, step: int, work: list, values: list):
+        values[-1] = Interpreter._to_string(values[-1])
+
+    def _finish_atoi(self, node: Parser.Node, step: int, work: list, values: list):
+        values[-1] = Interpreter._atoi(node, values[-1])
+
+    def _finish_atof(self, node: Parser.Node, step: int, work: list, values: list):
+        values[-1] = Interpreter._atof(node, values[-1])
+
+    def _finish_atob(self, node: Parser.Node, step: int, work: list, values: list):
+        values[-1] = Interpreter._atob(node, values[-1])
+
+    def _finish_add(self, node: Parser.Node, step: int, work: list, values: list):
+        num_operands = len(node.children)
+        if num_operands < 2:
+            # a sign
+            return
+
+        operands = values[-num_operands:]
+        del values[-num_operands:]
+        values.append(Interpreter._add_all(operands))
+
+    def _finish_sub(self, node: Parser.Node, step: int, work: list, values: list):
+        if len(node.children) < 2:
+            values[-1] = -values[-1]
+            return
+
+        right = values.pop()
+        values[-1] = values[-1] - right
+
+    def _finish_mul(self, node: Parser.Node, step: int, work: list, values: list):
+        num_operands = len(node.children)
+        operands = values[-num_operands:]
+        del values[-num_operands:]
+        values.append(Interpreter._multiply_all(operands))
+
+    def _finish_not(self, node: Parser.Node, step: int, work: list, values: list):
+        values[-1] = not values[-1]
+
+    def _finish_binary_operation(self, node: Parser.Node, step: int, work: list, values: list):
+        right = values.pop()
+        values[-1] = Interpreter._BINARY_OPERATIONS[node.kind](values[-1], right)
+
+    def _is_deeper_than(self, expression: Parser.Node, height: int) -> bool:
+        stack = [(expression, 1)]
+        while stack:
+            node, depth = stack.pop()
+            if depth > height:
+                return True
+            for child in node.children:
+                stack.append((child, depth + 1))
+        return False
+
+    def _evaluate(self, expression: Parser.Node):
+        is_deep = self._is_deep.get(id(expression))
+        if is_deep is None:
+            is_deep = self._is_deeper_than(expression, Interpreter._MAX_RECURSIVE_HEIGHT)
+            self._is_deep[id(expression)] = is_deep
+
+        if is_deep:
+            return self._evaluate_with_stacks(expression)
+        return self._runners[expression.kind](expression)
+
+    def _evaluate_with_stacks(self, expression: Parser.Node):
+        starts = self._starts
+        continuations = self._continuations
+
+        values = []
+        work = [expression]
+
+        while work:
+            item = work.pop()
+            if item.__class__ is tuple:
+                node, step = item
+                continuations[node.kind](node, step, work, values)
+            else:
+                starts[item.kind](item, work, values)
+
+        return values[0]
+
+    def evaluate(self, expression: Parser.Node):
+        """The value of an expression. Used to compute the constant parts of the program before it runs."""
+        return self._evaluate(expression)
+
+    def _execute(self, statement: Parser.Node) -> bool:
+        """Runs the statement. Returns True if a break leaves it, the loop or the switch it leaves is outside."""
+        # The statements with inner statements return iterators over the statements to run. The iterators
+        # wait on a stack, with the flag telling whether a break leaves them, so the nesting is not limited.
+        runners = self._statement_runners
+        running = []
+
+        while True:
+            kind = statement.kind
+
+            if kind == NodeKind.KW_BREAK:
+                # leave everything up to the innermost loop or switch
+                while running:
+                    if running.pop()[1]:
+                        break
+                else:
+                    return True
             else:
-                return self._interpret_node(node.children[0]) + self._interpret_node(node.children[1])
-        elif self._is_operator(node, '-'):
-            if len(node.children) < 2:
-                return -self._interpret_node(node.children[0])
+                inner = runners[kind](statement)
+                if inner is not None:
+                    running.append((inner, kind in Interpreter._BREAKABLE))
+
+            while running:
+                statement = next(running[-1][0], None)
+                if statement is not None:
+                    break
+                running.pop()
             else:
-                return self._interpret_node(node.children[0]) - self._interpret_node(node.children[1])
-        elif self._is_operator(node, '*'):
-            return self._interpret_node(node.children[0]) * self._interpret_node(node.children[1])
-        elif self._is_operator(node, '/'):
-            return self._interpret_node(node.children[0]) / self._interpret_node(node.children[1])
-        elif self._is_operator(node, '%'):
-            return self._interpret_node(node.children[0]) % self._interpret_node(node.children[1])
-        elif self._is_operator(node, '&&'):
-            return self._interpret_node(node.children[0]) and self._interpret_node(node.children[1])
-        elif self._is_operator(node, '||'):
-            return self._interpret_node(node.children[0]) or self._interpret_node(node.children[1])
-        elif self._is_operator(node, '!'):
-            return not self._interpret_node(node.children[0])
-        elif self._is_operator(node, '>'):
-            return self._interpret_node(node.children[0]) > self._interpret_node(node.children[1])
-        elif self._is_operator(node, '<'):
-            return self._interpret_node(node.children[0]) < self._interpret_node(node.children[1])
-        elif self._is_operator(node, '>='):
-            return self._interpret_node(node.children[0]) >= self._interpret_node(node.children[1])
-        elif self._is_operator(node, '<='):
-            return self._interpret_node(node.children[0]) <= self._interpret_node(node.children[1])
-        elif self._is_operator(node, '=='):
-            return self._interpret_node(node.children[0]) == self._interpret_node(node.children[1])
-        elif self._is_operator(node, '!='):
-            return self._interpret_node(node.children[0]) != self._interpret_node(node.children[1])
-        elif self._is_keyword(node, "if"):
-            self._run_if(node)
-        elif self._is_keyword(node, "while"):
-            self._run_while(node)
-        elif self._is_keyword(node, "for"):
-            self._run_for(node)
-        elif self._is_keyword(node, "switch"):
-            self._run_switch(node)
-        elif self._is_keyword(node, ("case", "default")):
-            return
-        elif self._is_keyword(node, "break"):
-            raise Interpreter.Break()
-        else:
-            raise Interpreter.RuntimeError("unknown node", node.line, node.index)
+                return False
+
+    def _run(self):
+        self._execute(self._syntax_tree)
 
     def run_program(self):
-        print("\n\n\n\n\n")
+        self._output.write("\n\n\n\n\n\n")
 
         try:
-            self._interpret_node(self._syntax_tree)
+            self._run()
         except Interpreter.RuntimeError as err:
-            print(f"\n\n\nRUNTIME ERROR:\n{err}")
+            self._output.write(f"\n\n\nRUNTIME ERROR:\n{err}\n")
             exit(1)
+        finally:
+            self._output.flush()
@@ -1,17 +1,20 @@
-from typing import List
+from typing import Iterator, Tuple
 from constant import Constant
 from variable import Variable
+from symbol_table import SymbolTable
+from token_store import LineStarts, TokenStore, TokenView
 from warnings import filterwarnings
+import codecs
+import io
+import locale
+import mmap
+import os
 import sys
+import re
 
 filterwarnings("error")
 
 
-def append_if_not_in(table, element):
-    if element not in table:
-        table.append(element)
-
-
 class Lexer:
     WHITESPACES = (' ', '\t', '\n')
 
@@ -32,6 +35,9 @@ class Lexer:
         "break",
         "default",
         "scan",
+        "scan_int",
+        "scan_double",
+        "scan_word",
         "print",
         "atoi",
         "atob",
@@ -41,6 +47,27 @@ class Lexer:
         "false"
     ]
 
+    _KEYWORDS_SET = frozenset(KEYWORDS)
+
+    ENGINES = ("regex", "legacy")
+
+    # the whitespace before a token and one alternative per token class.
+    # maximal munch for the operators: two-char operators come first.
+    # any other symbol is matched by the error alternative, so the matches cover the whole text.
+    _TOKEN_RE = re.compile(r"""
+        (?P<whitespace>[ \t\n]*)
+        (?:
+              (?P<word>[^\W\d_]\w*)
+            | (?P<number>\d+(?:\.\d*)?)
+            | (?P<string>"(?:[^"\\]|\\.)*")
+            | (?P<operator>&&|\|\||[<>!=]=?|[-+*/%,:;()\[\]{}])
+            | (?P<error>[^ \t\n])
+        )
+    """, re.VERBOSE | re.DOTALL)
+
+    # number of bytes decoded at once when the program is read through a memory map
+    STREAM_CHUNK_SIZE = 1 << 20
+
     class NoMoreTokens(Exception):
         pass
 
@@ -76,6 +103,8 @@ class Lexer:
             super().__init__(f"unexpected number ending: {sym}", line, index)
 
     class Token:
+        __slots__ = ("table", "index_in_table", "line", "index")
+
         def __init__(self, table, index_in_table: int, line: int, index: int):
             self.table = table
             self.index_in_table = index_in_table
@@ -86,11 +115,36 @@ class Lexer:
             return self.table[self.index_in_table]
 
     def __init__(self, file_name: str,
-                 idents_table: list,
-                 keywords_table: list,
-                 operators_table: list,
-                 constants_table: list):
-        with open(file_name) as f:
+                 idents_table: SymbolTable,
+                 keywords_table: SymbolTable,
+                 operators_table: SymbolTable,
+                 constants_table: SymbolTable,
+                 engine: str = "regex"):
+        if engine not in Lexer.ENGINES:
+            raise ValueError(f"unknown lexer engine: {engine}")
+        self._engine = engine
+        self._file_name = file_name
+
+        self._program_text = " "
+        self._curr_symbol_index = 0
+        self._text_len = 0
+        self._text_base = 0  # offset of _program_text[0] in the program
+        self._line_starts = LineStarts()
+
+        self._idents_table = idents_table
+        self._keywords_table = keywords_table
+        self._operators_table = operators_table
+        self._constants_table = constants_table
+
+        # in the order of the TokenStore kinds
+        self._tables = (operators_table, keywords_table, idents_table, constants_table)
+
+        # identifiers are looked up by name: in the streaming mode the parser already changes
+        # the scope of a variable while the rest of the program is being lexed
+        self._ident_indices = {}
+
+    def _load_program_text(self):
+        with open(self._file_name) as f:
             self._program_text = f.read() + " "  # + " " IS IMPORTANT!
 
         # print("PROGRAM:")
@@ -99,36 +153,67 @@ class Lexer:
         # print("END PROGRAM")
 
         self._curr_symbol_index = 0
-        self._curr_line = 1
-        self._curr_index_in_line = 1
         self._text_len = len(self._program_text) - 1  # - 1 IS IMPORTANT!
         # self._text_len = len(self._program_text)
-
-        self._idents_table = idents_table
-        self._keywords_table = keywords_table
-        self._operators_table = operators_table
-        self._constants_table = constants_table
+        self._text_base = 0
+
+        self._line_starts = LineStarts()
+        self._line_starts.add_text(self._program_text[:self._text_len])
+
+    def _read_mapped_chunks(self) -> Iterator[str]:
+        """Decode the program file piece by piece through a memory map, the way open() would decode it."""
+        with open(self._file_name, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            if size == 0:
+                return
+
+            decoder = io.IncrementalNewlineDecoder(
+                codecs.getincrementaldecoder(locale.getpreferredencoding(False))(), translate=True
+            )
+
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                for start in range(0, size, Lexer.STREAM_CHUNK_SIZE):
+                    end = start + Lexer.STREAM_CHUNK_SIZE
+                    chunk = decoder.decode(mapped[start:end], final=end >= size)
+                    self._line_starts.add_text(chunk)
+                    yield chunk
+
+    def _identifier_index(self, word: str) -> int:
+        index = self._ident_indices.get(word)
+
+        if index is None:
+            index = self._idents_table.add(Variable(word, None, 0, 0))
+            self._ident_indices[word] = index
+
+        return index
+
+    def _position(self, offset: int) -> Tuple[int, int]:
+        # line and column of the symbol _program_text[offset]
+        return self._line_starts.position(self._text_base + offset)
+
+    @staticmethod
+    def _check_escape_sequences(string_literal: str, line: int, index: int) -> str:
+        # returns the string with the escapes decoded, which is the value of the constant
+        try:
+            return Constant.convert(string_literal, Constant.STRING)
+        except DeprecationWarning as err:
+            err_str = str(err)
+            msg = err_str[err_str.find("invalid escape sequence"):-1]
+            raise Lexer.InvalidEscapeSequence(msg, line, index)
 
     def get_curr_symbol(self) -> str:
         return self._program_text[self._curr_symbol_index]
 
     def next_symbol(self):
-        if self.get_curr_symbol() == '\n':
-            self._curr_line += 1
-            self._curr_index_in_line = 0
-
         self._curr_symbol_index += 1
 
-        if not self.program_finished():
-            self._curr_index_in_line += 1
-
     def program_finished(self) -> bool:
         # print(self._curr_symbol_index)
         # print(self._text_len)
         return self._curr_symbol_index >= self._text_len
 
-    def get_next_token(self) -> Token:
-        # get the WHOLE TOKEN
+    def get_next_token(self) -> Tuple[int, int, int]:
+        # get the WHOLE TOKEN: (kind, index in the table, offset) as stored in TokenStore
 
         if self.program_finished():
             raise Lexer.NoMoreTokens()
@@ -141,46 +226,40 @@ class Lexer:
             if self.program_finished():
                 raise Lexer.NoMoreTokens()
 
+        start = self._curr_symbol_index
+        offset = self._text_base + start
+
         if curr_sym in ('&', '|'):
             # the next symbol must be the same (we don't have bitwise operations)
-            line, index = self._curr_line, self._curr_index_in_line
             op_sym = curr_sym
             self.next_symbol()
             curr_sym = self.get_curr_symbol()
 
-            if self.program_finished() or curr_sym != op_sym:
-                raise Lexer.Expected(op_sym, self._curr_line, self._curr_index_in_line)
+            if self.program_finished():
+                raise Lexer.Expected(op_sym, *self._position(start))
+            if curr_sym != op_sym:
+                raise Lexer.Expected(op_sym, *self._position(self._curr_symbol_index))
 
             op_sym += curr_sym
 
-            append_if_not_in(self._operators_table, op_sym)
-            next_tok = Lexer.Token(self._operators_table, self._operators_table.index(op_sym), line, index)
+            next_tok = (TokenStore.OPERATOR, self._operators_table.add(op_sym), offset)
             self.next_symbol()
         elif curr_sym in ('>', '<', '!', '='):
-            line, index = self._curr_line, self._curr_index_in_line
-
             # there can be a '=' after this
             op_sym = curr_sym
             self.next_symbol()
             curr_sym = self.get_curr_symbol()
 
             if self.program_finished() or curr_sym != '=':
-                append_if_not_in(self._operators_table, op_sym)
-                next_tok = Lexer.Token(self._operators_table, self._operators_table.index(op_sym), line, index)
+                next_tok = (TokenStore.OPERATOR, self._operators_table.add(op_sym), offset)
             else:
                 op_sym += curr_sym
-                append_if_not_in(self._operators_table, op_sym)
-                next_tok = Lexer.Token(self._operators_table, self._operators_table.index(op_sym), line, index)
+                next_tok = (TokenStore.OPERATOR, self._operators_table.add(op_sym), offset)
                 self.next_symbol()
         elif curr_sym in Lexer.SPECIAL_SYMBOLS:
-            line, index = self._curr_line, self._curr_index_in_line
-
-            append_if_not_in(self._operators_table, curr_sym)
-            next_tok = Lexer.Token(self._operators_table, self._operators_table.index(curr_sym), line, index)
+            next_tok = (TokenStore.OPERATOR, self._operators_table.add(curr_sym), offset)
             self.next_symbol()
         elif curr_sym.isalpha():
-            line, index = self._curr_line, self._curr_index_in_line
-
             # read a 'word'
             word = curr_sym
             self.next_symbol()
@@ -194,32 +273,26 @@ class Lexer:
             # we have the word. what to do now?
             if word in Lexer.KEYWORDS:
                 # keyword
-                append_if_not_in(self._keywords_table, word)
-                next_tok = Lexer.Token(self._keywords_table, self._keywords_table.index(word), line, index)
+                next_tok = (TokenStore.KEYWORD, self._keywords_table.add(word), offset)
             else:
                 # identifier
                 # add WORD into the symbol table
-                var = Variable(word, None, 0, 0)
-                append_if_not_in(self._idents_table, var)
-                next_tok = Lexer.Token(self._idents_table, self._idents_table.index(var), line, index)
+                next_tok = (TokenStore.IDENTIFIER, self._identifier_index(word), offset)
         elif curr_sym == '"':
             # string literal
-            # next_tok = Lexer.Token(Lexer.STRING_LITERAL, "some raw string here")
-            line, index = self._curr_line, self._curr_index_in_line
-
             string_literal = ""
 
             while True:
                 self.next_symbol()
                 if self.program_finished():
-                    raise Lexer.QuotesNotClosed(line, index)
+                    raise Lexer.QuotesNotClosed(*self._position(start))
 
                 curr_sym = self.get_curr_symbol()
 
                 if curr_sym == '\\':
                     self.next_symbol()
                     if self.program_finished():
-                        raise Lexer.QuotesNotClosed(line, index)
+                        raise Lexer.QuotesNotClosed(*self._position(start))
                     curr_sym = self.get_curr_symbol()
                     string_literal += '\\' + curr_sym
                     continue
@@ -230,21 +303,11 @@ class Lexer:
 
                 string_literal += curr_sym
 
-            try:
-                _ = bytes(string_literal, "utf-8").decode("unicode_escape")
-            except DeprecationWarning as err:
-                err_str = str(err)
-                msg = err_str[err_str.find("invalid escape sequence"):-1]
-                raise Lexer.InvalidEscapeSequence(msg, line, index)
-
-            # next_tok = Lexer.Token(Lexer.STRING_LITERAL, string_literal, line, index)
-            # append_if_not_in(self._constants_table, string_literal)
-            const = Constant(string_literal, Constant.STRING)
-            append_if_not_in(self._constants_table, const)
-            next_tok = Lexer.Token(self._constants_table, self._constants_table.index(const), line, index)
-        elif curr_sym.isdigit():
-            line, index = self._curr_line, self._curr_index_in_line
+            decoded = Lexer._check_escape_sequences(string_literal, *self._position(start))
 
+            const = Constant(string_literal, Constant.STRING, decoded)
+            next_tok = (TokenStore.CONSTANT, self._constants_table.add(const), offset)
+        elif curr_sym.isdigit():
             num_str = ""
             has_dot = False
 
@@ -258,7 +321,7 @@ class Lexer:
 
                 if not curr_sym.isdigit() and curr_sym != '.':
                     if curr_sym.isalpha() or curr_sym == '_':
-                        raise Lexer.UnexpectedNumberEnding(curr_sym, self._curr_line, self._curr_index_in_line)
+                        raise Lexer.UnexpectedNumberEnding(curr_sym, *self._position(self._curr_symbol_index))
                     break
                 if curr_sym == '.':
                     if not has_dot:
@@ -266,30 +329,186 @@ class Lexer:
                     else:
                         break
 
-            # append_if_not_in(self._constants_table, num_str)
-
             if has_dot:
                 const = Constant(num_str, Constant.DOUBLE)
             else:
                 const = Constant(num_str, Constant.INT)
 
-            append_if_not_in(self._constants_table, const)
-            next_tok = Lexer.Token(self._constants_table, self._constants_table.index(const), line, index)
+            next_tok = (TokenStore.CONSTANT, self._constants_table.add(const), offset)
         else:
-            raise Lexer.UnknownSymbol(curr_sym, self._curr_line, self._curr_index_in_line)
+            raise Lexer.UnknownSymbol(curr_sym, *self._position(start))
 
         return next_tok
 
-    def split_program_into_tokens(self) -> List[Token]:
-        ret = []
+    def _regex_error(self, sym: str, offset: int, text_end: bool) -> LexerError:
+        # no token class matches sym: report the error the legacy engine would report
+        if sym == '"':
+            return Lexer.QuotesNotClosed(*self._line_starts.position(offset))
+        if sym in ('&', '|'):
+            # the legacy engine points at the symbol after the operator, or at the operator itself on EOF
+            if not text_end:
+                offset += 1
+            return Lexer.Expected(sym, *self._line_starts.position(offset))
+        return Lexer.UnknownSymbol(sym, *self._line_starts.position(offset))
+
+    def _legacy_token_at(self, text: str, pos: int, base: int) -> Tuple[Tuple[int, int, int], int]:
+        self._program_text = text + " "
+        self._text_len = len(text)
+        self._text_base = base
+        self._curr_symbol_index = pos
+
+        next_tok = self.get_next_token()
+
+        return next_tok, self._curr_symbol_index
+
+    def _iter_regex_tokens(self, chunks: Iterator[str], base: int = 0) -> Iterator[Tuple[int, int, int]]:
+        """Match whole tokens with the master regex instead of walking the text symbol by symbol.
+
+        The text comes in chunks and only its unconsumed tail is kept. A token that may continue
+        in the next chunk is matched again when the next chunk has been appended.
+        The lines of a chunk must be in _line_starts before the chunk is passed here.
+        """
+        finditer = Lexer._TOKEN_RE.finditer
+        keywords = Lexer._KEYWORDS_SET
+        operators_table = self._operators_table
+        keywords_table = self._keywords_table
+        constants_table = self._constants_table
+        identifier_index = self._identifier_index
+        position = self._line_starts.position
+
+        operator_kind = TokenStore.OPERATOR
+        keyword_kind = TokenStore.KEYWORD
+        identifier_kind = TokenStore.IDENTIFIER
+        constant_kind = TokenStore.CONSTANT
+
+        text = ""
+        # base is the offset of text[0] in the program
+        pos = 0  # position in text of the first symbol that is not lexed yet
+
+        chunk = next(chunks, None)
+
+        while chunk is not None:
+            text = text[pos:] + chunk
+            base += pos
+            pos = 0
+
+            chunk = next(chunks, None)
+            more = chunk is not None
+            text_len = len(text)
+
+            for m in finditer(text):
+                whitespace, word, number, string, operator, error = m.groups()
+                end = m.end()
+
+                if more and (end == text_len or error == '"'):
+                    # the token (or the closing quote) may be in the next chunk
+                    break
+
+                start = pos + len(whitespace)
+
+                if (word is not None and not word[0].isalpha()) or \
+                        (number is not None and end < text_len and text[end].isdigit()) or \
+                        (error is not None and error.isdigit()):
+                    # non-decimal unicode digits: the regex classes differ from str.isalpha()/str.isdigit() here
+                    next_tok, tok_end = self._legacy_token_at(text, start, base)
+                    if more and tok_end >= text_len:
+                        # the token may go on in the next chunk
+                        break
+
+                    pos = tok_end
+                    yield next_tok
+                    break
 
+                if operator is not None:
+                    yield operator_kind, operators_table.add(operator), base + start
+                elif word is not None:
+                    if word in keywords:
+                        yield keyword_kind, keywords_table.add(word), base + start
+                    else:
+                        yield identifier_kind, identifier_index(word), base + start
+                elif number is not None:
+                    if end < text_len and (text[end].isalpha() or text[end] == '_'):
+                        raise Lexer.UnexpectedNumberEnding(text[end], *position(base + end))
+
+                    const = Constant(number, Constant.DOUBLE if '.' in number else Constant.INT)
+                    yield constant_kind, constants_table.add(const), base + start
+                elif string is not None:
+                    string_literal = string[1:-1]
+                    decoded = Lexer._check_escape_sequences(string_literal, *position(base + start))
+
+                    const = Constant(string_literal, Constant.STRING, decoded)
+                    yield constant_kind, constants_table.add(const), base + start
+                else:
+                    raise self._regex_error(error, base + start, end == text_len)
+
+                pos = end
+            else:
+                # only whitespace is left in text
+                continue
+
+            if not more:
+                # the legacy scanner stopped inside the text, go on from there
+                chunk = ""
+
+    def _split_with_regex(self) -> Iterator[Tuple[int, int, int]]:
+        return self._iter_regex_tokens(iter((self._program_text[:self._text_len],)))
+
+    def _split_with_legacy(self) -> Iterator[Tuple[int, int, int]]:
         while True:
             try:
-                ret.append(self.get_next_token())
+                yield self.get_next_token()
             except Lexer.NoMoreTokens:
                 break
-            except Lexer.LexerError as err:
-                print(f"LEXER ERROR:\n\t{err.message} ({err.line}:{err.index})")
-                sys.exit(1)
 
-        return ret
+    def iter_tokens_from(self, text: str, start: int) -> Iterator[Tuple[int, int, int]]:
+        """Lex the program text from the offset start, which must not be inside a token.
+        The incremental compiler uses it to lex only the changed part of the program."""
+        self._program_text = text + " "
+        self._text_len = len(text)
+        self._text_base = 0
+        self._curr_symbol_index = start
+
+        self._line_starts = LineStarts()
+        self._line_starts.add_text(text)
+
+        if self._engine == "legacy":
+            return self._split_with_legacy()
+        return self._iter_regex_tokens(iter((text[start:],)), start)
+
+    def get_line_starts(self) -> LineStarts:
+        return self._line_starts
+
+    def split_program_into_tokens(self) -> TokenStore:
+        self._load_program_text()
+        store = TokenStore(self._tables, self._line_starts)
+
+        try:
+            if self._engine == "legacy":
+                store.extend(self._split_with_legacy())
+            else:
+                store.extend(self._split_with_regex())
+        except Lexer.LexerError as err:
+            print(f"LEXER ERROR:\n\t{err.message} ({err.line}:{err.index})")
+            sys.exit(1)
+
+        return store
+
+    def iter_program_tokens(self) -> Iterator[TokenView]:
+        """Yield the tokens one by one. The regex engine reads the file through a memory map,
+        so neither the program text nor the token list has to be kept in memory."""
+        if self._engine == "legacy":
+            self._load_program_text()
+            tokens = self._split_with_legacy()
+        else:
+            self._line_starts = LineStarts()
+            tokens = self._iter_regex_tokens(self._read_mapped_chunks())
+
+        tables = self._tables
+        lines = self._line_starts
+
+        try:
+            for kind, index_in_table, offset in tokens:
+                yield TokenView(tables[kind], index_in_table, offset, lines)
+        except Lexer.LexerError as err:
+            print(f"LEXER ERROR:\n\t{err.message} ({err.line}:{err.index})")
+            sys.exit(1)
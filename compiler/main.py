@@ -1,3 +1,5 @@
+import sys
+
 from compiler import Compiler
 
 
@@ -12,9 +14,15 @@ def main():
     # exit(1)
 
     c = Compiler("program.cpm")
+    if "--watch" in sys.argv[1:]:
+        # compiles the program again every time it is saved, without running it
+        c.watch(show_tree="--tree" in sys.argv[1:])
+        return
+
     c.do_lexical_analysis()
     c.do_syntax_analysis()
     c.do_semantic_analysis()
+    c.do_optimization()
     c.run_program()
 
 
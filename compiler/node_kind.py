@@ -0,0 +1,86 @@
+from constant import Constant
+from variable import Variable
+
+
+class NodeKind:
+    """What a syntax tree node is, as a small integer, so the passes do not compare strings."""
+
+    (UNKNOWN,
+     # parser nodes
+     PROGRAM, DECLARE, COMPOUND_STATEMENT, INDEXATION,
+     IDENTIFIER,
+     CONST_INT, CONST_DOUBLE, CONST_STRING,
+     # operators
+     OP_ADD, OP_SUB, OP_MUL, OP_DIV, OP_MOD, OP_ASSIGN,
+     OP_EQ, OP_NE, OP_LT, OP_LE, OP_GT, OP_GE, OP_AND, OP_OR, OP_NOT,
+     # keywords
+     KW_INT, KW_DOUBLE, KW_BOOL, KW_STRING, KW_WHILE, KW_FOR, KW_IF, KW_ELSE, KW_SWITCH, KW_CASE, KW_BREAK,
+     KW_DEFAULT, KW_SCAN, KW_SCAN_INT, KW_SCAN_DOUBLE, KW_SCAN_WORD, KW_PRINT, KW_ATOI, KW_ATOB, KW_ATOF,
+     KW_TO_STRING, KW_TRUE, KW_FALSE,
+     # set by the optimizer: an indexation whose indexes are proven to be in the bounds of the array
+     INDEXATION_IN_BOUNDS,
+     COUNT) = range(49)
+
+    _BY_NAME = {
+        "program": PROGRAM,
+        "declare": DECLARE,
+        "compound_statement": COMPOUND_STATEMENT,
+        "indexation": INDEXATION,
+
+        '+': OP_ADD,
+        '-': OP_SUB,
+        '*': OP_MUL,
+        '/': OP_DIV,
+        '%': OP_MOD,
+        '=': OP_ASSIGN,
+        '==': OP_EQ,
+        '!=': OP_NE,
+        '<': OP_LT,
+        '<=': OP_LE,
+        '>': OP_GT,
+        '>=': OP_GE,
+        '&&': OP_AND,
+        '||': OP_OR,
+        '!': OP_NOT,
+
+        "int": KW_INT,
+        "double": KW_DOUBLE,
+        "bool": KW_BOOL,
+        "string": KW_STRING,
+        "while": KW_WHILE,
+        "for": KW_FOR,
+        "if": KW_IF,
+        "else": KW_ELSE,
+        "switch": KW_SWITCH,
+        "case": KW_CASE,
+        "break": KW_BREAK,
+        "default": KW_DEFAULT,
+        "scan": KW_SCAN,
+        "scan_int": KW_SCAN_INT,
+        "scan_double": KW_SCAN_DOUBLE,
+        "scan_word": KW_SCAN_WORD,
+        "print": KW_PRINT,
+        "atoi": KW_ATOI,
+        "atob": KW_ATOB,
+        "atof": KW_ATOF,
+        "to_string": KW_TO_STRING,
+        "true": KW_TRUE,
+        "false": KW_FALSE,
+    }
+
+    _BY_CONSTANT_TYPE = {
+        Constant.INT: CONST_INT,
+        Constant.DOUBLE: CONST_DOUBLE,
+        Constant.STRING: CONST_STRING,
+    }
+
+    @staticmethod
+    def of(value) -> int:
+        """The kind of a node whose table element is value."""
+        if isinstance(value, str):
+            return NodeKind._BY_NAME.get(value, NodeKind.UNKNOWN)
+        if isinstance(value, Variable):
+            return NodeKind.IDENTIFIER
+        if isinstance(value, Constant):
+            return NodeKind._BY_CONSTANT_TYPE[value.type]
+        return NodeKind.UNKNOWN
@@ -0,0 +1,868 @@
+from constant import Constant
+from interpreter import Interpreter
+from node_kind import NodeKind
+from parser import Parser
+from symbol_table import SymbolTable
+from variable import Variable
+from working_with_syntax_tree import WorkingWithSyntaxTree
+
+
+class Optimizer(WorkingWithSyntaxTree):
+    """Computes the constant parts of a checked tree before the program runs.
+
+    Operations on constants are replaced by new constants, && and || drop the operands that do not change
+    their value, and the statements under a constant condition are replaced by the branch that runs.
+    An operation that fails is left in the tree, so it fails when the program runs, like before.
+
+    Then the indexations whose indexes are always in the bounds of the array are marked, so they run without
+    the checks, and the expressions that do not change in a loop are computed once before it, into new
+    variables.
+    """
+
+    _CONSTANTS = frozenset((NodeKind.CONST_INT, NodeKind.CONST_DOUBLE, NodeKind.CONST_STRING, NodeKind.KW_TRUE,
+                            NodeKind.KW_FALSE))
+
+    # the operations that are computed when all their operands are constants
+    _FOLDED = frozenset((
+        NodeKind.OP_ADD, NodeKind.OP_SUB, NodeKind.OP_MUL, NodeKind.OP_DIV, NodeKind.OP_MOD, NodeKind.OP_NOT,
+        NodeKind.OP_EQ, NodeKind.OP_NE, NodeKind.OP_LT, NodeKind.OP_LE, NodeKind.OP_GT, NodeKind.OP_GE,
+        NodeKind.KW_TO_STRING, NodeKind.KW_ATOI, NodeKind.KW_ATOF, NodeKind.KW_ATOB,
+    ))
+
+    _FOLDED_OR_SHORT_CIRCUIT = _FOLDED | {NodeKind.OP_AND, NodeKind.OP_OR}
+
+    # the statements with a condition
+    _CONDITIONAL = frozenset((NodeKind.KW_IF, NodeKind.KW_WHILE, NodeKind.KW_FOR))
+
+    # the result of a statement that does nothing
+    _REMOVED = object()
+
+    _LOOPS = frozenset((NodeKind.KW_WHILE, NodeKind.KW_FOR))
+
+    # what a part of a statement is. A target is the variable or the element an assignment changes
+    _STATEMENT, _EXPRESSION, _TARGET = range(3)
+
+    # the parts of the statements, by the kind of the node. The other statements have only inner statements,
+    # except a declaration, which has targets and assignments
+    _PARTS = {
+        NodeKind.OP_ASSIGN: (_TARGET, _EXPRESSION),
+        NodeKind.KW_IF: (_EXPRESSION, _STATEMENT, _STATEMENT),
+        NodeKind.KW_WHILE: (_EXPRESSION, _STATEMENT),
+        NodeKind.KW_FOR: (_STATEMENT, _EXPRESSION, _STATEMENT, _STATEMENT),
+        NodeKind.KW_SWITCH: (_EXPRESSION, _STATEMENT),
+        NodeKind.KW_PRINT: (_EXPRESSION,),
+        NodeKind.KW_CASE: (),
+    }
+
+    # the operations that cannot fail, so they can be computed before the loop even if the loop does not
+    # compute them. / and % are added when the divisor is a constant that is not 0
+    _CANNOT_FAIL = frozenset((
+        NodeKind.OP_ADD, NodeKind.OP_SUB, NodeKind.OP_MUL, NodeKind.OP_NOT, NodeKind.OP_AND, NodeKind.OP_OR,
+        NodeKind.OP_EQ, NodeKind.OP_NE, NodeKind.OP_LT, NodeKind.OP_LE, NodeKind.OP_GT, NodeKind.OP_GE,
+        NodeKind.KW_TO_STRING, NodeKind.INDEXATION_IN_BOUNDS,
+    ))
+
+    # the comparisons of a variable with a bound, and the same comparisons with the operands swapped
+    _COMPARISONS = frozenset((NodeKind.OP_LT, NodeKind.OP_LE, NodeKind.OP_GT, NodeKind.OP_GE))
+    _SWAPPED = {
+        NodeKind.OP_LT: NodeKind.OP_GT,
+        NodeKind.OP_LE: NodeKind.OP_GE,
+        NodeKind.OP_GT: NodeKind.OP_LT,
+        NodeKind.OP_GE: NodeKind.OP_LE,
+    }
+
+    # the expressions whose value is an int when their operands are ints. An int variable can have a double
+    # value, so an identifier is an int only if no double is assigned to its variable
+    _INT_VALUES = frozenset((NodeKind.CONST_INT, NodeKind.KW_ATOI, NodeKind.KW_SCAN_INT))
+    _INT_OPERATIONS = frozenset((NodeKind.OP_ADD, NodeKind.OP_SUB, NodeKind.OP_MUL, NodeKind.OP_MOD))
+
+    # a product of the induction variable is replaced by a variable updated with an addition only if it is
+    # computed this many times in an iteration. An assignment costs about as much as two multiplications
+    _MIN_REDUCED_PRODUCTS = 3
+
+    def __init__(self, parser_nodes: SymbolTable, operators: SymbolTable, identifiers: SymbolTable,
+                 keywords: SymbolTable, consts: SymbolTable, syntax_tree):
+        super().__init__(parser_nodes, operators, identifiers, keywords, consts, syntax_tree)
+
+        # computes the operations, so the values are the ones the program would compute
+        self._interpreter = Interpreter(parser_nodes, operators, identifiers, keywords, consts, syntax_tree)
+
+        # the variables changed in the optimized loops, by the id of the loop
+        self._loop_changes = {}
+        # the variables that only have int values, see _int_variables
+        self._int_variables_found = None
+
+    @staticmethod
+    def _is_constant(node: Parser.Node) -> bool:
+        return node is not None and node.kind in Optimizer._CONSTANTS
+
+    def _constant_node(self, value, like: Parser.Node):
+        """A constant node with the value at the place of the node like, or None if the value has no constant."""
+        if isinstance(value, bool):
+            node = Parser.Node(self._keywords_tbl, self._keywords_tbl.add("true" if value else "false"),
+                               (), like.line, like.index)
+            node.type = "bool"
+            return node
+
+        if isinstance(value, int):
+            try:
+                const = Constant(str(value), Constant.INT, value)
+            except ValueError:
+                # too many digits to convert
+                return None
+            tp = "int"
+        elif isinstance(value, float):
+            const = Constant(repr(value), Constant.DOUBLE, value)
+            tp = "double"
+        else:
+            # the text of a string constant has the escapes, as in the program
+            const = Constant(value.encode("unicode_escape").decode("ascii"), Constant.STRING, value)
+            tp = "string"
+
+        node = Parser.Node(self._consts_tbl, self._consts_tbl.add(const), (), like.line, like.index)
+        node.type = tp
+        return node
+
+    def _fold(self, node: Parser.Node):
+        """A constant with the value of the node, or None if computing it fails."""
+        try:
+            value = self._interpreter.evaluate(node)
+        except (Interpreter.RuntimeError, ArithmeticError, ValueError):
+            return None
+        return self._constant_node(value, node)
+
+    def _fold_chain(self, node: Parser.Node) -> Parser.Node:
+        """Computes the constants of a chain of + or *. Only the leading ones for numbers, because
+        a + (b + c) may round differently from (a + b) + c."""
+        children = node.children
+        is_string = node.type == "string"
+
+        ret = []
+        i = 0
+        while i < len(children):
+            j = i
+            while j < len(children) and Optimizer._is_constant(children[j]):
+                j += 1
+
+            if j - i > 1:
+                part = Parser.Node(node.table, node.index_in_table, children[i:j], node.line, node.index, node.kind)
+                folded = self._fold(part)
+                if folded is None:
+                    ret.extend(children[i:j])
+                else:
+                    ret.append(folded)
+            else:
+                ret.extend(children[i:j])
+
+            if j == len(children):
+                break
+            if not is_string:
+                ret.extend(children[j:])
+                break
+
+            ret.append(children[j])
+            i = j + 1
+
+        if len(ret) == 1:
+            return ret[0]
+        if len(ret) < len(children):
+            node.children = tuple(ret)
+        return node
+
+    def _fold_short_circuit(self, node: Parser.Node) -> Parser.Node:
+        # the constant operand that decides the value is the last one evaluated, the constants
+        # that do not decide it are dropped
+        deciding = NodeKind.KW_FALSE if node.kind == NodeKind.OP_AND else NodeKind.KW_TRUE
+
+        ret = []
+        for child in node.children:
+            if child.kind == deciding:
+                ret.append(child)
+                break
+            if not Optimizer._is_constant(child):
+                ret.append(child)
+
+        if not ret:
+            # all the operands were constants that do not decide
+            return self._constant_node(node.kind == NodeKind.OP_AND, node)
+        if len(ret) == 1:
+            return ret[0]
+        if len(ret) < len(node.children):
+            node.children = tuple(ret)
+        return node
+
+    def _fold_expression(self, node: Parser.Node) -> Parser.Node:
+        kind = node.kind
+
+        if kind == NodeKind.OP_AND or kind == NodeKind.OP_OR:
+            return self._fold_short_circuit(node)
+        if kind not in Optimizer._FOLDED:
+            return node
+
+        children = node.children
+        if all(Optimizer._is_constant(child) for child in children):
+            folded = self._fold(node)
+            return node if folded is None else folded
+        if (kind == NodeKind.OP_ADD or kind == NodeKind.OP_MUL) and len(children) > 2:
+            return self._fold_chain(node)
+        return node
+
+    def _empty_statement(self, like: Parser.Node) -> Parser.Node:
+        return Parser.Node(self._parser_nodes_tbl, self._parser_nodes_tbl.index("compound_statement"), (),
+                           like.line, like.index)
+
+    @staticmethod
+    def _has_labels(root: Parser.Node) -> bool:
+        """Whether there is a case or a default of an outer switch in the statement. A switch can jump there."""
+        stack = [root]
+
+        while stack:
+            node = stack.pop()
+            if node is None:
+                continue
+
+            kind = node.kind
+            if kind == NodeKind.KW_CASE or kind == NodeKind.KW_DEFAULT:
+                return True
+            if kind != NodeKind.KW_SWITCH:
+                stack.extend(node.children)
+
+        return False
+
+    def _fold_statement(self, node: Parser.Node):
+        """The statement that runs instead of the node, or _REMOVED. Statements with labels stay."""
+        kind = node.kind
+        children = node.children
+
+        if kind == NodeKind.KW_IF and Optimizer._is_constant(children[0]):
+            if children[0].kind == NodeKind.KW_TRUE:
+                if len(children) < 3 or not Optimizer._has_labels(children[2]):
+                    return children[1]
+            elif not Optimizer._has_labels(children[1]):
+                return children[2] if len(children) == 3 else Optimizer._REMOVED
+        elif kind == NodeKind.KW_WHILE and children[0].kind == NodeKind.KW_FALSE:
+            if not Optimizer._has_labels(children[1]):
+                return Optimizer._REMOVED
+        elif kind == NodeKind.KW_FOR and children[1] is not None and children[1].kind == NodeKind.KW_FALSE:
+            if not Optimizer._has_labels(children[3]):
+                # only the initialization runs
+                return Optimizer._REMOVED if children[0] is None else children[0]
+
+        return node
+
+    def _replace_children(self, node: Parser.Node, results: list):
+        kind = node.kind
+        ret = []
+
+        for i, child in enumerate(results):
+            if child is not Optimizer._REMOVED:
+                ret.append(child)
+            elif kind == NodeKind.KW_IF and i == 2:
+                # no else
+                pass
+            elif kind == NodeKind.PROGRAM or kind == NodeKind.COMPOUND_STATEMENT:
+                pass
+            else:
+                # the body of a statement
+                ret.append(self._empty_statement(node))
+
+        node.children = tuple(ret)
+
+    def _fold_constants(self):
+        """The nodes are visited once, every node after its children."""
+        # the children are pushed from the first, so they are taken from the last, and the reversed order
+        # has every node after its children, which are in their order
+        order = []
+        stack = [self._syntax_tree]
+        while stack:
+            node = stack.pop()
+            order.append(node)
+            if node is not None:
+                stack.extend(node.children)
+
+        constants = Optimizer._CONSTANTS
+        folded = Optimizer._FOLDED_OR_SHORT_CIRCUIT
+        conditional = Optimizer._CONDITIONAL
+
+        # the nodes that replace the visited nodes whose parents are not visited yet. pending is how many
+        # of them are not the node itself, the children are compared only if there are any
+        results = []
+        pending = 0
+
+        for node in reversed(order):
+            if node is None:
+                # a missing part of a for
+                results.append(None)
+                continue
+
+            num_children = len(node.children)
+            if num_children:
+                if pending:
+                    children_results = results[-num_children:]
+                    changed = sum(1 for a, b in zip(children_results, node.children) if a is not b)
+                    if changed:
+                        pending -= changed
+                        self._replace_children(node, children_results)
+                del results[-num_children:]
+
+            kind = node.kind
+            if kind in folded:
+                # most operations have no constant to compute, the first operand tells it for all but
+                # && and || and the concatenations of strings
+                if node.children[0].kind in constants or kind == NodeKind.OP_AND or kind == NodeKind.OP_OR or \
+                        node.type == "string":
+                    replacement = self._fold_expression(node)
+                else:
+                    replacement = node
+            elif kind in conditional:
+                replacement = self._fold_statement(node)
+            else:
+                replacement = node
+
+            if replacement is not node:
+                pending += 1
+            results.append(replacement)
+
+    def _identifier(self, index: int, like: Parser.Node) -> Parser.Node:
+        node = Parser.Node(self._idents_tbl, index, (), like.line, like.index)
+        node.type = self._idents_tbl[index].type
+        return node
+
+    def _new_variable(self, tp: [str, list]) -> int:
+        """A variable of the optimizer. Its name cannot be written in a program."""
+        index = len(self._idents_tbl)
+        self._idents_tbl.append(Variable(f"@{index}", tp, 0, 0))
+        return index
+
+    def _assignment(self, index: int, value: Parser.Node) -> Parser.Node:
+        return Parser.Node(self._ops_tbl, self._ops_tbl.add("="), (self._identifier(index, value), value),
+                           value.line, value.index)
+
+    @staticmethod
+    def _replace_child(parent: Parser.Node, i: int, child: Parser.Node):
+        children = parent.children
+        parent.children = children[:i] + (child,) + children[i + 1:]
+
+    def _walk_loop(self, roots) -> tuple:
+        """The nodes in preorder as (node, parent, index in parent, part), the variables changed in them, and
+        whether there is a case or a default of a switch outside of them. roots are (node, parent, index, part).
+
+        The loops optimized before are not entered, the variables they change are in self._loop_changes.
+        """
+        order = []
+        changed = set()
+        has_labels = False
+
+        stack = [root + (False,) for root in roots]
+        while stack:
+            node, parent, i, part, in_switch = stack.pop()
+            if node is None:
+                # a missing part of a for
+                continue
+
+            changes = self._loop_changes.get(id(node))
+            if changes is not None:
+                # the smaller set is added to the larger one, so deeply nested loops are not quadratic. The set
+                # of the inner loop may grow, but only by variables every loop around it changes too
+                if len(changes) > len(changed):
+                    changes |= changed
+                    changed = changes
+                else:
+                    changed |= changes
+                continue
+
+            order.append((node, parent, i, part))
+            kind = node.kind
+            children = node.children
+
+            if part == Optimizer._EXPRESSION:
+                parts = (Optimizer._EXPRESSION,) * len(children)
+            elif part == Optimizer._TARGET:
+                if kind == NodeKind.IDENTIFIER:
+                    changed.add(node.index_in_table)
+                    parts = ()
+                else:
+                    # the indexes of an element are computed
+                    parts = (Optimizer._TARGET,) + (Optimizer._EXPRESSION,) * (len(children) - 1)
+            elif kind == NodeKind.DECLARE:
+                parts = tuple(Optimizer._STATEMENT if child.kind == NodeKind.OP_ASSIGN else Optimizer._TARGET
+                              for child in children)
+            else:
+                parts = Optimizer._PARTS.get(kind)
+                if parts is None:
+                    parts = (Optimizer._STATEMENT,) * len(children)
+
+                if kind == NodeKind.KW_SWITCH:
+                    in_switch = True
+                elif (kind == NodeKind.KW_CASE or kind == NodeKind.KW_DEFAULT) and not in_switch:
+                    has_labels = True
+
+            # an if without else has no third part, and the constant of a case is not a part
+            for j, (child, child_part) in enumerate(zip(children, parts)):
+                stack.append((child, node, j, child_part, in_switch))
+
+        return order, changed, has_labels
+
+    @staticmethod
+    def _is_invariant(node: Parser.Node, changed: set, invariant: dict) -> bool:
+        """Whether the expression has the same value everywhere in the loop and cannot fail.
+        invariant has the answers for the operands."""
+        kind = node.kind
+
+        if kind == NodeKind.KW_TRUE or kind == NodeKind.KW_FALSE:
+            return True
+        if kind in Optimizer._CONSTANTS:
+            # a constant that cannot be converted fails where it is computed
+            return node.value().convertible
+        if kind == NodeKind.IDENTIFIER:
+            return node.index_in_table not in changed
+        if kind == NodeKind.OP_DIV or kind == NodeKind.OP_MOD:
+            divisor = node.children[1]
+            if divisor.kind not in (NodeKind.CONST_INT, NodeKind.CONST_DOUBLE) or \
+                    not divisor.value().convertible or divisor.value().runtime_value == 0:
+                return False
+        elif kind not in Optimizer._CANNOT_FAIL:
+            # atoi and the others fail on some strings, an index may be out of the bounds, scan reads the input
+            return False
+
+        for child in node.children:
+            if not invariant[id(child)]:
+                return False
+        return True
+
+    @staticmethod
+    def _split_invariant_prefix(chain: Parser.Node, invariant: dict):
+        """Makes the leading invariant operands of the chain, if there are two or more, one operand of it.
+        Returns the new operand, or None."""
+        children = chain.children
+        k = 0
+        while invariant[id(children[k])]:
+            k += 1
+        if k < 2:
+            return None
+
+        prefix = Parser.Node(chain.table, chain.index_in_table, children[:k], chain.line, chain.index, chain.kind)
+        types = [child.type for child in children[:k]]
+        prefix.type = "string" if "string" in types else "double" if "double" in types else "int"
+        chain.children = (prefix,) + children[k:]
+        return prefix
+
+    def _move_invariants(self, order: list, changed: set) -> list:
+        """Replaces the largest expressions of the loop that do not change in it and cannot fail by new
+        variables. Equal expressions share a variable. Returns the assignments of the variables."""
+        invariant = {}
+        # equal expressions have the same key. The keys are numbered, so they are flat tuples
+        keys = {}
+        key_of = {}
+
+        # the leading invariant operands of chains of + and *, which are computed first anyway
+        prefixes = []
+        # the places of the operands of the chains split, by their id
+        moved_operands = {}
+
+        for node, parent, i, part in reversed(order):
+            if part != Optimizer._EXPRESSION:
+                continue
+
+            is_invariant = Optimizer._is_invariant(node, changed, invariant)
+            if not is_invariant and (node.kind == NodeKind.OP_ADD or node.kind == NodeKind.OP_MUL):
+                prefix = Optimizer._split_invariant_prefix(node, invariant)
+                if prefix is not None:
+                    for j, child in enumerate(prefix.children):
+                        moved_operands[id(child)] = (prefix, j)
+                    for j, child in enumerate(node.children):
+                        moved_operands[id(child)] = (node, j)
+
+                    invariant[id(node)] = False
+                    prefixes.append((prefix, node, 0))
+                    node, is_invariant = prefix, True
+
+            invariant[id(node)] = is_invariant
+            if is_invariant:
+                key = (node.kind, node.index_in_table) + tuple(key_of[id(child)] for child in node.children)
+                key_of[id(node)] = keys.setdefault(key, len(keys))
+
+        moved = {}
+        for node, parent, i, part in order:
+            # variables and constants are not worth a variable
+            if part == Optimizer._EXPRESSION and node.children and invariant[id(node)]:
+                parent, i = moved_operands.get(id(node), (parent, i))
+                if not invariant.get(id(parent), False):
+                    moved.setdefault(key_of[id(node)], []).append((node, parent, i))
+        for prefix, chain, i in prefixes:
+            moved.setdefault(key_of[id(prefix)], []).append((prefix, chain, i))
+
+        ret = []
+        for occurrences in moved.values():
+            expression = occurrences[0][0]
+            index = self._new_variable(expression.type)
+            ret.append(self._assignment(index, expression))
+
+            for node, parent, i in occurrences:
+                Optimizer._replace_child(parent, i, self._identifier(index, node))
+
+        return ret
+
+    @staticmethod
+    def _induction_step(for_node: Parser.Node):
+        """(the variable, the step) if the increment of the for is i = i + c or i = i - c for an int i and
+        an int constant c, otherwise None."""
+        increment = for_node.children[2]
+        if increment is None or increment.kind != NodeKind.OP_ASSIGN:
+            return None
+
+        target, value = increment.children
+        if target.kind != NodeKind.IDENTIFIER or target.type != "int" or len(value.children) != 2:
+            return None
+
+        left, right = value.children
+        if value.kind == NodeKind.OP_ADD and right.kind == NodeKind.IDENTIFIER:
+            left, right = right, left
+        elif value.kind != NodeKind.OP_ADD and value.kind != NodeKind.OP_SUB:
+            return None
+
+        if left.kind != NodeKind.IDENTIFIER or left.index_in_table != target.index_in_table or \
+                right.kind != NodeKind.CONST_INT or not right.value().convertible:
+            return None
+
+        step = right.value().runtime_value
+        return target.index_in_table, step if value.kind == NodeKind.OP_ADD else -step
+
+    @staticmethod
+    def _factor(node: Parser.Node, variable: int):
+        """c if the expression is variable * c or c * variable for an int constant c, otherwise None."""
+        if node.kind != NodeKind.OP_MUL or len(node.children) != 2:
+            return None
+
+        left, right = node.children
+        if right.kind == NodeKind.IDENTIFIER:
+            left, right = right, left
+        if left.kind != NodeKind.IDENTIFIER or left.index_in_table != variable or right.kind != NodeKind.CONST_INT:
+            return None
+        # None for a constant that cannot be converted
+        return right.value().runtime_value
+
+    @staticmethod
+    def _is_int_valued(expression: Parser.Node, int_variables: set) -> bool:
+        """Whether the value of the expression is an int whenever it is computed."""
+        stack = [expression]
+        while stack:
+            node = stack.pop()
+            kind = node.kind
+            if kind == NodeKind.IDENTIFIER:
+                if node.index_in_table not in int_variables:
+                    return False
+            elif kind in Optimizer._INT_OPERATIONS:
+                stack.extend(node.children)
+            elif kind not in Optimizer._INT_VALUES:
+                return False
+        return True
+
+    def _int_variables(self) -> set:
+        """The int variables that never have a double value: every value assigned to them is an int."""
+        if self._int_variables_found is not None:
+            return self._int_variables_found
+
+        assignments = []
+        stack = [self._syntax_tree]
+        while stack:
+            node = stack.pop()
+            if node is None:
+                continue
+            if node.kind == NodeKind.OP_ASSIGN and node.children[0].kind == NodeKind.IDENTIFIER:
+                assignments.append(node.children)
+            stack.extend(node.children)
+
+        # the variables are ints until an assignment of a value that is not is found
+        ret = {index for index, variable in enumerate(self._idents_tbl) if variable.type == "int"}
+        changed = True
+        while changed:
+            changed = False
+            for target, value in assignments:
+                if target.index_in_table in ret and not Optimizer._is_int_valued(value, ret):
+                    ret.discard(target.index_in_table)
+                    changed = True
+
+        self._int_variables_found = ret
+        return ret
+
+    def _starts_with_int(self, for_node: Parser.Node, variable: int) -> bool:
+        """Whether the induction variable of the for is an int when the loop starts. A sum of doubles is
+        rounded differently from a product, so the products of a double are not reduced."""
+        init = for_node.children[0]
+        int_variables = self._int_variables()
+        if variable in int_variables:
+            return True
+        return init is not None and init.kind == NodeKind.OP_ASSIGN and \
+            init.children[0].kind == NodeKind.IDENTIFIER and init.children[0].index_in_table == variable and \
+            Optimizer._is_int_valued(init.children[1], int_variables)
+
+    def _reduce_products(self, for_node: Parser.Node) -> list:
+        """Replaces the products of the induction variable of the for and a constant by new variables, which
+        are computed after the initialization and increased at the end of every iteration. Returns the
+        initialization and the first values of the variables, to run before the loop."""
+        induction = Optimizer._induction_step(for_node)
+        if induction is None:
+            return []
+        variable, step = induction
+
+        init, cond, increment, body = for_node.children
+        order, changed, has_labels = self._walk_loop(((cond, for_node, 1, Optimizer._EXPRESSION),
+                                                      (body, for_node, 3, Optimizer._STATEMENT)))
+        if has_labels or variable in changed or not self._starts_with_int(for_node, variable):
+            return []
+
+        products = {}
+        for node, parent, i, part in order:
+            if part == Optimizer._EXPRESSION:
+                factor = Optimizer._factor(node, variable)
+                if factor is not None:
+                    products.setdefault(factor, []).append((node, parent, i))
+
+        ret = []
+        updates = []
+        for factor, occurrences in products.items():
+            if len(occurrences) < Optimizer._MIN_REDUCED_PRODUCTS:
+                continue
+
+            product = occurrences[0][0]
+            index = self._new_variable("int")
+            for node, parent, i in occurrences:
+                Optimizer._replace_child(parent, i, self._identifier(index, node))
+
+            ret.append(self._assignment(index, product))
+            addition = Parser.Node(self._ops_tbl, self._ops_tbl.add("+"),
+                                   (self._identifier(index, product), self._constant_node(step * factor, product)),
+                                   product.line, product.index)
+            addition.type = "int"
+            updates.append(self._assignment(index, addition))
+
+        if not ret:
+            return []
+
+        # the updates run after the body, so they are not run after a break, when the values are not used
+        body = for_node.children[3]
+        if body.kind == NodeKind.COMPOUND_STATEMENT:
+            body.children = body.children + tuple(updates)
+        else:
+            body = Parser.Node(self._parser_nodes_tbl, self._parser_nodes_tbl.add("compound_statement"),
+                               (body,) + tuple(updates), body.line, body.index)
+
+        # the values are computed from the first value of the induction variable
+        for_node.children = (None, cond, increment, body)
+        return [init] + ret if init is not None else ret
+
+    def _optimize_loop(self, loop: Parser.Node, skipped: set) -> list:
+        """Optimizes the loop and returns the statements to run before it. skipped are the variables whose
+        declaration a switch around the loop can jump over, so they may have no value."""
+        ret = self._reduce_products(loop) if loop.kind == NodeKind.KW_FOR else []
+
+        order, changed, has_labels = self._walk_loop(((loop, None, 0, Optimizer._STATEMENT),))
+        if has_labels:
+            # a switch can jump into the loop, past the statements before it
+            return []
+
+        self._loop_changes[id(loop)] = changed
+        # an expression with a variable without a value fails, so it is computed only where the loop does
+        return self._move_invariants(order, changed | skipped) + ret
+
+    def _optimize_loops(self):
+        """The inner loops are optimized first, so the expressions move out of all the loops they do not
+        change in."""
+        loops = []
+        # the nodes in the order of the program, with the switches around them. A switch is [the variables
+        # declared in its body so far, the ones of them declared before a case or a default]
+        stack = [(self._syntax_tree, None, 0, ())]
+        while stack:
+            node, parent, i, switches = stack.pop()
+            if node is None:
+                continue
+
+            kind = node.kind
+            if kind in Optimizer._LOOPS:
+                skipped = set()
+                for _, switch_skipped in switches:
+                    skipped |= switch_skipped
+                loops.append((node, parent, i, skipped))
+            elif kind == NodeKind.DECLARE:
+                for child in node.children:
+                    variable = child.children[0] if child.kind == NodeKind.OP_ASSIGN else child
+                    for declared, _ in switches:
+                        declared.add(variable.index_in_table)
+            elif (kind == NodeKind.KW_CASE or kind == NodeKind.KW_DEFAULT) and switches:
+                # the switch can jump here, past the declarations before
+                declared, switch_skipped = switches[-1]
+                switch_skipped |= declared
+
+            children = node.children
+            if kind == NodeKind.KW_SWITCH:
+                stack.append((children[1], node, 1, switches + ((set(), set()),)))
+                stack.append((children[0], node, 0, switches))
+            else:
+                stack.extend((child, node, j, switches) for j, child in reversed(tuple(enumerate(children))))
+
+        for loop, parent, i, skipped in reversed(loops):
+            before = self._optimize_loop(loop, skipped)
+            if before:
+                block = Parser.Node(self._parser_nodes_tbl, self._parser_nodes_tbl.add("compound_statement"),
+                                    tuple(before) + (loop,), loop.line, loop.index)
+                Optimizer._replace_child(parent, i, block)
+
+    @staticmethod
+    def _range(expression: Parser.Node, ranges: dict):
+        """(the least, the greatest) value of an int expression, or None if it is not known. ranges are the ranges
+        of the variables known at the expression, by their index."""
+        order = []
+        stack = [expression]
+        while stack:
+            node = stack.pop()
+            order.append(node)
+            stack.extend(node.children)
+
+        results = {}
+        for node in reversed(order):
+            kind = node.kind
+            operands = [results[id(child)] for child in node.children]
+
+            if kind == NodeKind.CONST_INT:
+                # a constant that cannot be converted has no value
+                value = node.value().runtime_value
+                ret = None if value is None else (value, value)
+            elif kind == NodeKind.IDENTIFIER:
+                ret = ranges.get(node.index_in_table)
+            elif kind == NodeKind.OP_MOD:
+                # the remainder of a division by a positive number is not negative, whatever the dividend is
+                divisor = node.children[1]
+                modulus = divisor.value().runtime_value if divisor.kind == NodeKind.CONST_INT else None
+                if modulus is None or modulus <= 0:
+                    ret = None
+                elif operands[0] is not None and 0 <= operands[0][0] and operands[0][1] < modulus:
+                    ret = operands[0]
+                else:
+                    ret = (0, modulus - 1)
+            elif None in operands:
+                ret = None
+            elif kind == NodeKind.OP_ADD:
+                ret = (sum(lo for lo, _ in operands), sum(hi for _, hi in operands))
+            elif kind == NodeKind.OP_SUB:
+                if len(operands) == 1:
+                    ret = (-operands[0][1], -operands[0][0])
+                else:
+                    ret = (operands[0][0] - operands[1][1], operands[0][1] - operands[1][0])
+            elif kind == NodeKind.OP_MUL:
+                ret = operands[0]
+                for lo, hi in operands[1:]:
+                    products = (ret[0] * lo, ret[0] * hi, ret[1] * lo, ret[1] * hi)
+                    ret = (min(products), max(products))
+            else:
+                ret = None
+
+            results[id(node)] = ret
+
+        return results[id(expression)]
+
+    def _induction_range(self, for_node: Parser.Node, ranges: dict):
+        """(the induction variable, its range in the body of the for), or None if it is not known.
+
+        The variable starts at the value of the initialization, changes only in the increment, in one direction,
+        and the condition holds in the body, so it is between the first value and the bound of the condition.
+        """
+        induction = Optimizer._induction_step(for_node)
+        if induction is None:
+            return None
+        variable, step = induction
+
+        init, cond, _, body = for_node.children
+        if init is None or cond is None or init.kind != NodeKind.OP_ASSIGN or \
+                init.children[0].kind != NodeKind.IDENTIFIER or init.children[0].index_in_table != variable:
+            return None
+
+        first = Optimizer._range(init.children[1], ranges)
+        if first is None:
+            return None
+        lo, hi = (first[0], None) if step > 0 else (None, first[1])
+
+        # every condition of a chain of && holds in the body
+        for condition in cond.children if cond.kind == NodeKind.OP_AND else (cond,):
+            kind = condition.kind
+            if kind not in Optimizer._COMPARISONS:
+                continue
+
+            left, right = condition.children
+            if right.kind == NodeKind.IDENTIFIER and right.index_in_table == variable:
+                left, right = right, left
+                kind = Optimizer._SWAPPED[kind]
+            if left.kind != NodeKind.IDENTIFIER or left.index_in_table != variable:
+                continue
+
+            bound = Optimizer._range(right, ranges)
+            if bound is None:
+                continue
+
+            if kind == NodeKind.OP_LT:
+                hi = bound[1] - 1 if hi is None else min(hi, bound[1] - 1)
+            elif kind == NodeKind.OP_LE:
+                hi = bound[1] if hi is None else min(hi, bound[1])
+            elif kind == NodeKind.OP_GT:
+                lo = bound[0] + 1 if lo is None else max(lo, bound[0] + 1)
+            else:
+                lo = bound[0] if lo is None else max(lo, bound[0])
+
+        if lo is None or hi is None:
+            return None
+
+        _, changed, has_labels = self._walk_loop(((cond, for_node, 1, Optimizer._EXPRESSION),
+                                                  (body, for_node, 3, Optimizer._STATEMENT)))
+        if has_labels or variable in changed:
+            # a switch can jump into the body, or the body changes the variable
+            return None
+        return variable, (lo, hi)
+
+    @staticmethod
+    def _is_in_bounds(indexation: Parser.Node, ranges: dict) -> bool:
+        tp = indexation.children[0].type
+        if not isinstance(tp, list) or len(indexation.children) != len(tp):
+            # an element of a string, or a part of an array
+            return False
+
+        for index_node, size in zip(indexation.children[1:], tp[1:]):
+            index_range = Optimizer._range(index_node, ranges)
+            if index_range is None or index_range[0] < 0 or index_range[1] >= size:
+                return False
+        return True
+
+    def _mark_indexations_in_bounds(self):
+        """The indexes are proven to be in the bounds from the sizes of the arrays and the ranges of the constants,
+        the induction variables of the for loops around the indexations and the remainders."""
+        # the nodes with the ranges of the variables known in them
+        stack = [(self._syntax_tree, {})]
+
+        while stack:
+            node, ranges = stack.pop()
+            if node is None:
+                # a missing part of a for
+                continue
+
+            kind = node.kind
+            if kind == NodeKind.INDEXATION:
+                if Optimizer._is_in_bounds(node, ranges):
+                    node.kind = NodeKind.INDEXATION_IN_BOUNDS
+            elif kind == NodeKind.KW_FOR:
+                induction = self._induction_range(node, ranges)
+                if induction is not None:
+                    init, cond, increment, body = node.children
+                    stack.extend(((init, ranges), (cond, ranges), (increment, ranges)))
+
+                    variable, variable_range = induction
+                    body_ranges = dict(ranges)
+                    body_ranges[variable] = variable_range
+                    stack.append((body, body_ranges))
+                    continue
+
+            stack.extend((child, ranges) for child in node.children)
+
+    def optimize(self):
+        """Changes the tree in place."""
+        self._fold_constants()
+        self._mark_indexations_in_bounds()
+        self._optimize_loops()
@@ -4,15 +4,36 @@ from working_with_syntax_tree import WorkingWithSyntaxTree
 from constant import Constant
 from variable import Variable
 from lexer import Lexer
-from typing import List, Tuple
+from node_kind import NodeKind
+from symbol_table import SymbolTable
+from token_buffer import TokenBuffer
+from token_store import TokenStore
+from types import GeneratorType
+from typing import Iterable, List, Tuple
 
 def print_tree(root, depth: int = 0):
-    if root is None:
-        return
+    stack = [(root, depth)]
 
-    print('\t' * depth + str(root))
-    for child in root.children:
-        print_tree(child, depth + 1)
+    while stack:
+        node, depth = stack.pop()
+        if node is None:
+            continue
+
+        print('\t' * depth + str(node))
+        stack.extend((child, depth + 1) for child in reversed(node.children))
+
+
+def freeze_tree(root):
+    """Make the children of every node a tuple. The tree does not change after the parsing."""
+    stack = [root]
+
+    while stack:
+        node = stack.pop()
+        if node is None:
+            continue
+
+        node.children = tuple(node.children)
+        stack.extend(node.children)
 
 
 def is_number(s: str):
@@ -85,21 +106,34 @@ class Parser(WorkingWithSyntaxTree):
         def __init__(self, line: int, index: int):
             super().__init__(f"incorrect amount of indexes", line, index)
 
+    class TooDeeplyNested(ParserError):
+        def __init__(self, line: int, index: int):
+            super().__init__("invalid expression is nested too deeply to report the error", line, index)
+
     class Node(Lexer.Token):
-        def __init__(self, tbl = None, index_in_tbl = None, children = None, line: int = 0, index: int = 0):
+        __slots__ = ("children", "kind", "type")
+
+        def __init__(self, tbl = None, index_in_tbl = None, children = None, line: int = 0, index: int = 0,
+                     kind: int = None):
             if children is None:
                 children = []
 
             self.children = children
 
             super().__init__(tbl, index_in_tbl, line, index)
+            if kind is None:
+                # identifiers get another index in the table later, but they stay identifiers
+                kind = NodeKind.UNKNOWN if tbl is None else NodeKind.of(tbl[index_in_tbl])
+            self.kind = kind
+            # the static type of an expression, set by the semantic analyzer. Written like the types of variables
+            self.type = None
 
         def __str__(self):
             return str(self.table[self.index_in_table])
 
-    def __init__(self, tokens: List[Lexer.Token], ops_tbl, idents_tbl, keywords_tbl, consts_tbl):
+    def __init__(self, tokens: Iterable[Lexer.Token], ops_tbl, idents_tbl, keywords_tbl, consts_tbl):
         super().__init__(
-            ["program", "declare", "compound_statement", "indexation"],
+            SymbolTable(["program", "declare", "compound_statement", "indexation"]),
             ops_tbl,
             idents_tbl,
             keywords_tbl,
@@ -107,7 +141,8 @@ class Parser(WorkingWithSyntaxTree):
             None
         )
 
-        self._tokens = tokens
+        self._tokens = None
+        self.set_tokens(tokens)
         self._current_token_index = 0
         # self._switch_expression_type = None  # None if we are not parsing switch, type if we are.
         self._switch_expression_types = []
@@ -117,19 +152,38 @@ class Parser(WorkingWithSyntaxTree):
         self._current_level = 0
         self._blocks_on_levels = [1]
         self._scope_stack = [(0, 1)]
+        # name -> indices in the idents table of the visible variables with this name, the innermost is the last
+        self._declarations = {}
+        # names declared in every block of the scope stack
+        self._declared_names = [[]]
+
+        # if not None, declarations append (index in the idents table, appended, type, nest_level, block_on_level)
+        # here before they change the table
+        self._idents_journal = None
+
+        # results of the expression alternatives while an error is reported, see _parse_with_backtracking
+        self._expression_memo = None
+
+    def set_tokens(self, tokens: Iterable[Lexer.Token]):
+        if isinstance(tokens, TokenStore):
+            # all the tokens are in memory already
+            self._tokens = tokens
+        else:
+            self._tokens = TokenBuffer(tokens)
+        self._current_token_index = 0
 
-    def get_parser_nodes(self) -> list:
+    def get_parser_nodes(self) -> SymbolTable:
         return self._parser_nodes_tbl
 
     def _go_to_next_tok(self):
         self._current_token_index += 1
 
     def _no_more_tokens(self):
-        return self._current_token_index >= len(self._tokens)
+        return not self._tokens.has(self._current_token_index)
 
     def _curr_tok(self) -> Lexer.Token:
         if self._no_more_tokens():
-            tok = self._tokens[len(self._tokens) - 1]
+            tok = self._tokens.last()
             line = tok.line
             index = tok.index + len(tok.table[tok.index_in_table])
             raise Parser.Unexpected("end of file", line, index)
@@ -209,6 +263,11 @@ class Parser(WorkingWithSyntaxTree):
         self._go_to_next_tok()
         return ret
 
+    def _record_ident_change(self, index_in_table: int, appended: bool):
+        if self._idents_journal is not None:
+            var = self._idents_tbl[index_in_table]
+            self._idents_journal.append((index_in_table, appended, var.type, var.nest_level, var.block_on_level))
+
     def _parse_identifier_in_declaration(self, type_node: Node) -> Node:
         tok = self._curr_tok()
         self._match_identifier(tok)
@@ -218,7 +277,8 @@ class Parser(WorkingWithSyntaxTree):
         while self._is_operator(self._curr_tok(), '['):
             self._go_to_next_tok()
             curr_size_node = self._parse_non_negative_int_literal()
-            arr_size = int(curr_size_node.value().value)
+            const = curr_size_node.value()
+            arr_size = const.runtime_value if const.convertible else Constant.convert(const.value, const.type)
 
             if arr_size < 1:
                 raise Parser.ArrSizeLessThan1(curr_size_node.line, curr_size_node.index)
@@ -231,14 +291,20 @@ class Parser(WorkingWithSyntaxTree):
 
         curr_block = self._scope_stack[len(self._scope_stack) - 1]  # 0 - level, 1 - number of block
 
+        declarations = self._declarations.setdefault(ret.value().name, [])
+
         if ret.value().type is not None:
-            for var in self._idents_tbl:
-                if ret.value().name == var.name and curr_block[0] == var.nest_level and curr_block[1] == var.block_on_level:
+            if declarations:
+                var = self._idents_tbl[declarations[-1]]
+                if curr_block[0] == var.nest_level and curr_block[1] == var.block_on_level:
                     raise Parser.DoubleDeclaration(ret.value().name, ret.line, ret.index)
 
             # it is a new variable with the same name. add it to the table
-            self._idents_tbl.append(Variable(ret.value().name, None, 0, 0))
+            self._idents_tbl.append(Variable(ret.value().name, None, curr_block[0], curr_block[1]))
             ret.index_in_table = len(self._idents_tbl) - 1
+            self._record_ident_change(ret.index_in_table, True)
+        else:
+            self._record_ident_change(ret.index_in_table, False)
 
         if len(arr_sizes) < 1:
             ret.table[ret.index_in_table].type = type_node.value()
@@ -247,6 +313,8 @@ class Parser(WorkingWithSyntaxTree):
         ret.table[ret.index_in_table].nest_level = curr_block[0]
         ret.table[ret.index_in_table].block_on_level = curr_block[1]
 
+        declarations.append(ret.index_in_table)
+        self._declared_names[-1].append(ret.value().name)
         return ret
 
     def _parse_identifier_in_using(self, type = None) -> Node:
@@ -263,43 +331,20 @@ class Parser(WorkingWithSyntaxTree):
         if ret.value().type is None:
             raise Parser.UsingOfNotDeclared(ret.value().name, ret.line, ret.index)
 
-        scope_stack_index = len(self._scope_stack) - 1
-        var_real_index = -1
-
-        while scope_stack_index >= 0:
-            curr_block = self._scope_stack[scope_stack_index]
-            searched_var = Variable(ret.value().name, ret.value().type, curr_block[0], curr_block[1])
-
-            try:
-                var_real_index = self._idents_tbl.index(searched_var)
-                break
-            except ValueError:
-                scope_stack_index -= 1
-
-        if var_real_index < 0:
+        declarations = self._declarations.get(ret.value().name)
+        if not declarations:
             raise Parser.UsingOfNotDeclared(ret.value().name, ret.line, ret.index)
 
-        ret.index_in_table = var_real_index
+        ret.index_in_table = declarations[-1]
         return ret
 
     def _parse_identifier_in_using_or_indexation(self, type = None) -> Node:
         ident_node = self._parse_identifier_in_using(type)
         var_type = ident_node.value().type
-        min_indexes_num = 0
-        max_indexes_num = 0
 
         if not isinstance(var_type, list) and var_type != "string":
             return ident_node
 
-        if var_type == "string":
-            max_indexes_num = 1
-        else:
-            # this is an array
-            min_indexes_num = len(var_type) - 1
-            max_indexes_num = min_indexes_num
-            if var_type[0] == "string":
-                max_indexes_num += 1
-
         # num_indexes = len(var_type) - 1
         indexes = []
         while self._is_operator(self._curr_tok(), '['):
@@ -316,20 +361,7 @@ class Parser(WorkingWithSyntaxTree):
         #     self._match_operator(self._curr_tok(), ']')
         #     self._go_to_next_tok()
 
-        if len(indexes) < min_indexes_num or len(indexes) > max_indexes_num:
-            raise Parser.IncorrectNumOfIndexes(ident_node.line, ident_node.index)
-
-        if len(indexes) < 1:
-            return ident_node
-
-        indexation_node = Parser.Node(
-            self._parser_nodes_tbl,
-            self._parser_nodes_tbl.index("indexation"),
-            line=ident_node.line,
-            index=ident_node.index
-        )
-        indexation_node.children = [ident_node] + indexes
-        return indexation_node
+        return self._make_indexation(ident_node, indexes)
 
     def _parse_atoifb(self):
         tok = self._curr_tok()
@@ -360,6 +392,8 @@ class Parser(WorkingWithSyntaxTree):
             self._go_to_next_tok()
         elif tok.table is self._keywords_tbl and tok.value() in ("atoi", "atof"):
             ret = self._parse_atoifb()
+        elif self._is_keyword(tok, ("scan_int", "scan_double")):
+            ret = self._parse_scan(tok.value())
         # elif tok.table is self._consts_tbl and tok.value().type in (Constant.DOUBLE, Constant.INT):
         else:
             self._match_number(tok)
@@ -370,13 +404,14 @@ class Parser(WorkingWithSyntaxTree):
 
     def _parse_term(self) -> Node:
         num1 = self._parse_factor()
+        chain = False
 
         while not self._no_more_tokens() and self._is_mulop(self._curr_tok()):
             opval = self._curr_tok().value()
             op = self._parse_operator(opval)
             num2 = self._parse_factor()
-            op.children = [num1, num2]
-            num1 = op
+            num1 = Parser._join(num1, op, num2, chain)
+            chain = True
 
         return num1
 
@@ -395,18 +430,44 @@ class Parser(WorkingWithSyntaxTree):
         return sign
 
     def _parse_arithmetic_expression(self) -> Node:
+        if self._expression_memo is not None:
+            return self._memoized(("arithmetic",), self._try_arithmetic_expression)
+
+        old_token_index = self._current_token_index
+        try:
+            ret, kind = self._parse_typed_expression()
+            if kind == "arithmetic":
+                return ret
+        except Parser.ParserError:
+            pass
+        self._current_token_index = old_token_index
+        return self._parse_with_backtracking(self._try_arithmetic_expression)
+
+    def _try_arithmetic_expression(self) -> Node:
         term1 = self._parse_signed_term()
+        chain = False
 
         while not self._no_more_tokens() and self._is_addop(self._curr_tok()):
             opval = self._curr_tok().value()
             op = self._parse_operator(opval)
             term2 = self._parse_term()
-            op.children = [term1, term2]
-            term1 = op
+            term1 = Parser._join(term1, op, term2, chain)
+            chain = True
 
         return term1
 
     def _parse_bool_arithm_or_string_expr(self) -> Tuple[Node, str]:
+        if self._expression_memo is not None:
+            return self._memoized(("bool, arithmetic or string",), self._try_bool_arithm_or_string_expr)
+
+        old_token_index = self._current_token_index
+        try:
+            return self._parse_typed_expression()
+        except Parser.ParserError:
+            self._current_token_index = old_token_index
+            return self._parse_with_backtracking(self._try_bool_arithm_or_string_expr)
+
+    def _try_bool_arithm_or_string_expr(self) -> Tuple[Node, str]:
         old_tok = self._curr_tok()
         old_token_index = self._current_token_index
 
@@ -448,9 +509,9 @@ class Parser(WorkingWithSyntaxTree):
         op.children = [expr]
         return op
 
-    def _parse_scan(self) -> Node:
+    def _parse_scan(self, keyword: str = "scan") -> Node:
         tok = self._curr_tok()
-        self._match_keyword(tok, "scan")
+        self._match_keyword(tok, keyword)
         op = Parser.Node(tok.table, tok.index_in_table, line=tok.line, index=tok.index)
 
         self._go_to_next_tok()
@@ -471,8 +532,8 @@ class Parser(WorkingWithSyntaxTree):
             # self._match_var_type(ret, "string")
         elif self._is_keyword(tok, "to_string"):
             ret = self._parse_to_string()
-        elif self._is_keyword(tok, "scan"):
-            ret = self._parse_scan()
+        elif self._is_keyword(tok, ("scan", "scan_word")):
+            ret = self._parse_scan(tok.value())
         else:
             self._match_string(tok)
             ret = Parser.Node(self._consts_tbl, tok.index_in_table, None, tok.line, tok.index)
@@ -481,7 +542,22 @@ class Parser(WorkingWithSyntaxTree):
         return ret
 
     def _parse_string_expression(self) -> Node:
+        if self._expression_memo is not None:
+            return self._memoized(("string",), self._try_string_expression)
+
+        old_token_index = self._current_token_index
+        try:
+            ret, kind = self._parse_typed_expression()
+            if kind == "string":
+                return ret
+        except Parser.ParserError:
+            pass
+        self._current_token_index = old_token_index
+        return self._parse_with_backtracking(self._try_string_expression)
+
+    def _try_string_expression(self) -> Node:
         term1 = self._parse_str_term()
+        chain = False
 
         while not self._no_more_tokens() and \
                 self._curr_tok().table is self._ops_tbl and \
@@ -490,8 +566,8 @@ class Parser(WorkingWithSyntaxTree):
             opval = self._curr_tok().value()
             op = self._parse_operator(opval)
             term2 = self._parse_str_term()
-            op.children = [term1, term2]
-            term1 = op
+            term1 = Parser._join(term1, op, term2, chain)
+            chain = True
 
         return term1
 
@@ -502,6 +578,23 @@ class Parser(WorkingWithSyntaxTree):
         return self._parse_arithmetic_or_string_expression("error while parsing switch expression")
 
     def _parse_arithmetic_or_string_expression(self, possible_err_msg: str) -> Tuple[Node, str]:
+        def parse():
+            return self._try_arithmetic_or_string_expression(possible_err_msg)
+
+        if self._expression_memo is not None:
+            return self._memoized(("arithmetic or string", possible_err_msg), parse)
+
+        old_token_index = self._current_token_index
+        try:
+            ret, kind = self._parse_typed_expression()
+            if kind != "bool":
+                return ret, kind
+        except Parser.ParserError:
+            pass
+        self._current_token_index = old_token_index
+        return self._parse_with_backtracking(parse)
+
+    def _try_arithmetic_or_string_expression(self, possible_err_msg: str) -> Tuple[Node, str]:
         old_tok = self._curr_tok()
         old_token_index = self._current_token_index
 
@@ -586,28 +679,304 @@ class Parser(WorkingWithSyntaxTree):
 
     def _parse_bool_term(self) -> Node:
         factor1 = self._parse_not_bool_factor()
+        chain = False
 
         while not self._no_more_tokens() and self._is_operator(self._curr_tok(), '&&'):
             opval = self._curr_tok().value()
             op = self._parse_operator(opval)
             factor2 = self._parse_not_bool_factor()
-            op.children = [factor1, factor2]
-            factor1 = op
+            factor1 = Parser._join(factor1, op, factor2, chain)
+            chain = True
 
         return factor1
 
     def _parse_bool_expression(self) -> Node:
+        if self._expression_memo is not None:
+            return self._memoized(("bool",), self._try_bool_expression)
+
+        old_token_index = self._current_token_index
+        try:
+            ret, kind = self._parse_typed_expression()
+            if kind == "bool":
+                return ret
+        except Parser.ParserError:
+            pass
+        self._current_token_index = old_token_index
+        return self._parse_with_backtracking(self._try_bool_expression)
+
+    def _try_bool_expression(self) -> Node:
         term1 = self._parse_bool_term()
+        chain = False
 
         while not self._no_more_tokens() and self._is_operator(self._curr_tok(), '||'):
             opval = self._curr_tok().value()
             op = self._parse_operator(opval)
             term2 = self._parse_bool_term()
-            op.children = [term1, term2]
-            term1 = op
+            term1 = Parser._join(term1, op, term2, chain)
+            chain = True
 
         return term1
 
+    # Expressions are parsed in one pass: the kind of an operand ("bool", "arithmetic" or "string") is known as soon
+    # as its first primary is parsed, so no alternative has to be tried and thrown away. The grammar and the trees
+    # are the same as of the _try_* methods, which try the alternatives one after another. Those are still used
+    # when the typed parser fails, because their error messages are the ones the users see.
+    #
+    # The operators waiting for their right operands and the open brackets are kept on stacks, not in the Python
+    # stack, so any nesting can be parsed.
+
+    # how strongly the operators bind. a sign applies to a term, '!' to a comparison
+    _OR, _AND, _NOT, _COMPARISON, _SUM, _SIGN, _TERM = range(7)
+
+    _BINARY_PRECEDENCE = {
+        '||': _OR, '&&': _AND,
+        '==': _COMPARISON, '!=': _COMPARISON, '>=': _COMPARISON, '<=': _COMPARISON, '>': _COMPARISON, '<': _COMPARISON,
+        '+': _SUM, '-': _SUM,
+        '*': _TERM, '/': _TERM, '%': _TERM,
+    }
+
+    # which prefix operators can start an operand: after '(', '&&' and '||' both, after '!' and a comparison a sign,
+    # after a sign and an arithmetic operator none
+    _ANY_PREFIX, _SIGN_PREFIX, _NO_PREFIX = range(3)
+
+    # the brackets an operand can be in
+    _PARENTHESES, _CALL, _INDEX = range(3)
+
+    _ASSOCIATIVE = (NodeKind.OP_ADD, NodeKind.OP_MUL, NodeKind.OP_AND, NodeKind.OP_OR)
+
+    @staticmethod
+    def _join(left: Node, op: Node, right: Node, left_is_chain: bool) -> Node:
+        """left op right. left_is_chain tells that left is the result of the previous operation of the same chain,
+        as in a + b + c. A chain of an associative operator makes one node with all the operands."""
+        if left_is_chain and left.kind == op.kind and op.kind in Parser._ASSOCIATIVE:
+            left.children.append(right)
+            return left
+
+        op.children = [left, right]
+        return op
+
+    def _make_indexation(self, ident_node: Node, indexes: List[Node]) -> Node:
+        var_type = ident_node.value().type
+
+        if var_type == "string":
+            min_indexes_num = 0
+            max_indexes_num = 1
+        else:
+            # this is an array
+            min_indexes_num = len(var_type) - 1
+            max_indexes_num = min_indexes_num
+            if var_type[0] == "string":
+                max_indexes_num += 1
+
+        if len(indexes) < min_indexes_num or len(indexes) > max_indexes_num:
+            raise Parser.IncorrectNumOfIndexes(ident_node.line, ident_node.index)
+
+        if len(indexes) < 1:
+            return ident_node
+
+        indexation_node = Parser.Node(
+            self._parser_nodes_tbl,
+            self._parser_nodes_tbl.index("indexation"),
+            line=ident_node.line,
+            index=ident_node.index
+        )
+        indexation_node.children = [ident_node] + indexes
+        return indexation_node
+
+    def _apply_operator(self, operators: list, operands: list):
+        """Replace the last operands by the result of the last operator."""
+        precedence, op = operators.pop()
+
+        if precedence in (Parser._NOT, Parser._SIGN):
+            node, kind, _ = operands.pop()
+            expected = "bool" if precedence == Parser._NOT else "arithmetic"
+            if kind != expected:
+                raise Parser.Expected(f"{expected} expression", op.line, op.index)
+
+            op.children = [node]
+            operands.append((op, kind, False))
+            return
+
+        right, kind2, _ = operands.pop()
+        left, kind1, left_is_chain = operands.pop()
+
+        if precedence in (Parser._OR, Parser._AND):
+            if kind1 != "bool" or kind2 != "bool":
+                raise Parser.Expected("bool expression", op.line, op.index)
+            kind = "bool"
+        elif precedence == Parser._COMPARISON:
+            if kind1 == "bool" or kind2 == "bool":
+                raise Parser.Expected("arithmetic or string expression", op.line, op.index)
+            if kind1 != kind2:
+                raise Parser.CannotCompare(op.line, op.index)
+            kind = "bool"
+        elif kind1 == kind2 == "arithmetic" or (kind1 == kind2 == "string" and op.kind == NodeKind.OP_ADD):
+            kind = kind1
+        else:
+            raise Parser.Expected("arithmetic expression", op.line, op.index)
+
+        operands.append((Parser._join(left, op, right, left_is_chain), kind, True))
+
+    def _close_expression(self, operators: list, operands: list) -> Tuple[Node, str]:
+        while operators:
+            self._apply_operator(operators, operands)
+        node, kind, _ = operands[0]
+        return node, kind
+
+    def _parse_typed_expression(self) -> Tuple[Node, str]:
+        operators = []  # (precedence, node) of the operators waiting for their right operands
+        operands = []  # (node, kind, is it the result of a binary operator)
+        # (which bracket, the node it belongs to, the operators and operands outside of it) of the open brackets
+        brackets = []
+        prefixes = Parser._ANY_PREFIX
+        expect_operand = True
+
+        while True:
+            if expect_operand:
+                tok = self._curr_tok()
+
+                if prefixes != Parser._NO_PREFIX and self._is_addop(tok):
+                    operators.append((Parser._SIGN, self._parse_operator(tok.value())))
+                    prefixes = Parser._NO_PREFIX
+                    continue
+                if prefixes == Parser._ANY_PREFIX and self._is_operator(tok, '!'):
+                    operators.append((Parser._NOT, self._parse_operator('!')))
+                    prefixes = Parser._SIGN_PREFIX
+                    continue
+
+                bracket = None
+                if tok.table is self._idents_tbl:
+                    tp = tok.value().type
+                    actual_type = tp[0] if isinstance(tp, list) else tp
+
+                    if tp == "bool":
+                        operand, kind = self._parse_identifier_in_using("bool"), "bool"
+                    elif actual_type in ("int", "double"):
+                        operand, kind = self._parse_identifier_in_using(("int", "double")), "arithmetic"
+                    elif actual_type == "string":
+                        operand, kind = self._parse_identifier_in_using("string"), "string"
+                    else:
+                        # not declared variable or array of bools
+                        raise Parser.Expected("expression", tok.line, tok.index)
+
+                    var_type = operand.value().type
+                    if isinstance(var_type, list) or var_type == "string":
+                        if self._is_operator(self._curr_tok(), '['):
+                            bracket, owner = Parser._INDEX, (operand, [], kind)
+                        else:
+                            operand = self._make_indexation(operand, [])
+                elif self._is_operator(tok, '('):
+                    bracket, owner = Parser._PARENTHESES, tok
+                elif self._is_keyword(tok, ("atoi", "atof", "atob", "to_string")):
+                    owner = Parser.Node(tok.table, tok.index_in_table, line=tok.line, index=tok.index)
+                    self._go_to_next_tok()
+                    self._match_operator(self._curr_tok(), '(')
+                    bracket = Parser._CALL
+                elif self._is_keyword(tok, ("true", "false")):
+                    operand, kind = self._parse_bool_literal(), "bool"
+                elif self._is_keyword(tok, ("scan", "scan_word")) or self._is_string_constant(tok):
+                    operand, kind = self._parse_str_term(), "string"
+                elif self._is_keyword(tok, ("scan_int", "scan_double")):
+                    operand, kind = self._parse_scan(tok.value()), "arithmetic"
+                else:
+                    self._match_number(tok)
+                    self._go_to_next_tok()
+                    operand = Parser.Node(self._consts_tbl, tok.index_in_table, None, tok.line, tok.index)
+                    kind = "arithmetic"
+
+                if bracket is None:
+                    operands.append((operand, kind, False))
+                    expect_operand = False
+                else:
+                    # skip the opening bracket and parse the expression in it
+                    self._go_to_next_tok()
+                    brackets.append((bracket, owner, operators, operands))
+                    operators, operands, prefixes = [], [], Parser._ANY_PREFIX
+                continue
+
+            # an operand was parsed. it is followed by a binary operator, a closing bracket or the end of the expression
+            if not self._no_more_tokens():
+                tok = self._curr_tok()
+                if tok.table is self._ops_tbl and tok.value() in Parser._BINARY_PRECEDENCE:
+                    # the operators before it that bind at least as strongly get their operands
+                    precedence = Parser._BINARY_PRECEDENCE[tok.value()]
+                    while operators and operators[-1][0] >= precedence:
+                        self._apply_operator(operators, operands)
+                    operators.append((precedence, self._parse_operator(tok.value())))
+
+                    if precedence in (Parser._OR, Parser._AND):
+                        prefixes = Parser._ANY_PREFIX
+                    elif precedence == Parser._COMPARISON:
+                        prefixes = Parser._SIGN_PREFIX
+                    else:
+                        prefixes = Parser._NO_PREFIX
+                    expect_operand = True
+                    continue
+
+            if not brackets:
+                return self._close_expression(operators, operands)
+
+            bracket, owner, outer_operators, outer_operands = brackets.pop()
+            self._match_operator(self._curr_tok(), ']' if bracket == Parser._INDEX else ')')
+            inner, inner_kind = self._close_expression(operators, operands)
+            operators, operands = outer_operators, outer_operands
+            self._go_to_next_tok()
+
+            if bracket == Parser._PARENTHESES:
+                if inner_kind == "string":
+                    raise Parser.Expected("bool or arithmetic expression", owner.line, owner.index)
+                operands.append((inner, inner_kind, False))
+            elif bracket == Parser._CALL:
+                if owner.kind == NodeKind.KW_TO_STRING:
+                    kind = "string"
+                elif inner_kind != "string":
+                    raise Parser.Expected("string expression", owner.line, owner.index)
+                else:
+                    kind = "bool" if owner.kind == NodeKind.KW_ATOB else "arithmetic"
+                owner.children = [inner]
+                operands.append((owner, kind, False))
+            else:
+                ident_node, indexes, kind = owner
+                if inner_kind != "arithmetic":
+                    raise Parser.Expected("arithmetic expression", inner.line, inner.index)
+                indexes.append(inner)
+
+                if self._is_operator(self._curr_tok(), '['):
+                    self._go_to_next_tok()
+                    brackets.append((Parser._INDEX, owner, operators, operands))
+                    operators, operands, prefixes = [], [], Parser._ANY_PREFIX
+                    expect_operand = True
+                else:
+                    operands.append((self._make_indexation(ident_node, indexes), kind, False))
+
+    def _parse_with_backtracking(self, parse):
+        # every alternative is parsed at most once for a token, so even the error reports take linear time
+        tok = self._curr_tok()
+        self._expression_memo = {}
+        try:
+            return parse()
+        except RecursionError:
+            # the alternatives are parsed recursively. only the typed parser has no limit of nesting
+            raise Parser.TooDeeplyNested(tok.line, tok.index)
+        finally:
+            self._expression_memo = None
+
+    def _memoized(self, key: tuple, parse):
+        key += (self._current_token_index,)
+
+        if key not in self._expression_memo:
+            try:
+                self._expression_memo[key] = (parse(), self._current_token_index)
+            except Parser.ParserError as err:
+                self._expression_memo[key] = (err, None)
+                raise
+
+        ret, end = self._expression_memo[key]
+        if end is None:
+            raise ret
+        self._current_token_index = end
+        return ret
+
     def _parse_print(self) -> Node:
         tok = self._curr_tok()
         self._match_keyword(tok, "print")
@@ -678,12 +1047,27 @@ class Parser(WorkingWithSyntaxTree):
         block_num = self._blocks_on_levels[self._current_level]
 
         self._scope_stack.append((self._current_level, block_num))
+        self._declared_names.append([])
 
     def _exit_current_block(self):
         self._current_level -= 1
         self._scope_stack.pop()
 
-    def _parse_compound_statement(self) -> Node:
+        for name in self._declared_names.pop():
+            self._declarations[name].pop()
+
+    def reset_scopes(self):
+        """Forget the inner blocks and find the variables of the outer block in the idents table again.
+        Needed when the table is changed not by the parser."""
+        self._declarations = {}
+        self._declared_names = [[]]
+
+        for index_in_table, var in enumerate(self._idents_tbl):
+            if var.type is not None and var.nest_level == 0 and var.block_on_level == 1:
+                self._declarations[var.name] = [index_in_table]
+                self._declared_names[0].append(var.name)
+
+    def _parse_compound_statement(self):
         tok = self._curr_tok()
         self._match_operator(tok, '{')
 
@@ -694,7 +1078,7 @@ class Parser(WorkingWithSyntaxTree):
                                 line=tok.line, index=tok.index)
 
         while not self._no_more_tokens() and not self._is_operator(self._curr_tok(), '}'):
-            statement.children.append(self._parse_statement())
+            statement.children.append((yield self._begin_statement()))
 
         self._match_operator(self._curr_tok(), '}')
         self._exit_current_block()
@@ -727,7 +1111,7 @@ class Parser(WorkingWithSyntaxTree):
 
         return op_node
 
-    def _parse_if(self) -> Node:
+    def _parse_if(self):
         tok = self._curr_tok()
         self._match_keyword(tok, "if")
         if_node = Parser.Node(tok.table, tok.index_in_table, line=tok.line, index=tok.index)
@@ -740,17 +1124,17 @@ class Parser(WorkingWithSyntaxTree):
         self._match_operator(self._curr_tok(), ")")
         self._go_to_next_tok()
 
-        statement_if = self._parse_statement()
+        statement_if = yield self._begin_statement()
         if_node.children = [condition_node, statement_if]
 
         if not self._no_more_tokens() and self._is_keyword(self._curr_tok(), "else"):
             self._go_to_next_tok()
-            statement_else = self._parse_statement()
+            statement_else = yield self._begin_statement()
             if_node.children.append(statement_else)
 
         return if_node
 
-    def _parse_while(self) -> Node:
+    def _parse_while(self):
         tok = self._curr_tok()
         self._match_keyword(tok, "while")
         while_node = Parser.Node(tok.table, tok.index_in_table, line=tok.line, index=tok.index)
@@ -765,7 +1149,7 @@ class Parser(WorkingWithSyntaxTree):
 
         self._num_loops += 1
         # self._inside_of_loop = True
-        statement = self._parse_statement()
+        statement = yield self._begin_statement()
         # self._inside_of_loop = False
         self._num_loops -= 1
 
@@ -773,7 +1157,7 @@ class Parser(WorkingWithSyntaxTree):
 
         return while_node
 
-    def _parse_for(self) -> Node:
+    def _parse_for(self):
         tok = self._curr_tok()
         self._match_keyword(tok, "for")
         for_node = Parser.Node(tok.table, tok.index_in_table, line=tok.line, index=tok.index)
@@ -803,14 +1187,14 @@ class Parser(WorkingWithSyntaxTree):
 
         # self._inside_of_loop = True
         self._num_loops += 1
-        body_node = self._parse_statement()
+        body_node = yield self._begin_statement()
         # self._inside_of_loop = False
         self._num_loops -= 1
 
         for_node.children = [init_node, condition_node, iteration_node, body_node]
         return for_node
 
-    def _parse_switch(self) -> Node:
+    def _parse_switch(self):
         tok = self._curr_tok()
         self._match_keyword(tok, "switch")
         switch_node = Parser.Node(tok.table, tok.index_in_table, line=tok.line, index=tok.index)
@@ -826,7 +1210,7 @@ class Parser(WorkingWithSyntaxTree):
         self._match_operator(self._curr_tok(), ")")
         self._go_to_next_tok()
 
-        block_node = self._parse_compound_statement()
+        block_node = yield self._parse_compound_statement()
 
         # self._switch_expression_type = None
         self._switch_expression_types.pop()
@@ -883,6 +1267,29 @@ class Parser(WorkingWithSyntaxTree):
         return case_node
 
     def _parse_statement(self) -> Node:
+        # Statements nest in statements. A statement that has inner statements is parsed by a generator, which
+        # yields what _begin_statement returns for its inner statement and gets the node of it back. The generators
+        # wait on a stack instead of the Python stack, so the nesting is not limited.
+        waiting = []
+        ret = self._begin_statement()
+
+        while True:
+            if isinstance(ret, GeneratorType):
+                waiting.append(ret)
+                ret = None
+            elif not waiting:
+                return ret
+
+            try:
+                ret = waiting[-1].send(ret)
+            except StopIteration as stop:
+                waiting.pop()
+                ret = stop.value
+
+    def _begin_statement(self):
+        """Parse a statement without inner statements, or return the generator that parses it."""
+        # the parser never goes back past the beginning of a statement
+        self._tokens.release(self._current_token_index)
         tok = self._curr_tok()
 
         self._check_for_forbidden_statements(tok)
@@ -922,12 +1329,35 @@ class Parser(WorkingWithSyntaxTree):
 
         return prog
 
+    def parse_top_level_statement(self, token_index: int, blocks_on_levels: list, journal: list) -> Tuple[Node, int]:
+        """Parse one statement of the program, starting at token_index, as _parse_program would.
+
+        blocks_on_levels is the number of blocks met so far on every level, it is updated in place.
+        The changes of the idents table are appended to journal. Returns the node and the index of the next token.
+        """
+        self._current_token_index = token_index
+        self._blocks_on_levels = blocks_on_levels
+        self._idents_journal = journal
+
+        try:
+            ret = self._parse_statement()
+            freeze_tree(ret)
+        finally:
+            self._idents_journal = None
+            while len(self._scope_stack) > 1:
+                self._exit_current_block()
+            self._switch_expression_types = []
+            self._num_loops = 0
+
+        return ret, self._current_token_index
+
     def create_syntax_tree(self):
-        if len(self._tokens) == 0:
+        if not self._tokens.has(0):
             return
 
         try:
             self._syntax_tree = self._parse_program()
+            freeze_tree(self._syntax_tree)
         except Parser.ParserError as err:
             print(f"PARSER ERROR:\n{err}")
             sys.exit(1)
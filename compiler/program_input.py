@@ -0,0 +1,157 @@
+import locale
+import sys
+from typing import BinaryIO, Optional
+
+from program_output import ProgramOutput
+
+
+class ProgramInput:
+    """What the program reads. The input is read from a binary stream in chunks of up to chunk_size bytes, and the
+    lines and the words are cut from the chunk, so reading a value does not call the stream. The output is flushed
+    before a chunk is read, so what the program printed is seen before it waits for the input.
+
+    The words are split ahead in a window of the chunk, which grows while the program reads words and starts small
+    again after it reads a line, so a program reading only words splits whole chunks at once and one mixing words
+    and lines does not split much it does not read as words.
+
+    Without a stream the input is sys.stdin, looked up when a chunk is read. It is read ahead, so nothing else
+    reads sys.stdin while the program runs. Without an encoding the input is decoded like input() decodes it,
+    with the encoding and the errors of sys.stdin, or for a stream like open() does, with the encoding of the
+    locale.
+    """
+
+    DEFAULT_CHUNK_SIZE = 64 * 2 ** 10
+
+    # the size of the first window of the words split ahead
+    _FIRST_WINDOW = 256
+
+    def __init__(self, output: Optional[ProgramOutput] = None, stream: Optional[BinaryIO] = None,
+                 chunk_size: int = DEFAULT_CHUNK_SIZE, encoding: Optional[str] = None):
+        self._output = output
+        self._stream = stream
+        self._chunk_size = chunk_size
+        # if True, the encoding is the one of sys.stdin when a chunk is read
+        self._stdin_encoding = encoding is None and stream is None
+        if encoding is None and stream is not None:
+            encoding = locale.getpreferredencoding(False)
+        self._encoding = encoding
+        self._errors = "strict"
+        # the input read and not taken yet is self._buffer[self._pos:], and the words split ahead
+        self._buffer = b""
+        self._pos = 0
+
+        # the words split ahead from self._buffer[self._words_start:self._pos], the next one last. None is always
+        # at the bottom, so taking it tells that the words are all taken
+        self._words = [None]
+        self._words_start = 0
+        self._window = ProgramInput._FIRST_WINDOW
+
+    def _fill(self) -> bool:
+        """Reads the next chunk after what is left of the buffer. Returns False at the end of the input."""
+        if self._output is not None:
+            self._output.flush()
+
+        stream = self._stream
+        if stream is None:
+            stdin = sys.stdin
+            if self._stdin_encoding:
+                self._encoding = getattr(stdin, "encoding", None) or "utf-8"
+                self._errors = getattr(stdin, "errors", None) or "strict"
+            stream = getattr(stdin, "buffer", None)
+            if stream is None:
+                # sys.stdin is replaced with a text stream
+                chunk = stdin.read(self._chunk_size).encode(self._encoding, self._errors)
+        if stream is not None:
+            # read1 returns what the stream has, so a line typed in is read without waiting for a whole chunk
+            read = getattr(stream, "read1", stream.read)
+            chunk = read(self._chunk_size)
+
+        if not chunk:
+            return False
+        self._buffer = self._buffer[self._pos:] + chunk
+        self._pos = 0
+        return True
+
+    def _take_back_words(self):
+        """Makes the words split ahead and not taken the input again, so it goes on after the last word taken."""
+        words = self._words
+        if len(words) > 1:
+            # at least one of the words is taken, so the first part is the input up to the end of the last one
+            taken = self._buffer[self._words_start:self._pos].rsplit(None, len(words) - 1)[0]
+            self._pos = self._words_start + len(taken)
+            self._words = [None]
+        self._window = ProgramInput._FIRST_WINDOW
+
+    def read_line(self) -> str:
+        """The next line without its end, as input() returns it: a line ended by \\r\\n keeps the \\r. Raises
+        EOFError at the end of the input."""
+        self._take_back_words()
+
+        # the bytes after self._pos known to have no line end
+        scanned = 0
+        while True:
+            end = self._buffer.find(b"\n", self._pos + scanned)
+            if end >= 0:
+                line = self._buffer[self._pos:end]
+                self._pos = end + 1
+                break
+
+            scanned = len(self._buffer) - self._pos
+            if not self._fill():
+                # the last line has no end
+                line = self._buffer[self._pos:]
+                if not line:
+                    raise EOFError("no more input")
+                self._pos = len(self._buffer)
+                break
+
+        return line.decode(self._encoding, self._errors)
+
+    def read_token(self) -> bytes:
+        """The bytes of the next word, which is ended by whitespace or by the end of the input. The whitespace
+        before it is skipped. Raises EOFError if there is no word before the end of the input."""
+        word = self._words.pop()
+        if word is not None:
+            return word
+        return self._split_words()
+
+    def _split_words(self) -> bytes:
+        """Splits the words in the window after the input taken and returns the first one."""
+        self._words = [None]
+        while True:
+            buffer = self._buffer
+            part = buffer[self._pos:self._pos + self._window]
+            words = part.split()
+
+            partial = None
+            if words and not part[-1:].isspace() and not buffer[self._pos + len(part):][:1].isspace():
+                # the last word can go on after the window
+                partial = words.pop()
+                part = part[:len(part) - len(partial)]
+
+            if words:
+                words.append(None)
+                words.reverse()
+                self._words = words
+                self._words_start = self._pos
+                # the input taken ends with the last word
+                self._pos += len(part.rstrip())
+                # the program reads words, so more are split at once
+                self._window = min(2 * self._window, self._chunk_size)
+                return words.pop()
+
+            # no whole word in the window, the whitespace in it is skipped
+            self._pos += len(part)
+            if partial is not None and self._pos + len(partial) < len(buffer):
+                # the word is longer than the window
+                self._window *= 2
+            elif partial is None and self._pos < len(buffer):
+                continue
+            elif not self._fill():
+                if partial is None:
+                    raise EOFError("no more input")
+                self._pos = len(self._buffer)
+                return partial
+
+    def read_word(self) -> str:
+        return self.read_token().decode(self._encoding, self._errors)
@@ -0,0 +1,80 @@
+import io
+import locale
+import sys
+from typing import BinaryIO, Optional
+
+
+class ProgramOutput:
+    """What the program prints. The strings are gathered and written to a binary stream at once when there are
+    buffer_size characters of them, instead of a write for every print. The engines flush it when the program
+    ends or fails, and before the program waits for its input.
+
+    Without a stream the output goes to sys.stdout, looked up when it is flushed, so a redirection of
+    sys.stdout is followed. Without an encoding the output is encoded like print() encodes it, with the encoding
+    and the errors of sys.stdout, or for a stream like open() does, with the encoding of the locale.
+    """
+
+    DEFAULT_BUFFER_SIZE = 64 * 2 ** 10
+
+    def __init__(self, stream: Optional[BinaryIO] = None, buffer_size: int = DEFAULT_BUFFER_SIZE,
+                 encoding: Optional[str] = None):
+        self._stream = stream
+        self._buffer_size = buffer_size
+        if encoding is None and stream is not None:
+            encoding = locale.getpreferredencoding(False)
+        self._encoding = encoding
+        self._parts = []
+        # the number of the characters in the parts
+        self._size = 0
+
+    @staticmethod
+    def to_file(path: str, buffer_size: int = DEFAULT_BUFFER_SIZE) -> "ProgramOutput":
+        """The output written to the file at path, which is created or truncated. close() closes it."""
+        return ProgramOutput(open(path, "wb"), buffer_size)
+
+    @staticmethod
+    def in_memory(buffer_size: int = DEFAULT_BUFFER_SIZE) -> "ProgramOutput":
+        """The output kept in memory, read with getvalue()."""
+        return ProgramOutput(io.BytesIO(), buffer_size)
+
+    def write(self, text: str):
+        self._parts.append(text)
+        self._size += len(text)
+        if self._size >= self._buffer_size:
+            self.flush()
+
+    def flush(self):
+        if not self._parts:
+            return
+
+        text = "".join(self._parts)
+        self._parts = []
+        self._size = 0
+
+        stream = self._stream
+        encoding, errors = self._encoding, "strict"
+        if stream is None:
+            stdout = sys.stdout
+            stream = getattr(stdout, "buffer", None)
+            if stream is None:
+                # sys.stdout is replaced with a text stream
+                stdout.write(text)
+                stdout.flush()
+                return
+            # what was printed to sys.stdout before goes first
+            stdout.flush()
+            if encoding is None:
+                encoding, errors = stdout.encoding, stdout.errors
+
+        stream.write(text.encode(encoding, errors))
+        stream.flush()
+
+    def getvalue(self) -> str:
+        """Everything written to the in-memory output."""
+        self.flush()
+        return self._stream.getvalue().decode(self._encoding)
+
+    def close(self):
+        self.flush()
+        if self._stream is not None:
+            self._stream.close()
@@ -1,8 +1,10 @@
 import sys
+from typing import Optional
 
 from working_with_syntax_tree import WorkingWithSyntaxTree
 from parser import Parser
-from constant import Constant
+from node_kind import NodeKind
+from symbol_table import SymbolTable
 
 
 class SemanticAnalyzer(WorkingWithSyntaxTree):
@@ -44,97 +46,203 @@ class SemanticAnalyzer(WorkingWithSyntaxTree):
         def __init__(self, line: int, index: int):
             super().__init__("case and default must be on the first nest level", line, index)
 
-    def __init__(self, parser_nodes: list, operators: list, identifiers: list, keywords: list,
-                 consts: list, syntax_tree):
+    # the types of the expressions that do not depend on the operands. / is a true division, so its value
+    # is a double even for int operands
+    _FIXED_TYPES = {
+        NodeKind.CONST_INT: "int",
+        NodeKind.CONST_DOUBLE: "double",
+        NodeKind.CONST_STRING: "string",
+        NodeKind.KW_TRUE: "bool",
+        NodeKind.KW_FALSE: "bool",
+        NodeKind.KW_SCAN: "string",
+        NodeKind.KW_SCAN_INT: "int",
+        NodeKind.KW_SCAN_DOUBLE: "double",
+        NodeKind.KW_SCAN_WORD: "string",
+        NodeKind.KW_TO_STRING: "string",
+        NodeKind.KW_ATOI: "int",
+        NodeKind.KW_ATOF: "double",
+        NodeKind.KW_ATOB: "bool",
+        NodeKind.OP_DIV: "double",
+        NodeKind.OP_AND: "bool",
+        NodeKind.OP_OR: "bool",
+        NodeKind.OP_NOT: "bool",
+        NodeKind.OP_EQ: "bool",
+        NodeKind.OP_NE: "bool",
+        NodeKind.OP_LT: "bool",
+        NodeKind.OP_LE: "bool",
+        NodeKind.OP_GT: "bool",
+        NodeKind.OP_GE: "bool",
+    }
+
+    _ARITHMETIC = (NodeKind.OP_ADD, NodeKind.OP_SUB, NodeKind.OP_MUL, NodeKind.OP_MOD)
+    _TYPED_BY_OPERANDS = frozenset(_ARITHMETIC + (NodeKind.IDENTIFIER, NodeKind.INDEXATION))
+
+    # the nodes with checks of their own
+    _CHECKED = frozenset((NodeKind.OP_DIV, NodeKind.OP_MOD, NodeKind.KW_SWITCH, NodeKind.KW_CASE,
+                          NodeKind.INDEXATION))
+
+    def __init__(self, parser_nodes: SymbolTable, operators: SymbolTable, identifiers: SymbolTable,
+                 keywords: SymbolTable, consts: SymbolTable, syntax_tree):
         super().__init__(parser_nodes, operators, identifiers, keywords, consts, syntax_tree)
 
-    def _check_int_expression(self, root: Parser.Node):
-        if root is None:
-            return
-
-        if root.table is self._consts_tbl and root.value().type == Constant.DOUBLE:
-            # raise SemanticAnalyzer.InvalidModOperands(root.line, root.index)
-            raise SemanticAnalyzer.IntExpected(root.line, root.index)
-        if root.table is self._keywords_tbl and root.value() == "atof":
-            # raise SemanticAnalyzer.InvalidModOperands(root.line, root.index)
-            raise SemanticAnalyzer.IntExpected(root.line, root.index)
-        if root.table is self._keywords_tbl and root.value() == "atoi":
-            return
-        if root.table is self._idents_tbl:
-            if not isinstance(root.value().type, list):
-                if root.value().type == "double":
-                    raise SemanticAnalyzer.IntExpected(root.line, root.index)
+    @staticmethod
+    def _type_of(node: Parser.Node):
+        """The static type of the node, from the types of its operands. None for statements."""
+        kind = node.kind
+
+        tp = SemanticAnalyzer._FIXED_TYPES.get(kind)
+        if tp is not None:
+            return tp
+
+        if kind == NodeKind.IDENTIFIER:
+            return node.value().type
+        if kind == NodeKind.INDEXATION:
+            # an element of an array, or a symbol of a string
+            tp = node.children[0].type
+            return tp[0] if isinstance(tp, list) else tp
+        if kind in SemanticAnalyzer._ARITHMETIC:
+            ret = "int"
+            for child in node.children:
+                if child.type == "string":
+                    return "string"
+                if child.type == "double":
+                    ret = "double"
+            return ret
+        return None
+
+    def _check_node(self, node: Parser.Node, results: list) -> Optional[SemanticError]:
+        """The error of the checks of the node itself. results are (first double source, first error) of the
+        children."""
+        kind = node.kind
+
+        if kind == NodeKind.OP_DIV:
+            divisor = node.children[1]
+
+            # a constant that cannot be converted fails where it is computed
+            if divisor.kind in (NodeKind.CONST_DOUBLE, NodeKind.CONST_INT) and divisor.value().runtime_value == 0:
+                return SemanticAnalyzer.DivisionByZero(divisor.line, divisor.index)
+        elif kind == NodeKind.OP_MOD:
+            for double_source, _ in results:
+                if double_source is not None:
+                    return SemanticAnalyzer.IntExpected(double_source.line, double_source.index)
+        elif kind == NodeKind.KW_SWITCH or kind == NodeKind.KW_CASE:
+            expression = node.children[0]
+            double_source = results[0][0]
+
+            if double_source is expression:
+                return SemanticAnalyzer.DoubleNotAllowed(expression.line, expression.index)
+            if double_source is not None and expression.kind not in (NodeKind.KW_TO_STRING, NodeKind.KW_SCAN):
+                return SemanticAnalyzer.IntExpected(double_source.line, double_source.index)
+
+            if kind == NodeKind.KW_SWITCH:
+                try:
+                    self._check_double_default(node.children[1], 0)
+                except SemanticAnalyzer.SemanticError as err:
+                    return err
+        elif kind == NodeKind.INDEXATION:
+            for double_source, _ in results[1:]:
+                if double_source is not None:
+                    return SemanticAnalyzer.IntExpected(double_source.line, double_source.index)
+
+        return None
+
+    def _analyze(self, root: Parser.Node) -> Optional[SemanticError]:
+        """Sets the types of all the nodes of the tree and returns the first error, or None.
+
+        The nodes are visited once, every node after its operands. Every node gives its parent the first
+        double source in it (outside of atoi), which the checks of int expressions need, and the first error
+        in it in preorder, which is the error reported.
+        """
+        fixed_types = SemanticAnalyzer._FIXED_TYPES
+        typed_by_operands = SemanticAnalyzer._TYPED_BY_OPERANDS
+        checked = SemanticAnalyzer._CHECKED
+        no_result = (None, None)
+
+        # the children are pushed from the first, so they are taken from the last, and the reversed order
+        # has every node after its children, which are in their order
+        order = []
+        stack = [root]
+        while stack:
+            node = stack.pop()
+            order.append(node)
+            if node is not None:
+                stack.extend(node.children)
+
+        results = []
+
+        for node in reversed(order):
+            if node is None:
+                # a missing part of a for
+                results.append(no_result)
+                continue
+
+            num_children = len(node.children)
+            if num_children:
+                children_results = results[-num_children:]
+                del results[-num_children:]
             else:
-                if root.value().type[0] == "double":
-                    raise SemanticAnalyzer.IntExpected(root.line, root.index)
-
-        for child in root.children:
-            self._check_int_expression(child)
-
-    def _check_not_double_expression(self, root: Parser.Node):
-        if root is None:
-            return
-
-        if root.table is self._consts_tbl and root.value().type == Constant.DOUBLE:
-            raise SemanticAnalyzer.DoubleNotAllowed(root.line, root.index)
-        # if root.table is self._keywords_tbl and root.value() in ("atof", "atob"):
-        if root.table is self._keywords_tbl and root.value() == "atof":
-            raise SemanticAnalyzer.DoubleNotAllowed(root.line, root.index)
-        if root.table is self._keywords_tbl and root.value() in ("atoi", "to_string", "scan"):
-            return
-        if root.table is self._idents_tbl:
-            if not isinstance(root.value().type, list):
-                if root.value().type == "double":
-                    raise SemanticAnalyzer.DoubleNotAllowed(root.line, root.index)
+                children_results = ()
+
+            kind = node.kind
+            tp = fixed_types.get(kind)
+            if tp is None and kind in typed_by_operands:
+                tp = SemanticAnalyzer._type_of(node)
+            node.type = tp
+
+            # a double constant, atof, scan_double or a double variable brings a double into an expression
+            if kind == NodeKind.CONST_DOUBLE or kind == NodeKind.KW_ATOF or kind == NodeKind.KW_SCAN_DOUBLE or \
+                    kind == NodeKind.IDENTIFIER and (tp[0] if isinstance(tp, list) else tp) == "double":
+                double_source = node
             else:
-                if root.value().type[0] == "double":
-                    raise SemanticAnalyzer.DoubleNotAllowed(root.line, root.index)
+                double_source = None
+                if kind != NodeKind.KW_ATOI:
+                    for child_double_source, _ in children_results:
+                        if child_double_source is not None:
+                            double_source = child_double_source
+                            break
 
-        # if root.table is self._idents_tbl and root.value().type == "double":
-        #     raise SemanticAnalyzer.DoubleNotAllowed(root.line, root.index)
+            error = self._check_node(node, children_results) if kind in checked else None
+            # the operands of % are only checked to be int
+            if error is None and kind != NodeKind.OP_MOD:
+                for _, child_error in children_results:
+                    if child_error is not None:
+                        error = child_error
+                        break
 
-        for child in root.children:
-            self._check_int_expression(child)
+            results.append(no_result if double_source is None and error is None else (double_source, error))
+
+        return results[0][1]
 
     def _check_double_default(self, root: Parser.Node, defaults_found: int):
-        for stmt in root.children:
-            if not self._is_keyword(stmt, "switch"):
-                if self._is_keyword(stmt, "default"):
-                    defaults_found += 1
-                    if defaults_found > 1:
+        # a block counts its defaults starting from the number found in the outer blocks before it
+        stack = [[iter(root.children), defaults_found]]
+
+        while stack:
+            block = stack[-1]
+            stmt = next(block[0], block)
+            if stmt is block:
+                stack.pop()
+                continue
+
+            if stmt is None:
+                # a missing part of a for
+                continue
+            if stmt.kind != NodeKind.KW_SWITCH:
+                if stmt.kind == NodeKind.KW_DEFAULT:
+                    block[1] += 1
+                    if block[1] > 1:
                         raise SemanticAnalyzer.DoubleDefaultInSwitch(stmt.line, stmt.index)
                 else:
-                    self._check_double_default(stmt, defaults_found)
-
-    def _traverse_tree(self, root: Parser.Node):
-        if root is None:
-            return
-
-        if root.table is self._ops_tbl and root.value() == "/":
-            divisor = root.children[1]
-
-            if divisor.table is self._consts_tbl and divisor.value().type in (Constant.DOUBLE, Constant.INT) \
-                and float(divisor.value().value) == 0:
-                raise SemanticAnalyzer.DivisionByZero(divisor.line, divisor.index)
-        elif root.table is self._ops_tbl and root.value() == "%":
-            self._check_int_expression(root.children[0])
-            self._check_int_expression(root.children[1])
-            return
-        elif root.table is self._keywords_tbl and root.value() in ("switch", "case"):
-            self._check_not_double_expression(root.children[0])
-
-            if self._is_keyword(root, "switch"):
-                self._check_double_default(root.children[1], 0)
-        elif self._is_parser_node(root, "indexation"):
-            for child in root.children[1:]:
-                self._check_int_expression(child)
-
-        for child in root.children:
-            self._traverse_tree(child)
+                    stack.append([iter(stmt.children), block[1]])
+
+    def check_statement(self, statement: Parser.Node):
+        """Check one statement of the program and set the types of its nodes. Raises SemanticError."""
+        error = self._analyze(statement)
+        if error is not None:
+            raise error
 
     def check_for_semantic_errors(self):
-        try:
-            self._traverse_tree(self._syntax_tree)
-        except SemanticAnalyzer.SemanticError as err:
-            print(f"SEMANTIC ERROR:\n{err}")
+        error = self._analyze(self._syntax_tree)
+        if error is not None:
+            print(f"SEMANTIC ERROR:\n{error}")
             sys.exit(1)
@@ -0,0 +1,46 @@
+class SymbolTable:
+    """A list of symbols that finds the index of an element with a dict lookup instead of a linear scan.
+
+    Indices are list indices, so they stay valid for the whole compilation. If several equal elements
+    are appended, index() returns the first one, like list.index().
+    """
+
+    def __init__(self, elements=()):
+        self._elements = []
+        self._indices = {}
+
+        for element in elements:
+            self.append(element)
+
+    def __len__(self) -> int:
+        return len(self._elements)
+
+    def __getitem__(self, index: int):
+        return self._elements[index]
+
+    def __iter__(self):
+        return iter(self._elements)
+
+    def __contains__(self, element) -> bool:
+        return element in self._indices
+
+    def append(self, element):
+        self._indices.setdefault(element, len(self._elements))
+        self._elements.append(element)
+
+    def index(self, element) -> int:
+        try:
+            return self._indices[element]
+        except KeyError:
+            raise ValueError(f"{element} is not in the table")
+
+    def add(self, element) -> int:
+        """Append the element if there is no equal one in the table. Return the index of the element."""
+        index = self._indices.get(element)
+
+        if index is None:
+            index = len(self._elements)
+            self._indices[element] = index
+            self._elements.append(element)
+
+        return index
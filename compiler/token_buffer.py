@@ -0,0 +1,56 @@
+from typing import Iterable
+
+
+class TokenBuffer:
+    """Gives indexed access to a stream of tokens, reading them from the stream only when they are needed.
+
+    Only the tokens from the last release() point up to the furthest token looked at are kept,
+    so the parser can go back inside the statement it is parsing but the rest of the program
+    does not have to be in memory.
+    """
+
+    def __init__(self, tokens: Iterable):
+        self._stream = iter(tokens)
+        self._buffer = []
+        self._first_index = 0  # index of _buffer[0] in the whole stream
+        self._end_index = 0  # index of the first token not read from the stream yet
+        self._last_token = None
+        self._exhausted = False
+
+    def _read_until(self, index: int) -> bool:
+        for tok in self._stream:
+            self._buffer.append(tok)
+            self._last_token = tok
+            self._end_index += 1
+
+            if index < self._end_index:
+                return True
+
+        self._exhausted = True
+        return False
+
+    def has(self, index: int) -> bool:
+        if index < self._end_index:
+            return True
+        if self._exhausted:
+            return False
+        return self._read_until(index)
+
+    def __getitem__(self, index: int):
+        if not self.has(index):
+            raise IndexError("token index out of range")
+        if index < self._first_index:
+            raise IndexError("token was already released")
+        return self._buffer[index - self._first_index]
+
+    def last(self):
+        """The last token of the stream (None if the stream is empty). Reads the whole stream."""
+        while self._read_until(self._end_index):
+            pass
+        return self._last_token
+
+    def release(self, index: int):
+        """Forget the tokens before index: the parser will not go back to them."""
+        if index > self._first_index:
+            del self._buffer[:index - self._first_index]
+            self._first_index = index
@@ -0,0 +1,143 @@
+from array import array
+from bisect import bisect_right
+from typing import Iterable, Iterator, Tuple
+
+
+class LineStarts:
+    """Offsets of the first symbols of the lines. Line and column of an offset are found by a binary search."""
+
+    def __init__(self):
+        self._starts = array('i', [0])
+        self._scanned = 0  # number of symbols of the program scanned for new lines
+
+    def add_text(self, text: str):
+        """Register the lines of the next piece of the program."""
+        base = self._scanned
+        starts = self._starts
+
+        pos = text.find('\n')
+        while pos != -1:
+            starts.append(base + pos + 1)
+            pos = text.find('\n', pos + 1)
+
+        self._scanned += len(text)
+
+    def __len__(self) -> int:
+        return len(self._starts)
+
+    def offset(self, line: int, column: int) -> int:
+        return self._starts[line - 1] + column - 1
+
+    def position(self, offset: int) -> Tuple[int, int]:
+        line = bisect_right(self._starts, offset)
+        return line, offset - self._starts[line - 1] + 1
+
+
+class TokenView:
+    """A token as the parser sees it. Line and column are computed on the first request."""
+
+    __slots__ = ("table", "index_in_table", "offset", "_lines", "_line", "_index")
+
+    def __init__(self, table, index_in_table: int, offset: int, lines: LineStarts):
+        self.table = table
+        self.index_in_table = index_in_table
+        self.offset = offset
+        self._lines = lines
+        self._line = 0
+
+    def _find_position(self):
+        self._line, self._index = self._lines.position(self.offset)
+
+    @property
+    def line(self) -> int:
+        if not self._line:
+            self._find_position()
+        return self._line
+
+    @property
+    def index(self) -> int:
+        if not self._line:
+            self._find_position()
+        return self._index
+
+    def value(self):
+        return self.table[self.index_in_table]
+
+
+class TokenStore:
+    """All the tokens of a program kept in parallel arrays: kind (which table), index in the table, offset."""
+
+    OPERATOR = 0
+    KEYWORD = 1
+    IDENTIFIER = 2
+    CONSTANT = 3
+
+    def __init__(self, tables: tuple, lines: LineStarts):
+        # tables in the order of the kinds
+        self._tables = tables
+        self._lines = lines
+
+        self.kinds = array('b')
+        self.table_indices = array('i')
+        self.offsets = array('i')
+
+    def append(self, kind: int, index_in_table: int, offset: int):
+        self.kinds.append(kind)
+        self.table_indices.append(index_in_table)
+        self.offsets.append(offset)
+
+    def extend(self, tokens: Iterable[Tuple[int, int, int]]):
+        kinds_append = self.kinds.append
+        indices_append = self.table_indices.append
+        offsets_append = self.offsets.append
+
+        for kind, index_in_table, offset in tokens:
+            kinds_append(kind)
+            indices_append(index_in_table)
+            offsets_append(offset)
+
+    def get_lines(self) -> LineStarts:
+        return self._lines
+
+    def spliced(self, start: int, end: int, tokens: Iterable[Tuple[int, int, int]], shift: int,
+                lines: LineStarts) -> "TokenStore":
+        """A copy of the store where the tokens [start, end) are replaced and the offsets after them are shifted."""
+        ret = TokenStore(self._tables, lines)
+        ret.kinds = self.kinds[:start]
+        ret.table_indices = self.table_indices[:start]
+        ret.offsets = self.offsets[:start]
+
+        ret.extend(tokens)
+
+        ret.kinds += self.kinds[end:]
+        ret.table_indices += self.table_indices[end:]
+        if shift:
+            ret.offsets.extend(offset + shift for offset in self.offsets[end:])
+        else:
+            ret.offsets += self.offsets[end:]
+
+        return ret
+
+    def __len__(self) -> int:
+        return len(self.kinds)
+
+    # the interface of TokenBuffer, so the parser can read the store directly
+
+    def has(self, i: int) -> bool:
+        return i < len(self.kinds)
+
+    def last(self) -> TokenView:
+        return self[len(self.kinds) - 1]
+
+    def release(self, i: int):
+        pass
+
+    def __getitem__(self, i: int) -> TokenView:
+        return TokenView(self._tables[self.kinds[i]], self.table_indices[i], self.offsets[i], self._lines)
+
+    def __iter__(self) -> Iterator[TokenView]:
+        tables = self._tables
+        lines = self._lines
+
+        for kind, index_in_table, offset in zip(self.kinds, self.table_indices, self.offsets):
+            yield TokenView(tables[kind], index_in_table, offset, lines)
@@ -0,0 +1,680 @@
+import ast
+from typing import Optional
+
+from closure_interpreter import ClosureInterpreter
+from flat_array import FlatArray
+from parser import Parser
+from node_kind import NodeKind
+from program_output import ProgramOutput
+from symbol_table import SymbolTable
+
+
+# the beginning of every generated module: the checks that need a try, and the conversions
+_PRELUDE = '''
+from array import array
+
+from flat_array import FlatArray
+from interpreter import Interpreter
+from program_input import ProgramInput
+from program_output import ProgramOutput
+
+# where the program prints and what it reads, the engine puts its own here before it runs the module
+_output = ProgramOutput()
+_input = ProgramInput(_output)
+_write = _output.write
+_scan = _input.read_line
+_scan_word = _input.read_word
+_read_token = _input.read_token
+
+
+def _index(value, idx, line, index):
+    try:
+        return value[idx]
+    except IndexError:
+        raise Interpreter.RuntimeError("array index out of range", line, index)
+
+
+def _in_range(idx, size, message, line, index):
+    if idx < 0:
+        idx += size
+    if 0 <= idx < size:
+        return idx
+    raise Interpreter.RuntimeError(message, line, index)
+
+
+def _atoi(value, line, index):
+    try:
+        return int(value)
+    except ValueError:
+        raise Interpreter.RuntimeError("input is not convertible to int", line, index)
+
+
+def _atof(value, line, index):
+    try:
+        return float(value)
+    except ValueError:
+        raise Interpreter.RuntimeError("input is not convertible to double", line, index)
+
+
+def _atob(value, line, index):
+    try:
+        return bool(value)
+    except ValueError:
+        raise Interpreter.RuntimeError("input is not convertible to bool", line, index)
+
+
+def _unknown_node(line, index):
+    raise Interpreter.RuntimeError("unknown node", line, index)
+
+
+def _string_element(array, idx, line, index):
+    try:
+        value = array[idx]
+    except IndexError:
+        raise Interpreter.RuntimeError("array index out of range", line, index)
+    if value.__class__ is list:
+        # written by characters
+        value = array[idx] = "".join(value)
+    return value
+
+
+_to_string = Interpreter._to_string
+_store_element = FlatArray.store
+_set_char = Interpreter._set_char
+'''
+
+# the end of every generated module, so the written file runs like the program
+_MAIN = '''
+if __name__ == "__main__":
+    _output.write("\\n\\n\\n\\n\\n\\n")
+
+    try:
+        run()
+    except Interpreter.RuntimeError as err:
+        _output.write(f"\\n\\n\\nRUNTIME ERROR:\\n{err}\\n")
+        exit(1)
+    finally:
+        _output.flush()
+'''
+
+
+class Transpiler(ClosureInterpreter):
+    """Translates the tree into a Python module with the ast module, compiles it with compile() and runs it.
+
+    The program is the function run() of the module, its variables are the local variables of run(). The loops
+    and the breaks are Python loops and breaks, a switch is a chain of ifs on the number of the label it
+    jumps to. The nodes of the module have the lines and the columns of the nodes of the program, and the module
+    is compiled with the name of the program, so a traceback points into the program. The runtime errors have
+    the positions in the program built in.
+
+    Python limits the nesting of the loops and of the expressions, so a program that is too deep for it is run
+    by the closures of ClosureInterpreter.
+    """
+
+    class _TooDeep(Exception):
+        pass
+
+    _COMPARISONS = {
+        NodeKind.OP_GT: ast.Gt,
+        NodeKind.OP_LT: ast.Lt,
+        NodeKind.OP_GE: ast.GtE,
+        NodeKind.OP_LE: ast.LtE,
+        NodeKind.OP_EQ: ast.Eq,
+        NodeKind.OP_NE: ast.NotEq,
+    }
+
+    _CHAINS = {
+        NodeKind.OP_ADD: ast.Add,
+        NodeKind.OP_SUB: ast.Sub,
+        NodeKind.OP_MUL: ast.Mult,
+        NodeKind.OP_DIV: ast.Div,
+        NodeKind.OP_MOD: ast.Mod,
+    }
+
+    _CONVERSIONS = {
+        NodeKind.KW_ATOI: "_atoi",
+        NodeKind.KW_ATOF: "_atof",
+        NodeKind.KW_ATOB: "_atob",
+    }
+
+    def __init__(self, parser_nodes: SymbolTable, operators: SymbolTable, identifiers: SymbolTable,
+                 keywords: SymbolTable, consts: SymbolTable, syntax_tree, flat_arrays: bool = False,
+                 output: Optional[ProgramOutput] = None, program_name: str = "<program>",
+                 output_path: Optional[str] = None):
+        super().__init__(parser_nodes, operators, identifiers, keywords, consts, syntax_tree, flat_arrays, output)
+
+        self._program_name = program_name
+        # if not None, the generated module is written there before it runs
+        self._output_path = output_path
+
+        # the names of the variables used, by the index in the idents table
+        self._names = {}
+        # the module level assignments of the jump tables of the switches
+        self._switch_tables = []
+
+        # the method that translates a statement into a list of Python statements, by the kind of the node
+        self._statement_translators = [self._translate_unknown_statement] * NodeKind.COUNT
+        for kind, translator in (
+            (NodeKind.PROGRAM, self._translate_compound_statement),
+            (NodeKind.COMPOUND_STATEMENT, self._translate_compound_statement),
+            (NodeKind.KW_PRINT, self._translate_print),
+            (NodeKind.DECLARE, self._translate_declare),
+            (NodeKind.OP_ASSIGN, self._translate_assignment),
+            (NodeKind.KW_IF, self._translate_if),
+            (NodeKind.KW_WHILE, self._translate_while),
+            (NodeKind.KW_FOR, self._translate_for),
+            (NodeKind.KW_SWITCH, self._translate_switch),
+            (NodeKind.KW_CASE, self._translate_case_or_default),
+            (NodeKind.KW_DEFAULT, self._translate_case_or_default),
+            (NodeKind.KW_BREAK, self._translate_break),
+        ):
+            self._statement_translators[kind] = translator
+
+        # the method that translates an expression into a Python expression, by the kind of the node
+        self._expression_translators = [self._translate_unknown_expression] * NodeKind.COUNT
+        for kind, translator in (
+            (NodeKind.INDEXATION, self._translate_indexation),
+            (NodeKind.INDEXATION_IN_BOUNDS, self._translate_indexation_in_bounds),
+            (NodeKind.CONST_STRING, self._translate_constant),
+            (NodeKind.CONST_INT, self._translate_constant),
+            (NodeKind.CONST_DOUBLE, self._translate_constant),
+            (NodeKind.KW_TRUE, self._translate_constant),
+            (NodeKind.KW_FALSE, self._translate_constant),
+            (NodeKind.IDENTIFIER, self._translate_identifier),
+            (NodeKind.KW_TO_STRING, self._translate_to_string),
+            (NodeKind.KW_ATOI, self._translate_conversion),
+            (NodeKind.KW_ATOF, self._translate_conversion),
+            (NodeKind.KW_ATOB, self._translate_conversion),
+            (NodeKind.KW_SCAN, self._translate_scan),
+            (NodeKind.KW_SCAN_INT, self._translate_scan),
+            (NodeKind.KW_SCAN_DOUBLE, self._translate_scan),
+            (NodeKind.KW_SCAN_WORD, self._translate_scan),
+            (NodeKind.OP_ADD, self._translate_add),
+            (NodeKind.OP_SUB, self._translate_sub),
+            (NodeKind.OP_MUL, self._translate_chain),
+            (NodeKind.OP_DIV, self._translate_chain),
+            (NodeKind.OP_MOD, self._translate_chain),
+            (NodeKind.OP_AND, self._translate_bool_operation),
+            (NodeKind.OP_OR, self._translate_bool_operation),
+            (NodeKind.OP_NOT, self._translate_not),
+            (NodeKind.OP_GT, self._translate_comparison),
+            (NodeKind.OP_LT, self._translate_comparison),
+            (NodeKind.OP_GE, self._translate_comparison),
+            (NodeKind.OP_LE, self._translate_comparison),
+            (NodeKind.OP_EQ, self._translate_comparison),
+            (NodeKind.OP_NE, self._translate_comparison),
+        ):
+            self._expression_translators[kind] = translator
+
+    @staticmethod
+    def _at(py_node, node: Parser.Node):
+        """Gives the Python node the position of the node of the program."""
+        py_node.lineno = py_node.end_lineno = node.line or 1
+        py_node.col_offset = py_node.end_col_offset = max((node.index or 1) - 1, 0)
+        return py_node
+
+    @staticmethod
+    def _load(name: str) -> ast.Name:
+        return ast.Name(name, ast.Load())
+
+    @staticmethod
+    def _store(name: str) -> ast.Name:
+        return ast.Name(name, ast.Store())
+
+    @staticmethod
+    def _call(function: str, *args) -> ast.Call:
+        return ast.Call(Transpiler._load(function), list(args), [])
+
+    @staticmethod
+    def _position(node: Parser.Node) -> tuple:
+        return ast.Constant(node.line), ast.Constant(node.index)
+
+    @staticmethod
+    def _raise(message: str, node: Parser.Node) -> ast.Raise:
+        error = ast.Attribute(Transpiler._load("Interpreter"), "RuntimeError", ast.Load())
+        return ast.Raise(ast.Call(error, [ast.Constant(message), *Transpiler._position(node)], []))
+
+    def _name(self, index_in_table: int) -> str:
+        name = self._names.get(index_in_table)
+        if name is None:
+            # the variables of different blocks can have the same name, the index tells them apart. The variables
+            # made by the optimizer have names that are not Python identifiers
+            var_name = self._idents_tbl[index_in_table].name
+            name = f"{var_name if var_name.isidentifier() else 't'}_{index_in_table}"
+            self._names[index_in_table] = name
+        return name
+
+    def _translate_statement(self, node: Parser.Node, depth: int) -> list:
+        if depth > ClosureInterpreter._MAX_DEPTH:
+            raise Transpiler._TooDeep()
+        return self._statement_translators[node.kind](node, depth + 1)
+
+    def _translate_expression(self, node: Parser.Node, depth: int) -> ast.expr:
+        if depth > ClosureInterpreter._MAX_DEPTH:
+            raise Transpiler._TooDeep()
+        return Transpiler._at(self._expression_translators[node.kind](node, depth + 1), node)
+
+    def _translate_operands(self, node: Parser.Node, depth: int) -> list:
+        return [self._translate_expression(child, depth) for child in node.children]
+
+    def _translate_block(self, node: Parser.Node, depth: int) -> list:
+        """The statements of a body, which Python does not allow to be empty."""
+        return self._translate_statement(node, depth) or [Transpiler._at(ast.Pass(), node)]
+
+    def _translate_unknown_statement(self, node: Parser.Node, depth: int) -> list:
+        # the tree-walker fails when it gets to the node, not before the program runs
+        return [Transpiler._at(Transpiler._raise("unknown node", node), node)]
+
+    def _translate_unknown_expression(self, node: Parser.Node, depth: int) -> ast.expr:
+        return Transpiler._call("_unknown_node", *Transpiler._position(node))
+
+    # statements
+
+    def _translate_compound_statement(self, node: Parser.Node, depth: int) -> list:
+        statements = []
+        for child in node.children:
+            statements.extend(self._translate_statement(child, depth))
+        return statements
+
+    def _translate_print(self, node: Parser.Node, depth: int) -> list:
+        value = self._translate_expression(node.children[0], depth)
+        return [Transpiler._at(ast.Expr(Transpiler._call("_write", value)), node)]
+
+    def _new_array(self, sizes: list, default_value) -> ast.expr:
+        # the innermost lists hold immutable values, so they are repeated. The outer ones are built by
+        # comprehensions, every element is a new list
+        ret = ast.BinOp(ast.List([ast.Constant(default_value)], ast.Load()), ast.Mult(), ast.Constant(sizes[-1]))
+        for size in reversed(sizes[:-1]):
+            loop = ast.comprehension(Transpiler._store("_"), Transpiler._call("range", ast.Constant(size)), [], 0)
+            ret = ast.ListComp(ret, [loop])
+        return ret
+
+    def _new_flat_array(self, elem_type: str, sizes: list) -> ast.expr:
+        count = 1
+        for size in sizes:
+            count *= size
+
+        default_value = ast.List([ast.Constant(self._get_default_value(elem_type))], ast.Load())
+        buffer = Transpiler._call("array", ast.Constant(FlatArray.TYPECODES[elem_type]), default_value)
+        return ast.BinOp(buffer, ast.Mult(), ast.Constant(count))
+
+    def _translate_declaration(self, var_node: Parser.Node) -> ast.stmt:
+        var_type = self._idents_tbl[var_node.index_in_table].type
+        if not isinstance(var_type, list):
+            value = ast.Constant(self._get_default_value(var_type))
+        elif var_node.index_in_table in self._layouts:
+            value = self._new_flat_array(var_type[0], var_type[1:])
+        else:
+            value = self._new_array(var_type[1:], self._get_default_value(var_type[0]))
+
+        target = Transpiler._store(self._name(var_node.index_in_table))
+        return Transpiler._at(ast.Assign([target], value), var_node)
+
+    def _translate_declare(self, node: Parser.Node, depth: int) -> list:
+        statements = []
+        for child in node.children:
+            if child.kind == NodeKind.OP_ASSIGN:
+                statements.extend(self._translate_assignment(child, depth))
+            else:
+                statements.append(self._translate_declaration(child))
+        return statements
+
+    def _catch_index_error(self, body: list, node: Parser.Node) -> ast.Try:
+        handler = ast.ExceptHandler(Transpiler._load("IndexError"), None, [Transpiler._raise("index out of range", node)])
+        return ast.Try(body, [handler], [], [])
+
+    def _offset(self, node: Parser.Node, indexes: list, positions: list, message: str) -> ast.expr:
+        """The offset of the element in the flat buffer. Unless the indexation is in the bounds, every index is
+        checked after it is computed, like the index of a list, and the error is reported at its position."""
+        sizes, strides = self._layouts[node.children[0].index_in_table][1:]
+
+        ret = None
+        for index, size, stride, position in zip(indexes, sizes, strides, positions):
+            if node.kind == NodeKind.INDEXATION:
+                index = Transpiler._call("_in_range", index, ast.Constant(size), ast.Constant(message),
+                                         *Transpiler._position(position))
+            if stride != 1:
+                index = ast.BinOp(index, ast.Mult(), ast.Constant(stride))
+            ret = index if ret is None else ast.BinOp(ret, ast.Add(), index)
+        return ret
+
+    def _translate_flat_store(self, node: Parser.Node, value: ast.expr, indexes: list) -> list:
+        left_node = node.children[0]
+        slot = left_node.children[0].index_in_table
+        name = self._name(slot)
+        elem_type = self._layouts[slot][0]
+        offset = self._offset(left_node, indexes, [left_node] * len(indexes), "index out of range")
+
+        if elem_type == "bool":
+            target = ast.Subscript(Transpiler._load(name), offset, ast.Store())
+            return [Transpiler._at(ast.Assign([target], value), node)]
+
+        # the value is computed before the indexes
+        statements = [
+            ast.Assign([Transpiler._store("_value")], value),
+            ast.Assign([Transpiler._store("_offset")], offset),
+        ]
+        target = ast.Subscript(Transpiler._load(name), Transpiler._load("_offset"), ast.Store())
+        stored = ast.Assign([target], Transpiler._load("_value"))
+        # the buffer is replaced by a list when it cannot keep the value
+        replaced = ast.Assign([Transpiler._store(name)], Transpiler._call(
+            "_store_element", Transpiler._load(name), Transpiler._load("_offset"), Transpiler._load("_value")))
+
+        if elem_type == "int":
+            # a double, or an int of more than 64 bits, does not go into the buffer
+            errors = ast.Tuple([Transpiler._load("TypeError"), Transpiler._load("OverflowError")], ast.Load())
+            statements.append(ast.Try([stored], [ast.ExceptHandler(errors, None, [replaced])], [], []))
+        else:
+            # the buffer would make an int a float
+            value_class = ast.Attribute(Transpiler._load("_value"), "__class__", ast.Load())
+            is_float = ast.Compare(value_class, [ast.Is()], [Transpiler._load("float")])
+            statements.append(ast.If(is_float, [stored], [replaced]))
+        return [Transpiler._at(statement, node) for statement in statements]
+
+    def _translate_assignment(self, node: Parser.Node, depth: int) -> list:
+        left_node, value_node = node.children
+        value = self._translate_expression(value_node, depth)
+
+        if left_node.kind == NodeKind.IDENTIFIER:
+            target = Transpiler._store(self._name(left_node.index_in_table))
+            return [Transpiler._at(ast.Assign([target], value), node)]
+
+        var = self._idents_tbl[left_node.children[0].index_in_table]
+        array = Transpiler._load(self._name(left_node.children[0].index_in_table))
+        indexes = self._translate_operands(left_node, depth)[1:]
+
+        if left_node.children[0].index_in_table in self._layouts:
+            return self._translate_flat_store(node, value, indexes)
+
+        # Python evaluates the value before the target and the indexes from left to right, as the tree-walker does
+        def element(container: ast.expr, last: int) -> ast.expr:
+            for index in indexes[:last]:
+                container = ast.Subscript(container, index, ast.Load())
+            return container
+
+        if left_node.kind == NodeKind.INDEXATION_IN_BOUNDS:
+            # the element exists, so it is set without the checks
+            target = ast.Subscript(element(array, -1), indexes[-1], ast.Store())
+            return [Transpiler._at(ast.Assign([target], value), node)]
+
+        elem_type = var.type[0] if isinstance(var.type, list) else var.type
+        if elem_type != "string" or len(indexes) == len(var.type) - 1:
+            # an element of an array
+            target = ast.Subscript(element(array, -1), indexes[-1], ast.Store())
+            assign = Transpiler._at(ast.Assign([target], value), node)
+            return [Transpiler._at(self._catch_index_error([assign], left_node), node)]
+
+        # a character of a string, which is made a list of its characters and changed in place. The value is
+        # computed before the indexes
+        statements = [ast.Assign([Transpiler._store("_value")], value)]
+
+        def set_char(string: ast.expr, idx: str) -> ast.expr:
+            return Transpiler._call("_set_char", string, Transpiler._load(idx), Transpiler._load("_value"))
+
+        if len(indexes) == 1:
+            statements.append(ast.Assign([Transpiler._store("_index0")], indexes[0]))
+            target = Transpiler._store(self._name(left_node.children[0].index_in_table))
+            statements.append(ast.Assign([target], set_char(array, "_index0")))
+            return [Transpiler._at(statement, node) for statement in statements]
+
+        # the strings are in an array, the one with the character is replaced
+        body = [
+            ast.Assign([Transpiler._store("_array")], element(array, -2)),
+            ast.Assign([Transpiler._store("_index0")], indexes[-2]),
+            ast.Assign([Transpiler._store("_index1")], indexes[-1]),
+        ]
+        string = ast.Subscript(Transpiler._load("_array"), Transpiler._load("_index0"), ast.Load())
+        target = ast.Subscript(Transpiler._load("_array"), Transpiler._load("_index0"), ast.Store())
+        body.append(ast.Assign([target], set_char(string, "_index1")))
+        statements.append(self._catch_index_error(body, left_node))
+        return [Transpiler._at(statement, node) for statement in statements]
+
+    def _translate_if(self, node: Parser.Node, depth: int) -> list:
+        cond = self._translate_expression(node.children[0], depth)
+        body = self._translate_block(node.children[1], depth)
+
+        orelse = []
+        if len(node.children) >= 3 and node.children[2] is not None:
+            orelse = self._translate_statement(node.children[2], depth)
+
+        return [Transpiler._at(ast.If(cond, body, orelse), node)]
+
+    def _translate_while(self, node: Parser.Node, depth: int) -> list:
+        cond = self._translate_expression(node.children[0], depth)
+        body = self._translate_block(node.children[1], depth)
+        return [Transpiler._at(ast.While(cond, body, []), node)]
+
+    def _translate_for(self, node: Parser.Node, depth: int) -> list:
+        init_node, cond_node, incr_node, body_node = node.children
+
+        statements = [] if init_node is None else self._translate_assignment(init_node, depth)
+        cond = ast.Constant(True) if cond_node is None else self._translate_expression(cond_node, depth)
+        body = self._translate_statement(body_node, depth)
+        if incr_node is not None:
+            body.extend(self._translate_assignment(incr_node, depth))
+
+        statements.append(Transpiler._at(ast.While(cond, body or [ast.Pass()], []), node))
+        return statements
+
+    def _translate_switch(self, node: Parser.Node, depth: int) -> list:
+        # A case jumps into the statements of its parent and runs them from the case to the end of the parent.
+        # The labels are numbered, the labels of a parent get consecutive numbers. The switch finds the number
+        # of the label in its jump table, and the statements of the parent that follow a label are run if the
+        # number is in the numbers of the parent up to the label
+        cases, default = self._jump_table(node)
+        entries = list(cases.values()) if default is None else [*cases.values(), default]
+
+        parents = {}
+        for parent, idx in entries:
+            parents.setdefault(id(parent), (parent, set()))[1].add(idx)
+
+        numbers = {}
+        for parent, indexes in parents.values():
+            for idx in sorted(indexes):
+                numbers[(id(parent), idx)] = len(numbers)
+        missing = len(numbers)
+
+        table_name = f"_SWITCH{len(self._switch_tables)}"
+        entry_name = f"_entry{len(self._switch_tables)}"
+        table = ast.Dict([ast.Constant(case) for case in cases],
+                         [ast.Constant(numbers[(id(parent), idx)]) for parent, idx in cases.values()])
+        self._switch_tables.append(ast.Assign([Transpiler._store(table_name)], table))
+
+        value = self._translate_expression(node.children[0], depth)
+        no_case = missing if default is None else numbers[(id(default[0]), default[1])]
+        lookup = ast.Call(ast.Attribute(Transpiler._load(table_name), "get", ast.Load()),
+                          [value, ast.Constant(no_case)], [])
+        statements = [Transpiler._at(ast.Assign([Transpiler._store(entry_name)], lookup), node)]
+
+        body = []
+        for parent, indexes in parents.values():
+            labels = sorted(indexes)
+            first = numbers[(id(parent), labels[0])]
+
+            for i, idx in enumerate(labels):
+                end = labels[i + 1] if i + 1 < len(labels) else len(parent.children)
+                segment = []
+                for child in parent.children[idx:end]:
+                    segment.extend(self._translate_statement(child, depth))
+                if not segment:
+                    continue
+
+                number = ast.Constant(numbers[(id(parent), idx)])
+                if len(parents) == 1:
+                    cond = ast.Compare(Transpiler._load(entry_name), [ast.LtE()], [number])
+                else:
+                    cond = ast.Compare(ast.Constant(first), [ast.LtE(), ast.LtE()],
+                                       [Transpiler._load(entry_name), number])
+                body.append(Transpiler._at(ast.If(cond, segment, []), parent.children[idx]))
+
+        if ClosureInterpreter._breaks_out(node.children[1]):
+            # a loop that runs once, for the breaks to leave it
+            body.append(ast.Break())
+            body = [Transpiler._at(ast.While(ast.Constant(True), body, []), node)]
+
+        statements.extend(body)
+        return statements
+
+    def _translate_case_or_default(self, node: Parser.Node, depth: int) -> list:
+        return []
+
+    def _translate_break(self, node: Parser.Node, depth: int) -> list:
+        return [Transpiler._at(ast.Break(), node)]
+
+    # expressions
+
+    def _translate_constant(self, node: Parser.Node, depth: int) -> ast.expr:
+        return ast.Constant(self._interpret_node(node))
+
+    def _translate_identifier(self, node: Parser.Node, depth: int) -> ast.expr:
+        name = self._name(node.index_in_table)
+        if node.index_in_table not in self._char_strings:
+            return Transpiler._load(name)
+
+        # a string written by characters is a list, which is made a string again when it is read whole
+        is_list = ast.Compare(ast.Attribute(Transpiler._load(name), "__class__", ast.Load()), [ast.Is()],
+                              [Transpiler._load("list")])
+        joined = ast.Call(ast.Attribute(ast.Constant(""), "join", ast.Load()), [Transpiler._load(name)], [])
+        return ast.IfExp(is_list, ast.NamedExpr(Transpiler._store(name), joined), Transpiler._load(name))
+
+    def _translate_flat_element(self, node: Parser.Node, depth: int) -> ast.expr:
+        slot = node.children[0].index_in_table
+        indexes = self._translate_operands(node, depth)[1:]
+        offset = self._offset(node, indexes, node.children[1:], "array index out of range")
+
+        ret = ast.Subscript(Transpiler._load(self._name(slot)), offset, ast.Load())
+        if self._layouts[slot][0] == "bool":
+            # the buffer has the bools as numbers
+            ret = ast.Compare(ret, [ast.NotEq()], [ast.Constant(0)])
+        return ret
+
+    def _translate_indexation(self, node: Parser.Node, depth: int) -> ast.expr:
+        if node.children[0].index_in_table in self._layouts:
+            return self._translate_flat_element(node, depth)
+
+        # a string written by characters is a list, which is made a string again when it is read whole
+        is_string_element = node.children[0].index_in_table in self._char_strings and self._is_string_element(node)
+
+        ret = Transpiler._load(self._name(node.children[0].index_in_table))
+        for index_node, index in zip(node.children[1:], self._translate_operands(node, depth)[1:]):
+            function = "_string_element" if is_string_element and index_node is node.children[-1] else "_index"
+            ret = Transpiler._call(function, ret, index, *Transpiler._position(index_node))
+            ret = Transpiler._at(ret, index_node)
+        return ret
+
+    def _translate_indexation_in_bounds(self, node: Parser.Node, depth: int) -> ast.expr:
+        if node.children[0].index_in_table in self._layouts:
+            return self._translate_flat_element(node, depth)
+
+        if node.children[0].index_in_table in self._char_strings and self._is_string_element(node):
+            return self._translate_indexation(node, depth)
+
+        ret = Transpiler._load(self._name(node.children[0].index_in_table))
+        for index in self._translate_operands(node, depth)[1:]:
+            ret = ast.Subscript(ret, index, ast.Load())
+        return ret
+
+    def _translate_to_string(self, node: Parser.Node, depth: int) -> ast.expr:
+        operand_node = node.children[0]
+        operand = self._translate_expression(operand_node, depth)
+
+        if operand_node.type in ("int", "double"):
+            return Transpiler._call("str", operand)
+        if operand_node.type == "bool":
+            return ast.IfExp(operand, ast.Constant("true"), ast.Constant("false"))
+        return Transpiler._call("_to_string", operand)
+
+    def _translate_conversion(self, node: Parser.Node, depth: int) -> ast.expr:
+        operand = self._translate_expression(node.children[0], depth)
+        return Transpiler._call(Transpiler._CONVERSIONS[node.kind], operand, *Transpiler._position(node))
+
+    def _translate_scan(self, node: Parser.Node, depth: int) -> ast.expr:
+        if node.kind == NodeKind.KW_SCAN:
+            return Transpiler._call("_scan")
+        if node.kind == NodeKind.KW_SCAN_WORD:
+            return Transpiler._call("_scan_word")
+
+        # the word is converted from its bytes, without a string made of it
+        conversion = "_atoi" if node.kind == NodeKind.KW_SCAN_INT else "_atof"
+        return Transpiler._call(conversion, Transpiler._call("_read_token"), *Transpiler._position(node))
+
+    def _translate_add(self, node: Parser.Node, depth: int) -> ast.expr:
+        if len(node.children) == 1:
+            # a sign
+            return self._translate_expression(node.children[0], depth)
+        return self._translate_chain(node, depth)
+
+    def _translate_sub(self, node: Parser.Node, depth: int) -> ast.expr:
+        if len(node.children) == 1:
+            return ast.UnaryOp(ast.USub(), self._translate_expression(node.children[0], depth))
+        return self._translate_chain(node, depth)
+
+    def _translate_chain(self, node: Parser.Node, depth: int) -> ast.expr:
+        operation = Transpiler._CHAINS[node.kind]
+        operands = self._translate_operands(node, depth)
+        ret = operands[0]
+        for operand in operands[1:]:
+            ret = Transpiler._at(ast.BinOp(ret, operation(), operand), node)
+        return ret
+
+    def _translate_bool_operation(self, node: Parser.Node, depth: int) -> ast.expr:
+        operation = ast.And() if node.kind == NodeKind.OP_AND else ast.Or()
+        operands = self._translate_operands(node, depth)
+        return operands[0] if len(operands) == 1 else ast.BoolOp(operation, operands)
+
+    def _translate_not(self, node: Parser.Node, depth: int) -> ast.expr:
+        return ast.UnaryOp(ast.Not(), self._translate_expression(node.children[0], depth))
+
+    def _translate_comparison(self, node: Parser.Node, depth: int) -> ast.expr:
+        left, right = self._translate_operands(node, depth)
+        return ast.Compare(left, [Transpiler._COMPARISONS[node.kind]()], [right])
+
+    def translate(self) -> ast.Module:
+        """The module of the program. Running it as the main module runs the program, run() runs it
+        without the framing of run_program."""
+        self._names = {}
+        self._switch_tables = []
+        self._char_strings = self._written_by_characters()
+        body = self._translate_statement(self._syntax_tree, 0)
+
+        # a switch can jump over a declaration, so every variable exists from the start, as in the tree-walker
+        if self._names:
+            targets = [Transpiler._store(name) for name in self._names.values()]
+            body.insert(0, ast.Assign(targets, ast.Constant(None)))
+
+        run = ast.FunctionDef("run", ast.arguments([], [], None, [], [], None, []), body or [ast.Pass()], [], None)
+        module = ast.Module([*ast.parse(_PRELUDE).body, *self._switch_tables, run, *ast.parse(_MAIN).body], [])
+        return ast.fix_missing_locations(module)
+
+    def source(self) -> str:
+        """The Python source of the program."""
+        return ast.unparse(self.translate())
+
+    @staticmethod
+    def _write(module: ast.Module, path: str):
+        with open(path, "w") as f:
+            f.write(ast.unparse(module))
+            f.write("\n")
+
+    def write(self, path: str):
+        """Writes the module of the program to path. It runs from the directory of the compiler."""
+        Transpiler._write(self.translate(), path)
+
+    def _run(self):
+        try:
+            module = self.translate()
+            code = compile(module, self._program_name, "exec")
+        except (Transpiler._TooDeep, SyntaxError, RecursionError, MemoryError):
+            # the program is too deep for Python
+            super()._run()
+            return
+
+        if self._output_path is not None:
+            Transpiler._write(module, self._output_path)
+
+        namespace = {"__name__": "__cpm__"}
+        exec(code, namespace)
+        namespace.update(_output=self._output, _input=self._input, _write=self._output.write,
+                         _scan=self._input.read_line, _scan_word=self._input.read_word,
+                         _read_token=self._input.read_token)
+        namespace["run"]()
@@ -4,7 +4,6 @@ class Variable:
         self.type = tp
         self.nest_level = nest_level
         self.block_on_level = block_on_level
-        self.value = None
 
     def __str__(self):
         return f"{self.name} ({self.type} in [{self.nest_level}, {self.block_on_level}] block)"
@@ -13,3 +12,8 @@ class Variable:
         return self.name == other.name and \
             (self.nest_level == other.nest_level and self.block_on_level == other.block_on_level)
         # return self.value == other.value and self.type == other.type
+
+    def __hash__(self):
+        # the parser changes nest_level and block_on_level of variables that are already in a table,
+        # so only the name can be hashed
+        return hash(self.name)
@@ -1,10 +1,11 @@
 from lexer import Lexer
 from constant import Constant
+from symbol_table import SymbolTable
 
 
 class WorkingWithSyntaxTree:
-    def __init__(self, parser_nodes: list, operators: list, identifiers: list, keywords: list,
-                 consts: list, syntax_tree):
+    def __init__(self, parser_nodes: SymbolTable, operators: SymbolTable, identifiers: SymbolTable,
+                 keywords: SymbolTable, consts: SymbolTable, syntax_tree):
         self._parser_nodes_tbl = parser_nodes
         self._ops_tbl = operators
         self._idents_tbl = identifiers
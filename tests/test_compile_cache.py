@@ -0,0 +1,152 @@
+import contextlib
+import io
+import os
+import struct
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "compiler"))
+
+from compile_cache import CompileCache
+from compiler import Compiler
+from program_output import ProgramOutput
+
+
+class CompileCacheTest(unittest.TestCase):
+    PROGRAM = """int n = 4;
+double d = 1.5;
+string s = "a\\tb";
+int a[2][3];
+int i;
+for (i = 0; i < n; i = i + 1) {
+    a[i % 2][i % 3] = i * n;
+}
+switch (n) {
+    case 4:
+        print(s + " " + to_string(d * a[1][0]) + "\\n");
+        break;
+    default:
+        print("no\\n");
+}
+"""
+
+    def setUp(self):
+        self._dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self._dir.cleanup)
+        self._cache_dir = os.path.join(self._dir.name, "cache")
+
+    def _write(self, source: str, name: str = "program.cpm") -> str:
+        path = os.path.join(self._dir.name, name)
+        with open(path, "w") as f:
+            f.write(source)
+        return path
+
+    def _compile(self, path: str, cache_size: int = CompileCache.DEFAULT_MAX_SIZE) -> Compiler:
+        compiler = Compiler(path, cache_dir=self._cache_dir, cache_size=cache_size,
+                            output=ProgramOutput.in_memory())
+        with contextlib.redirect_stdout(io.StringIO()):
+            compiler.do_lexical_analysis()
+            compiler.do_syntax_analysis()
+            compiler.do_semantic_analysis()
+        return compiler
+
+    @staticmethod
+    def _nodes(compiler: Compiler) -> list:
+        """The nodes of the tree in preorder, with their tables compared by content."""
+        ret = []
+        stack = [compiler._syntax_tree]
+        while stack:
+            node = stack.pop()
+            if node is None:
+                ret.append(None)
+                continue
+            ret.append((node.kind, str(node.value()), node.type, node.line, node.index, len(node.children)))
+            stack.extend(reversed(node.children))
+        return ret
+
+    @staticmethod
+    def _run(compiler: Compiler) -> str:
+        compiler.run_program()
+        return compiler._output.getvalue()
+
+    def _cache_path(self, path: str) -> str:
+        with open(path, "rb") as f:
+            key = CompileCache.key(f.read())
+        return os.path.join(self._cache_dir, key + CompileCache.SUFFIX)
+
+    def _load(self, path: str):
+        with open(path, "rb") as f:
+            key = CompileCache.key(f.read())
+        return CompileCache(self._cache_dir).load(key)
+
+    def test_round_trip(self):
+        path = self._write(CompileCacheTest.PROGRAM)
+        compiled = self._compile(path)
+        self.assertFalse(compiled._from_cache)
+        self.assertTrue(os.path.exists(self._cache_path(path)))
+
+        loaded = self._compile(path)
+        self.assertTrue(loaded._from_cache)
+        self.assertEqual(CompileCacheTest._nodes(loaded), CompileCacheTest._nodes(compiled))
+        self.assertEqual(CompileCacheTest._run(loaded), CompileCacheTest._run(compiled))
+
+    @staticmethod
+    def _truncate(data: bytes) -> bytes:
+        return data[:len(data) // 2]
+
+    @staticmethod
+    def _flip_byte(data: bytes) -> bytes:
+        # a byte of the tables, after the header and the checksum
+        i = len(data) - 20
+        return data[:i] + bytes((data[i] ^ 0xff,)) + data[i + 1:]
+
+    @staticmethod
+    def _other_version(data: bytes) -> bytes:
+        start = len(CompileCache.MAGIC)
+        return data[:start] + struct.pack("<H", CompileCache.FORMAT_VERSION + 1) + data[start + 2:]
+
+    def test_damaged_file_is_compiled_again(self):
+        path = self._write(CompileCacheTest.PROGRAM)
+        expected = CompileCacheTest._run(self._compile(path))
+        cache_path = self._cache_path(path)
+        with open(cache_path, "rb") as f:
+            data = f.read()
+
+        for damage in (CompileCacheTest._truncate, CompileCacheTest._flip_byte, CompileCacheTest._other_version):
+            with self.subTest(damage=damage.__name__):
+                with open(cache_path, "wb") as f:
+                    f.write(damage(data))
+                self.assertIsNone(self._load(path))
+
+                compiler = self._compile(path)
+                self.assertFalse(compiler._from_cache)
+                self.assertEqual(CompileCacheTest._run(compiler), expected)
+
+                # the file is written again
+                self.assertIsNotNone(self._load(path))
+
+    def test_least_recently_used_is_removed(self):
+        # the programs differ only in a digit, so their files have the same size
+        paths = [self._write(f"int x = {k};\nprint(to_string(x));\n", f"program{k}.cpm") for k in range(4)]
+        self._compile(paths[0])
+        size = os.path.getsize(self._cache_path(paths[0]))
+        os.remove(self._cache_path(paths[0]))
+
+        # room for three files
+        cache_size = 3 * size
+        for k, path in enumerate(paths[:3]):
+            self._compile(path, cache_size)
+            # older files first, whatever the resolution of the clock
+            os.utime(self._cache_path(path), ns=(10 ** 18 + k, 10 ** 18 + k))
+
+        # the first file is used, so the second one is the least recently used
+        self.assertTrue(self._compile(paths[0], cache_size)._from_cache)
+        self._compile(paths[3], cache_size)
+
+        present = [os.path.exists(self._cache_path(path)) for path in paths]
+        self.assertEqual(present, [True, False, True, True])
+
+
+if __name__ == "__main__":
+    unittest.main()
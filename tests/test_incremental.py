@@ -0,0 +1,156 @@
+import contextlib
+import io
+import os
+import random
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "compiler"))
+
+from compiler import Compiler
+from incremental import IncrementalCompiler
+from parser import print_tree
+
+
+class IncrementalCompilerTest(unittest.TestCase):
+    """After every edit, the incremental compiler has the tree and the errors of a compilation from scratch."""
+
+    PROGRAM = """int n = 3;
+int i;
+int sum = 0;
+for (i = 0; i < n; i = i + 1) {
+    sum = sum + i;
+}
+if (sum > 2) {
+    print(to_string(sum) + "\\n");
+}
+string s = "a";
+print(s + "\\n");
+"""
+
+    # (the text replaced, the new text), each applied to the program edited before
+    EDITS = (
+        # a declaration inserted and used
+        ("int i;\n", "int i;\nint k = 4;\n"),
+        ("sum = sum + i;", "sum = sum + i * k;"),
+        # the declaration deleted, so a variable is used before it is declared, then inserted back
+        ("int k = 4;\n", ""),
+        ("int i;\n", "int i;\nint k = 5;\n"),
+        # an unbalanced brace, then closed
+        ("if (sum > 2) {", "if (sum > 2) {\n{"),
+        ("print(to_string(sum) + \"\\n\");\n}", "print(to_string(sum) + \"\\n\");\n}\n}"),
+        # a string assigned to an int, then fixed
+        ("int sum = 0;", "int sum = \"0\";"),
+        ("int sum = \"0\";", "int sum = 0;"),
+        # a division by zero, which the semantic analyzer finds, then fixed
+        ("sum = sum + i * k;", "sum = sum + i * k / 0;"),
+        ("sum = sum + i * k / 0;", "sum = sum + i * k / 2;"),
+        # a declaration deleted that nothing uses
+        ("string s = \"a\";\nprint(s + \"\\n\");\n", ""),
+        # a symbol the lexer does not know, then removed
+        ("int n = 3;", "int n = 3 $;"),
+        ("int n = 3 $;", "int n = 3;"),
+    )
+
+    # the lines the random edits insert
+    LINES = (
+        "int k = 1;",
+        "sum = sum + k;",
+        "{",
+        "}",
+        "sum = sum / 0;",
+        "print(s);",
+        "string s = \"b\";",
+    )
+    RANDOM_EDITS = 200
+
+    def setUp(self):
+        self._dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self._dir.cleanup)
+        self._path = os.path.join(self._dir.name, "program.cpm")
+
+    def _compile(self, text: str) -> str:
+        """What a compilation of the text from scratch prints: the tree, or the error, or both."""
+        with open(self._path, "w") as f:
+            f.write(text)
+
+        compiler = Compiler(self._path)
+        with contextlib.redirect_stdout(io.StringIO()) as out:
+            try:
+                compiler.do_lexical_analysis()
+                compiler.do_syntax_analysis()
+                compiler.do_semantic_analysis()
+            except SystemExit:
+                # the error is printed
+                pass
+        return out.getvalue()
+
+    @staticmethod
+    def _recompile(incremental: IncrementalCompiler, text: str) -> str:
+        """What the incremental compiler prints for the text, with the tree printed like a compilation does."""
+        with contextlib.redirect_stdout(io.StringIO()) as errors:
+            incremental.recompile(text)
+        errors = errors.getvalue()
+        if errors.startswith("LEXER ERROR") or errors.startswith("PARSER ERROR"):
+            # the tree is not made, and the compiler keeps the last one
+            return errors
+
+        with contextlib.redirect_stdout(io.StringIO()) as out:
+            print("\nSYNTAX TREE")
+            print_tree(incremental.get_syntax_tree())
+        return out.getvalue() + errors
+
+    def test_edits_like_compilation(self):
+        incremental = IncrementalCompiler(self._path)
+        text = IncrementalCompilerTest.PROGRAM
+        self.assertEqual(IncrementalCompilerTest._recompile(incremental, text), self._compile(text))
+
+        for k, (old, new) in enumerate(IncrementalCompilerTest.EDITS):
+            self.assertIn(old, text)
+            text = text.replace(old, new, 1)
+            with self.subTest(edit=k):
+                self.assertEqual(IncrementalCompilerTest._recompile(incremental, text), self._compile(text))
+
+    def test_random_edits_like_compilation(self):
+        # lines deleted, copied and inserted anywhere. An edit that makes an error is often undone by the next
+        # one, which goes back to the last program without errors
+        generator = random.Random(8)
+        incremental = IncrementalCompiler(self._path)
+        lines = good_lines = IncrementalCompilerTest.PROGRAM.splitlines()
+        has_error = False
+
+        for k in range(IncrementalCompilerTest.RANDOM_EDITS):
+            edit = generator.randrange(4)
+            lines = list(lines)
+            if has_error and edit < 2:
+                lines = good_lines
+            elif edit == 0 and len(lines) > 1:
+                del lines[generator.randrange(len(lines))]
+            elif edit == 1:
+                lines.insert(generator.randrange(len(lines) + 1), generator.choice(lines))
+            else:
+                lines.insert(generator.randrange(len(lines) + 1), generator.choice(IncrementalCompilerTest.LINES))
+
+            text = "\n".join(lines) + "\n"
+            expected = self._compile(text)
+            with self.subTest(edit=k):
+                self.assertEqual(IncrementalCompilerTest._recompile(incremental, text), expected)
+
+            has_error = "ERROR" in expected
+            if not has_error:
+                good_lines = lines
+
+    def test_edits_reuse_statements(self):
+        incremental = IncrementalCompiler(self._path)
+        text = IncrementalCompilerTest.PROGRAM
+        with contextlib.redirect_stdout(io.StringIO()):
+            incremental.recompile(text)
+            incremental.recompile(text.replace("print(s + \"\\n\");", "print(s + s);"))
+
+        self.assertEqual(incremental.stats["reparsed_statements"], 1)
+        self.assertLess(incremental.stats["relexed_tokens"], incremental.stats["tokens"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,299 @@
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "compiler"))
+
+from compiler import Compiler
+from node_kind import NodeKind
+from program_output import ProgramOutput
+
+
+class OptimizerTest(unittest.TestCase):
+    """The programs print the same with and without the optimizer, in every engine."""
+
+    def setUp(self):
+        self._dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self._dir.cleanup)
+
+    def _compile(self, source: str, engine: str, optimize: bool) -> Compiler:
+        path = os.path.join(self._dir.name, "program.cpm")
+        with open(path, "w") as f:
+            f.write(source)
+
+        compiler = Compiler(path, engine=engine, output=ProgramOutput.in_memory())
+        with contextlib.redirect_stdout(io.StringIO()):
+            compiler.do_lexical_analysis()
+            compiler.do_syntax_analysis()
+            compiler.do_semantic_analysis()
+            if optimize:
+                compiler.do_optimization()
+        return compiler
+
+    @staticmethod
+    def _run(compiler: Compiler, stdin: str) -> str:
+        stdin_before = sys.stdin
+        sys.stdin = io.TextIOWrapper(io.BytesIO(stdin.encode()))
+        try:
+            compiler.run_program()
+        except SystemExit:
+            # a runtime error, which is in the output
+            pass
+        finally:
+            sys.stdin = stdin_before
+        return compiler._output.getvalue()
+
+    def _check(self, source: str, stdin: str = "", new_variables: bool = True):
+        """Checks that the optimized program prints what the program does, and if new_variables, that the
+        optimizer moved or reduced something into its own variables."""
+        expected = OptimizerTest._run(self._compile(source, "tree", False), stdin)
+        for engine in Compiler.ENGINES:
+            with self.subTest(engine=engine):
+                compiler = self._compile(source, engine, True)
+                added = [variable for variable in compiler._identifiers_table if variable.name.startswith("@")]
+                self.assertEqual(bool(added), new_variables)
+                self.assertEqual(OptimizerTest._run(compiler, stdin), expected)
+
+    @staticmethod
+    def _kinds(compiler: Compiler) -> set:
+        """The kinds of the nodes in the tree of the program."""
+        ret = set()
+        stack = [compiler._syntax_tree]
+        while stack:
+            node = stack.pop()
+            if node is not None:
+                ret.add(node.kind)
+                stack.extend(node.children)
+        return ret
+
+    # loop-invariant code motion
+
+    def test_invariant_expressions(self):
+        self._check("""
+int n = 6;
+int m = 7;
+int k = 42;
+int a[3][2];
+a[1][0] = 5;
+int i;
+int sum = 0;
+string s = "";
+for (i = 0; i < 3; i = i + 1) {
+    sum = sum + n * m + a[1][0];
+    s = s + to_string(k);
+}
+print(to_string(sum) + " " + s + "\\n");
+""")
+
+    def test_expression_changed_in_loop(self):
+        self._check("""
+int n = 1;
+int i;
+int sum = 0;
+while (n < 100) {
+    sum = sum + n * 3;
+    n = n * 2;
+}
+for (i = 0; i < 4; i = i + 1) {
+    sum = sum + i * n;
+}
+print(to_string(sum) + "\\n");
+""", new_variables=False)
+
+    def test_failing_expression_in_loop_that_does_not_run(self):
+        self._check("""
+int zero = 0;
+int x = 1;
+int i;
+for (i = 0; i < 0; i = i + 1) {
+    x = x + 10 / zero;
+}
+print(to_string(x) + "\\n");
+""", new_variables=False)
+
+    def test_scan_is_not_moved(self):
+        self._check("""
+int i;
+string s = "";
+for (i = 0; i < 3; i = i + 1) {
+    s = s + scan() + ",";
+}
+print(s + "\\n");
+""", stdin="a\nb\nc\n", new_variables=False)
+
+    def test_declaration_skipped_by_switch(self):
+        # the switch jumps over the declaration of m, which has no value, and the loops do not run
+        self._check("""
+int x = 0, i, k;
+switch (x) {
+    case 1:
+        int m = 5;
+    case 0:
+        for (i = 0; i < 0; i = i + 1) {
+            k = m * 3;
+        }
+        i = 0;
+        while (i < 0) {
+            k = m * 4;
+            i = i + 1;
+        }
+        print("b\\n");
+}
+""", new_variables=False)
+
+    def test_declaration_after_case_in_switch(self):
+        self._check("""
+int x = 0, i, k = 0;
+switch (x) {
+    case 0:
+        int m = 5;
+        for (i = 0; i < 3; i = i + 1) {
+            k = k + m * 3;
+        }
+        print(to_string(k) + "\\n");
+}
+""")
+
+    # strength reduction
+
+    def test_int_induction_products(self):
+        self._check("""
+int i;
+for (i = 1; i < 20; i = i + 3) {
+    print(to_string(i * 5) + " " + to_string(i * 5 + 1) + " " + to_string(5 * i - 1) + "\\n");
+}
+for (i = 10; i > 0; i = i - 2) {
+    print(to_string(i * 3) + to_string(i * 3) + to_string(i * 3) + "\\n");
+    if (i < 5) {
+        break;
+    }
+}
+print(to_string(i) + "\\n");
+""")
+
+    def test_double_induction_products(self):
+        # repeated additions of a double are rounded differently from the products
+        self._check("""
+int i;
+for (i = 0.1; i < 4; i = i + 1) {
+    print(to_string(i * 3) + " " + to_string(i * 3 + 1) + " " + to_string(i * 3 - 1) + "\\n");
+}
+double d = 0.2;
+for (i = d; i < 3; i = i + 1) {
+    print(to_string(i * 3) + " " + to_string(i * 3 + 1) + " " + to_string(i * 3 - 1) + "\\n");
+}
+i = 0.3;
+for (; i < 3; i = i + 1) {
+    print(to_string(i * 3) + " " + to_string(i * 3 + 1) + " " + to_string(i * 3 - 1) + "\\n");
+}
+int j = 0.1;
+for (i = j; i < 3; i = i + 1) {
+    print(to_string(i * 3) + " " + to_string(i * 3 + 1) + " " + to_string(i * 3 - 1) + "\\n");
+}
+""", new_variables=False)
+
+    # bounds checks
+
+    def _check_bounds(self, source: str, proven: bool):
+        """Checks the program like _check, and that its indexations are proven to be in the bounds or not."""
+        self._check(source, new_variables=False)
+        kinds = OptimizerTest._kinds(self._compile(source, "tree", True))
+        self.assertEqual(NodeKind.INDEXATION_IN_BOUNDS in kinds, proven)
+        self.assertEqual(NodeKind.INDEXATION in kinds, not proven)
+
+    def test_indexes_in_bounds(self):
+        self._check_bounds("""
+int a[3];
+int i;
+for (i = 0; i < 3; i = i + 1) {
+    a[i] = i * i;
+}
+for (i = 2; i >= 0; i = i - 1) {
+    print(to_string(a[i]) + "\\n");
+}
+""", proven=True)
+
+    def test_read_past_the_end(self):
+        self._check_bounds("""
+int a[3];
+int i, x = 0;
+for (i = 0; i < 4; i = i + 1) {
+    x = x + a[i];
+}
+print(to_string(x) + "\\n");
+""", proven=False)
+
+    def test_write_past_the_end(self):
+        self._check_bounds("""
+int a[3];
+int i;
+for (i = 0; i < 4; i = i + 1) {
+    a[i] = i;
+}
+print(to_string(i) + "\\n");
+""", proven=False)
+
+    def test_negative_start(self):
+        self._check_bounds("""
+int a[3];
+int i;
+for (i = -1; i < 3; i = i + 1) {
+    a[i] = i;
+}
+print(to_string(i) + "\\n");
+""", proven=False)
+
+    def test_index_changed_in_body(self):
+        self._check_bounds("""
+int a[3];
+int i;
+for (i = 0; i < 3; i = i + 1) {
+    a[i] = i;
+    i = i + 2;
+    a[i] = i;
+}
+print(to_string(a[i - 1]) + "\\n");
+""", proven=False)
+
+    # dead code removal
+
+    def test_constant_conditions(self):
+        source = """
+int x = 1;
+if (1 < 2 && true) {
+    x = x + 1;
+} else {
+    x = x + 100;
+}
+while (false) {
+    x = x + 1000;
+}
+int i;
+for (i = 0; false; i = i + 1) {
+    x = x + 10000;
+}
+if (false || 2 > 3) {
+    print("dead\\n");
+}
+print(to_string(x) + " " + to_string(i) + "\\n");
+"""
+        self._check(source, new_variables=False)
+
+        kinds = OptimizerTest._kinds(self._compile(source, "tree", True))
+        for kind in (NodeKind.KW_IF, NodeKind.KW_WHILE, NodeKind.KW_FOR):
+            self.assertNotIn(kind, kinds)
+
+    def test_failing_constant_expression_is_kept(self):
+        self._check("""
+print(to_string(2 * 3 + 1) + "\\n");
+if (true) {
+    print(to_string(atoi("x")) + "\\n");
+}
+""", new_variables=False)
+
+
+if __name__ == "__main__":
+    unittest.main()
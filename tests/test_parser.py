@@ -0,0 +1,144 @@
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "compiler"))
+
+from lexer import Lexer
+from parser import Parser, print_tree
+from symbol_table import SymbolTable
+
+
+class CountingParser(Parser):
+    """Counts the steps to the next token, which a parser that backtracks takes again for the same tokens."""
+
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.steps = 0
+
+    def _go_to_next_tok(self):
+        self.steps += 1
+        super()._go_to_next_tok()
+
+
+class FallbackParser(Parser):
+    """Parses the expressions only with the alternatives the typed parser falls back to when it fails."""
+
+    def _parse_typed_expression(self):
+        raise Parser.Expected("expression", 0, 0)
+
+
+class ExpressionParserTest(unittest.TestCase):
+    DEPTHS = (10, 20, 40)
+
+    # how much the steps may grow when the nesting doubles. The nesting is most of the tokens, so a parser that
+    # takes every token once takes about twice the steps
+    MAX_GROWTH = 2.5
+
+    def setUp(self):
+        self._dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self._dir.cleanup)
+
+    def _parse(self, source: str, parser_class) -> (str, Parser):
+        """The printed tree of the program, or its parser error, and the parser."""
+        path = os.path.join(self._dir.name, "program.cpm")
+        with open(path, "w") as f:
+            f.write(source)
+
+        identifiers, keywords, operators, constants = SymbolTable(), SymbolTable(), SymbolTable(), SymbolTable()
+        tokens = Lexer(path, identifiers, keywords, operators, constants).split_program_into_tokens()
+        parser = parser_class(tokens, operators, identifiers, keywords, constants)
+
+        with contextlib.redirect_stdout(io.StringIO()) as out:
+            try:
+                parser.create_syntax_tree()
+                print_tree(parser.get_syntax_tree())
+            except SystemExit:
+                # the error is printed
+                pass
+        return out.getvalue(), parser
+
+    @staticmethod
+    def _nested_to_string(depth: int) -> str:
+        return "int i = 1;\nstring s = \"1\";\nbool r = " + "to_string(" * depth + "i" + ")" * depth + " == s;\n"
+
+    @staticmethod
+    def _nested_comparisons(depth: int) -> str:
+        chain = " && ".join(f"(i < {k}" for k in range(depth)) + ")" * depth
+        return "int i = 1;\nbool r = " + "(" * depth + "i < 3" + ")" * depth + " || " + chain + ";\n"
+
+    def _check_linear(self, program):
+        steps = []
+        for depth in ExpressionParserTest.DEPTHS:
+            output, parser = self._parse(program(depth), CountingParser)
+            self.assertNotIn("ERROR", output)
+            steps.append(parser.steps)
+
+        for fewer, more in zip(steps, steps[1:]):
+            self.assertLessEqual(more, ExpressionParserTest.MAX_GROWTH * fewer, steps)
+
+    def test_nested_to_string_is_linear(self):
+        self._check_linear(ExpressionParserTest._nested_to_string)
+
+    def test_nested_comparisons_are_linear(self):
+        self._check_linear(ExpressionParserTest._nested_comparisons)
+
+    def _check_like_fallback(self, source: str):
+        expected, _ = self._parse(source, FallbackParser)
+        self.assertEqual(self._parse(source, Parser)[0], expected)
+
+    def test_trees_like_fallback(self):
+        for depth in ExpressionParserTest.DEPTHS:
+            with self.subTest(depth=depth):
+                self._check_like_fallback(ExpressionParserTest._nested_to_string(depth))
+                self._check_like_fallback(ExpressionParserTest._nested_comparisons(depth))
+
+    @staticmethod
+    def _errors(source: str) -> tuple:
+        """Wrong programs made from the program. A statement follows the error, so the error is not at the end of
+        the file."""
+        return (
+            # the semicolon after the expression missing
+            source[:-len(";\n")] + "\nint z = 1;\n",
+            # a string compared with a number
+            source.replace("bool r = ", "bool r = 1 < \"a\" || "),
+        )
+
+    @staticmethod
+    def _inner_errors(source: str) -> tuple:
+        """Wrong programs made from the program, with the error in the innermost brackets."""
+        return (
+            # an operand missing
+            source.replace("(i)", "()").replace("(i < 3)", "(i < )"),
+            # an operator in the place of an operand
+            source.replace("(i)", "(*)").replace("(i < 3)", "(* < 3)"),
+        )
+
+    def _check_errors_like_fallback(self, program, depths: tuple, errors):
+        for depth in depths:
+            for i, error in enumerate(errors(program(depth))):
+                with self.subTest(program=program.__name__, depth=depth, error=i):
+                    output, _ = self._parse(error, Parser)
+                    self.assertIn("PARSER ERROR", output)
+                    self._check_like_fallback(error)
+
+    def test_errors_like_fallback(self):
+        self._check_errors_like_fallback(ExpressionParserTest._nested_to_string, ExpressionParserTest.DEPTHS,
+                                         ExpressionParserTest._errors)
+        self._check_errors_like_fallback(ExpressionParserTest._nested_comparisons, ExpressionParserTest.DEPTHS,
+                                         ExpressionParserTest._errors)
+        self._check_errors_like_fallback(ExpressionParserTest._nested_comparisons, ExpressionParserTest.DEPTHS,
+                                         ExpressionParserTest._inner_errors)
+
+    def test_errors_inside_to_string_like_fallback(self):
+        # the message has the errors of every alternative of every to_string around the error, so it doubles
+        # with every level
+        self._check_errors_like_fallback(ExpressionParserTest._nested_to_string, (2, 4, 6),
+                                         ExpressionParserTest._inner_errors)
+
+
+if __name__ == "__main__":
+    unittest.main()